@@ -2,4 +2,5 @@
 POLICY_API_BASE_URL = "http://localhost:8000"  # Your Policy Summarizer API
 CHUNK_SIZE = 2000
 CHUNK_OVERLAP = 200
+POLICY_API_TIMEOUT = 120.0  # Seconds; also sent downstream so generation stops when we give up
 MAX_TOKENS = 2048
\ No newline at end of file
@@ -13,7 +13,7 @@ from langchain.docstore.document import Document
 
 # Import models and config from our other files
 from .models import PremiumCalculation
-from .config import POLICY_API_BASE_URL, CHUNK_SIZE, CHUNK_OVERLAP
+from .config import POLICY_API_BASE_URL, POLICY_API_TIMEOUT, CHUNK_SIZE, CHUNK_OVERLAP
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -205,6 +205,9 @@ def calculate_premium(policy_details: Dict[str, Any]) -> PremiumCalculation:
 
 # ==================== API Call Functions ====================
 
+# Lets the Policy API stop generating once we would time out anyway
+TIMEOUT_HEADERS = {"X-Request-Timeout": str(POLICY_API_TIMEOUT)}
+
 async def call_policy_api_json(endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     """
     Call the Policy Summarizer API and expect a JSON response.
@@ -213,8 +216,8 @@ async def call_policy_api_json(endpoint: str, payload: Dict[str, Any]) -> Dict[s
     url = f"{POLICY_API_BASE_URL}{endpoint}"
     
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(url, json=payload)
+        async with httpx.AsyncClient(timeout=POLICY_API_TIMEOUT) as client:
+            response = await client.post(url, json=payload, headers=TIMEOUT_HEADERS)
             
             if response.status_code == 404:
                 raise HTTPException(status_code=404, detail="Conversation not found or expired")
@@ -243,8 +246,8 @@ async def call_policy_api_stream(endpoint: str, payload: Dict[str, Any]) -> Asyn
     url = f"{POLICY_API_BASE_URL}{endpoint}"
     
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            async with client.stream('POST', url, json=payload) as response:
+        async with httpx.AsyncClient(timeout=POLICY_API_TIMEOUT) as client:
+            async with client.stream('POST', url, json=payload, headers=TIMEOUT_HEADERS) as response:
                 if response.status_code != 200:
                     error_text = await response.aread()
                     error_detail = error_text.decode()
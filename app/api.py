@@ -1,10 +1,13 @@
 from fastapi import APIRouter
 
-from app.endpoints import chat, batch, admin
+from app.endpoints import chat, batch, summarize, jobs, admin, metrics
 
 api_router = APIRouter()
 
 # Include all endpoint routers
 api_router.include_router(chat.router)
 api_router.include_router(batch.router)
-api_router.include_router(admin.router)
\ No newline at end of file
+api_router.include_router(summarize.router)
+api_router.include_router(jobs.router)
+api_router.include_router(admin.router)
+api_router.include_router(metrics.router)
\ No newline at end of file
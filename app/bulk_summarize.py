@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Set, Tuple, Any
+
+from app.core.config import settings
+from app.services.model_service import model_manager
+from app.services.summary_service import policy_summarizer
+from app.services.text_extraction import extract_text, SUPPORTED_EXTENSIONS
+
+def find_documents(root: str, recursive: bool) -> List[str]:
+    """Supported files under root, relative to it, in a stable order"""
+    found = []
+    for directory, subdirs, files in os.walk(root):
+        if not recursive:
+            subdirs.clear()
+        subdirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(directory, name), root))
+    return found
+
+class Checkpoint:
+    """
+    Append-only log of finished documents next to the output file. Each
+    entry records the output size after the document's line was written,
+    so a resumed run first cuts off anything a killed run left half-written.
+    """
+
+    def __init__(self, path: str, output_path: str):
+        self.path = path
+        self.output_path = output_path
+
+    def load(self) -> Tuple[Set[str], int]:
+        """(documents summarized successfully, output size to resume from)"""
+        done, offset = set(), 0
+        self.valid_bytes = 0
+        if not os.path.exists(self.path):
+            return done, offset
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Torn final line from a kill mid-write
+                self.valid_bytes += len(line)
+                offset = entry['offset']
+                if entry['ok']:
+                    done.add(entry['path'])
+        return done, offset
+
+    def open(self, offset: int):
+        """Drop whatever follows the last complete entry, then append"""
+        for path, size in ((self.output_path, offset), (self.path, self.valid_bytes)):
+            if os.path.exists(path):
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+        self.output = open(self.output_path, "ab")
+        self.log = open(self.path, "a", encoding="utf-8")
+
+    def record(self, path: str, record: Dict[str, Any]):
+        self.output.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        self.log.write(json.dumps({'path': path, 'ok': 'error' not in record, 'offset': self.output.tell()}) + "\n")
+        self.log.flush()
+
+    def close(self):
+        self.output.close()
+        self.log.close()
+
+class BulkSummarizer:
+    """
+    Summarizes a directory of policies through the same map-reduce
+    summarizer and caches as /summarize. Text extraction runs in a process
+    pool a few documents ahead of inference, and enough documents are in
+    flight to keep every replica's batch engine full.
+    """
+
+    def __init__(self, root: str, checkpoint: Checkpoint, workers: int, concurrency: int,
+                 temperature: float, max_tokens: int, use_cache: bool):
+        self.root = root
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.concurrency = concurrency
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.use_cache = use_cache
+        self.succeeded = 0
+        self.failed = 0
+
+    async def _summarize(self, path: str, pool: ProcessPoolExecutor,
+                         ahead: asyncio.Semaphore, inflight: asyncio.Semaphore):
+        loop = asyncio.get_running_loop()
+        record: Dict[str, Any] = {'path': path}
+        # Bounds the extracted texts held in memory: those being summarized plus a few ready to go
+        async with ahead:
+            start = time.time()
+            try:
+                text = await loop.run_in_executor(pool, extract_text, os.path.join(self.root, path))
+                if not text:
+                    raise ValueError("No text could be extracted")
+                record['sha256'] = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                record['chars'] = len(text)
+
+                async with inflight:
+                    events = policy_summarizer.summarize(text, self.temperature, self.max_tokens,
+                                                         use_cache=self.use_cache, client="bulk")
+                    try:
+                        async for event in events:
+                            if event['event'] == 'summary':
+                                final = event
+                    finally:
+                        await events.aclose()
+
+                record.update({key: final[key] for key in
+                               ('summary', 'sections_total', 'sections_cached', 'reduce_passes', 'cached')})
+            except Exception as e:
+                record['error'] = f"{type(e).__name__}: {e}"
+
+        record['processing_time_ms'] = round((time.time() - start) * 1000, 2)
+        self.checkpoint.record(path, record)
+        if 'error' in record:
+            self.failed += 1
+            print(f"❌ {path}: {record['error']}")
+        else:
+            self.succeeded += 1
+            print(f"✅ {path} ({record['sections_total']} sections, {record['processing_time_ms'] / 1000:.1f}s)")
+
+    async def run(self, paths: List[str]):
+        ahead = asyncio.Semaphore(self.concurrency + self.workers)
+        inflight = asyncio.Semaphore(self.concurrency)
+        # Spawned, not forked: the parent already runs replica threads
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            await asyncio.gather(*(self._summarize(path, pool, ahead, inflight) for path in paths))
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    default_concurrency = settings.N_REPLICAS * max(1, settings.BATCH_MAX_SEQUENCES)
+    parser = argparse.ArgumentParser(description="Summarize every PDF, DOCX and TXT policy in a directory")
+    parser.add_argument("input_dir", help="Directory of policy documents")
+    parser.add_argument("-o", "--output", default="summaries.jsonl", help="JSONL file, one line per document")
+    parser.add_argument("--checkpoint", help="Resume log (default: <output>.checkpoint)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Include subdirectories")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Text extraction processes")
+    parser.add_argument("--concurrency", type=int, default=default_concurrency,
+                        help=f"Documents summarized at once (default: replicas x batch sequences = {default_concurrency})")
+    parser.add_argument("--temperature", type=float, default=0.3)
+    parser.add_argument("--max-tokens", type=int, default=512, help="Length of each final summary")
+    parser.add_argument("--no-cache", action="store_true", help="Do not reuse cached section summaries")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    return parser.parse_args(argv)
+
+def main(argv: List[str] = None):
+    """Summarize a directory of policies to JSONL, resuming a killed run"""
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    checkpoint = Checkpoint(args.checkpoint or args.output + ".checkpoint", args.output)
+    if args.restart:
+        for path in (checkpoint.path, checkpoint.output_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    done, offset = checkpoint.load()
+    paths = [path for path in find_documents(args.input_dir, args.recursive) if path not in done]
+    print(f"📂 {len(paths)} document(s) to summarize, {len(done)} already done")
+    if not paths:
+        return
+
+    model_manager.load_model()
+    if not model_manager.is_loaded:
+        sys.exit(1)
+
+    bulk = BulkSummarizer(args.input_dir, checkpoint, max(1, args.workers), max(1, args.concurrency),
+                          args.temperature, args.max_tokens, not args.no_cache)
+    start = time.time()
+    checkpoint.open(offset)
+    try:
+        asyncio.run(bulk.run(paths))
+    except KeyboardInterrupt:
+        print("⏸️ Interrupted; run again to resume")
+    finally:
+        checkpoint.close()
+        model_manager.shutdown()
+
+    elapsed = time.time() - start
+    print(f"🏁 {bulk.succeeded} summarized, {bulk.failed} failed in {elapsed:.1f}s "
+          f"({bulk.succeeded / elapsed * 60:.1f} documents/min) -> {args.output}")
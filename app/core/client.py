@@ -0,0 +1,13 @@
+from fastapi import Request
+
+API_KEY_HEADER = "X-API-Key"
+
+def request_client(request: Request) -> str:
+    """
+    Who a request is scheduled on behalf of: the API key when one is sent,
+    otherwise the client IP (as the rate limiter uses).
+    """
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key:
+        return f"key:{api_key}"
+    return request.client.host if request.client else "unknown"
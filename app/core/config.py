@@ -1,6 +1,11 @@
 import os
+import math
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
+# Size assumed per entry when a deprecated entry-count cache setting is converted to MB
+LEGACY_CACHE_ENTRY_KB = 8
+
 class Settings(BaseSettings):
     """Centralized configuration management"""
     
@@ -8,29 +13,124 @@ class Settings(BaseSettings):
     MODEL_PATH: str = os.getenv("MODEL_PATH", r"C:\Users\jadit\Desktop\Me\LLMModels\GGUF_Models\mistral-7b-policy-summarizer-merged-Q4_K_M.gguf")
     N_CTX: int = int(os.getenv("N_CTX", "4096"))
     N_GPU_LAYERS: int = int(os.getenv("N_GPU_LAYERS", "0"))
-    N_THREADS: int = int(os.getenv("N_THREADS", "8"))
+    N_THREADS: int = int(os.getenv("N_THREADS", "8"))  # Total CPU thread budget across replicas
+    N_REPLICAS: int = int(os.getenv("N_REPLICAS", "1"))
+    N_THREADS_PER_REPLICA: int = int(os.getenv("N_THREADS_PER_REPLICA", "0"))  # 0 = split N_THREADS evenly
+    USE_MMAP: bool = os.getenv("USE_MMAP", "true").lower() == "true"  # Replicas share GGUF weights via the page cache
+    # Concurrent sequences per replica, 1 = no batching. The batch context holds N_CTX tokens of KV
+    # cache per sequence (about 512 MB for Mistral 7B at 4096 with an f16 cache), so each extra
+    # sequence costs that much per replica on top of KV_SNAPSHOT_MAX_MB and PREFIX_CACHE_MAX_MB
+    BATCH_MAX_SEQUENCES: int = int(os.getenv("BATCH_MAX_SEQUENCES", "1"))
+    N_BATCH: int = int(os.getenv("N_BATCH", "512"))  # Max tokens per llama_decode call
     TEMPERATURE: float = float(os.getenv("TEMPERATURE", "0.7"))
     MAX_TOKENS: int = int(os.getenv("MAX_TOKENS", "2048"))
     TOP_P: float = float(os.getenv("TOP_P", "0.95"))
+    SPECULATIVE_QUERY_TYPES: str = os.getenv("SPECULATIVE_QUERY_TYPES", "detail,coverage,financial")  # Comma-separated, empty = off
+    SPECULATIVE_DRAFT_TOKENS: int = int(os.getenv("SPECULATIVE_DRAFT_TOKENS", "8"))  # Max tokens drafted per step
+    SPECULATIVE_NGRAM_SIZE: int = int(os.getenv("SPECULATIVE_NGRAM_SIZE", "3"))  # Longest n-gram looked up in the prompt
+
+    # Retrieval: policies that do not fit the context are cut to the sections
+    # most similar to the question, using the model's embedding mode
+    RETRIEVAL_ENABLED: bool = os.getenv("RETRIEVAL_ENABLED", "true").lower() == "true"
+    RETRIEVAL_TOP_K: int = int(os.getenv("RETRIEVAL_TOP_K", "0"))  # Max sections per prompt, 0 = as many as fit
+    RETRIEVAL_BATCH_SIZE: int = int(os.getenv("RETRIEVAL_BATCH_SIZE", "16"))  # Sections per embedding job
+    RETRIEVAL_CACHE_MAX_MB: int = int(os.getenv("RETRIEVAL_CACHE_MAX_MB", "256"))  # Memory cap for per-document vectors
+
+    # Map-reduce summarization (/summarize)
+    SUMMARY_CHUNK_TOKENS: int = int(os.getenv("SUMMARY_CHUNK_TOKENS", "2000"))  # Policy tokens per map prompt
+    SUMMARY_SECTION_MAX_TOKENS: int = int(os.getenv("SUMMARY_SECTION_MAX_TOKENS", "256"))  # Length of each partial summary
+    SUMMARY_CACHE_MAX_MB: int = int(os.getenv("SUMMARY_CACHE_MAX_MB", "16"))  # Memory cap for cached chunk and document summaries
+    SUMMARY_CACHE_MAX_SIZE: int = int(os.getenv("SUMMARY_CACHE_MAX_SIZE", "0"))  # Deprecated entry count, used when SUMMARY_CACHE_MAX_MB is unset
+
+    # Inference Backend: "llama" runs the GGUF at MODEL_PATH, "stub" emits deterministic
+    # tokens with the latencies below (no model file needed, for benchmarks and CI)
+    INFERENCE_BACKEND: str = os.getenv("INFERENCE_BACKEND", "llama").lower()
+    STUB_PROMPT_MS_PER_TOKEN: float = float(os.getenv("STUB_PROMPT_MS_PER_TOKEN", "0.5"))  # Prompt-eval cost per new token
+    STUB_TOKEN_MS: float = float(os.getenv("STUB_TOKEN_MS", "25"))  # Cost of each generated token (one decode step)
+    STUB_COMPLETION_TOKENS: int = int(os.getenv("STUB_COMPLETION_TOKENS", "128"))  # Answer length before max_tokens applies
+
+    # Inference Mode: "local" loads the model in-process, "remote" talks to run_model_server.py
+    INFERENCE_MODE: str = os.getenv("INFERENCE_MODE", "local").lower()
+    MODEL_SERVER_SOCKET: str = os.getenv("MODEL_SERVER_SOCKET", "/tmp/policy-model-server.sock")
+    MODEL_SERVER_CONNECT_TIMEOUT: int = int(os.getenv("MODEL_SERVER_CONNECT_TIMEOUT", "120"))
+    
+    # Scheduling: interactive chat > batch > background; within a class, earliest
+    # deadline first and weighted fair sharing between clients (API key or IP)
+    SCHEDULER_URGENT_SECONDS: float = float(os.getenv("SCHEDULER_URGENT_SECONDS", "5"))  # Deadlines this close jump the fair-share order
+    SCHEDULER_CLIENT_WEIGHTS: str = os.getenv("SCHEDULER_CLIENT_WEIGHTS", "")  # e.g. "key:partner:4,10.0.0.7:2", default weight 1
     
-    # Cache Configuration
+    # Batch Queries (/batch-query): duplicates are answered once, misses run concurrently
+    BATCH_MAX_QUERIES: int = int(os.getenv("BATCH_MAX_QUERIES", "100"))  # Max queries per request
+    BATCH_STREAM_MAX_QUERIES: int = int(os.getenv("BATCH_STREAM_MAX_QUERIES", "2000"))  # Max queries per /batch-query/stream request
+    BATCH_STREAM_CONCURRENCY: int = int(os.getenv("BATCH_STREAM_CONCURRENCY", "16"))  # Queries in flight per streamed batch
+    
+    # Precompute: when a conversation starts on a document not seen before, these questions
+    # are answered at background priority (idle replicas only) and cached for the clicks to come
+    PRECOMPUTE_ENABLED: bool = os.getenv("PRECOMPUTE_ENABLED", "true").lower() == "true"
+    PRECOMPUTE_QUESTIONS: str = os.getenv(
+        "PRECOMPUTE_QUESTIONS", "What is the sum insured?|What are the exclusions?|What is the premium amount?"
+    )  # '|'-separated, matching the UI's suggested questions; empty = off
+    PRECOMPUTE_QUEUE_SIZE: int = int(os.getenv("PRECOMPUTE_QUEUE_SIZE", "32"))  # Documents waiting; more are skipped
+    
+    # Async Jobs (/jobs): persisted in SQLite and resumed after a restart
+    JOBS_DB_PATH: str = os.getenv("JOBS_DB_PATH", "jobs.db")
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))  # Jobs run at once per API process
+    JOB_LEASE_SECONDS: float = float(os.getenv("JOB_LEASE_SECONDS", "30"))  # A running job with no heartbeat this long is taken over
+    JOB_POLL_SECONDS: float = float(os.getenv("JOB_POLL_SECONDS", "2"))  # How often idle workers look for jobs queued by other processes
+    
+    # Cache Configuration: "sqlite" is shared by all workers and kept across restarts,
+    # "redis" is shared across hosts, "memory" is per process
     CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
-    CACHE_MAX_SIZE: int = int(os.getenv("CACHE_MAX_SIZE", "100"))
-    CACHE_TTL_HOURS: int = int(os.getenv("CACHE_TTL_HOURS", "24"))
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "sqlite").lower()
+    CACHE_DB_PATH: str = os.getenv("CACHE_DB_PATH", "cache.db")
+    CACHE_REDIS_URL: str = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")  # Needs the redis package
+    CACHE_MAX_MB: int = int(os.getenv("CACHE_MAX_MB", "64"))  # Memory cap for cached answers
+    CACHE_MAX_SIZE: int = int(os.getenv("CACHE_MAX_SIZE", "0"))  # Deprecated entry count, used when CACHE_MAX_MB is unset
+    CACHE_TTL_HOURS: float = float(os.getenv("CACHE_TTL_HOURS", "24"))
+    # Semantic tier: a paraphrase of a question already answered about the same document
+    # (same query type and params) reuses that answer
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))  # Character trigram cosine, 1 = same words
+    SEMANTIC_CACHE_MAX_MB: int = int(os.getenv("SEMANTIC_CACHE_MAX_MB", "8"))  # Memory cap for the remembered questions
 
     # Chat History Configuration (New)
     CHAT_HISTORY_MAX_SIZE: int = int(os.getenv("CHAT_HISTORY_MAX_SIZE", "50"))
     CHAT_HISTORY_TTL_HOURS: int = int(os.getenv("CHAT_HISTORY_TTL_HOURS", "2"))
+    CHAT_HISTORY_MAX_MB: int = int(os.getenv("CHAT_HISTORY_MAX_MB", "64"))  # Cap for conversations in the shared store (API_WORKERS > 1)
+    KV_SNAPSHOT_ENABLED: bool = os.getenv("KV_SNAPSHOT_ENABLED", "true").lower() == "true"
+    KV_SNAPSHOT_MAX_MB: int = int(os.getenv("KV_SNAPSHOT_MAX_MB", "2048"))  # Memory cap for per-conversation llama.cpp states
+    PREFIX_CACHE_ENABLED: bool = os.getenv("PREFIX_CACHE_ENABLED", "true").lower() == "true"
+    PREFIX_CACHE_MAX_MB: int = int(os.getenv("PREFIX_CACHE_MAX_MB", "1024"))  # Memory cap for shared policy-prefix states
     
     # Rate Limiting
     RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
     RATE_LIMIT_REQUESTS: int = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))
     RATE_LIMIT_WINDOW: int = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
+
+    # Request Deadlines
+    REQUEST_TIMEOUT: float = float(os.getenv("REQUEST_TIMEOUT", "120"))  # Used when no X-Request-Timeout header is sent, 0 = none
+    REQUEST_TIMEOUT_MARGIN: float = float(os.getenv("REQUEST_TIMEOUT_MARGIN", "2"))  # Give up this long before the caller does
     
     # API Configuration
     API_TITLE: str = "Insurance Policy Summarization API"
     API_VERSION: str = "1.0.0"
     DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
+    API_WORKERS: int = int(os.getenv("API_WORKERS", "1"))  # >1 requires INFERENCE_MODE=remote and CACHE_BACKEND sqlite or redis
+
+    @model_validator(mode="after")
+    def _apply_legacy_cache_sizes(self):
+        """Carry a deprecated entry-count cache setting over to the byte cap that replaced it"""
+        for legacy, replacement in (("CACHE_MAX_SIZE", "CACHE_MAX_MB"), ("SUMMARY_CACHE_MAX_SIZE", "SUMMARY_CACHE_MAX_MB")):
+            count = getattr(self, legacy)
+            if count <= 0:
+                continue
+            if replacement in self.model_fields_set:
+                print(f"⚠️ {legacy} is deprecated and ignored because {replacement} is set")
+                continue
+            max_mb = max(1, math.ceil(count * LEGACY_CACHE_ENTRY_KB / 1024))
+            setattr(self, replacement, max_mb)
+            print(f"⚠️ {legacy} is deprecated, use {replacement}: {count} entries taken as {max_mb} MB")
+        return self
 
     class Config:
         # This allows pydantic-settings to load from a .env file
@@ -0,0 +1,24 @@
+import time
+from typing import Optional
+from fastapi import Request
+from app.core.config import settings
+
+TIMEOUT_HEADER = "X-Request-Timeout"
+
+def request_deadline(request: Request, default_timeout: Optional[float] = None) -> Optional[float]:
+    """
+    time.monotonic() deadline for this request. The caller's X-Request-Timeout
+    (seconds) wins over default_timeout (REQUEST_TIMEOUT unless given, 0 = none);
+    we stop a little earlier so the caller still gets an answer instead of its own timeout.
+    """
+    timeout = settings.REQUEST_TIMEOUT if default_timeout is None else default_timeout
+    header = request.headers.get(TIMEOUT_HEADER)
+    if header:
+        try:
+            timeout = float(header)
+        except ValueError:
+            pass
+    
+    if timeout <= 0:
+        return None
+    return time.monotonic() + max(timeout - settings.REQUEST_TIMEOUT_MARGIN, 1.0)
\ No newline at end of file
@@ -0,0 +1,28 @@
+from typing import Dict, Optional, Any
+
+# usage field -> Server-Timing metric name, in the order the stages run
+_STAGES = {
+    'cache_lookup_ms': "cache",
+    'prompt_build_ms': "prompt",
+    'queue_wait_ms': "queue",
+    'prefill_ms': "prefill",
+    'decode_ms': "decode",
+}
+
+_USAGE_FIELDS = ('prompt_tokens', 'completion_tokens', 'cached_prompt_tokens') + tuple(_STAGES)
+
+def response_usage(generation_usage: Optional[Dict[str, Any]] = None, **stages: Optional[float]) -> Dict[str, Any]:
+    """
+    The usage block of a response: token counts and engine timings from the
+    generation's usage (absent for cache hits) plus the API-side stages
+    (cache_lookup_ms, prompt_build_ms) measured by the endpoint
+    """
+    merged = {**(generation_usage or {}), **{name: round(ms, 2) for name, ms in stages.items() if ms is not None}}
+    return {name: merged[name] for name in _USAGE_FIELDS if merged.get(name) is not None}
+
+def server_timing(usage: Dict[str, Any], total_ms: Optional[float] = None) -> str:
+    """Server-Timing header value for the stages present in a usage block"""
+    metrics = [f"{name};dur={usage[field]}" for field, name in _STAGES.items() if field in usage]
+    if total_ms is not None:
+        metrics.append(f"total;dur={round(total_ms, 2)}")
+    return ", ".join(metrics)
@@ -1,10 +1,14 @@
+import asyncio
 from fastapi import APIRouter
 from datetime import datetime
 
 from app.models.api_models import HealthResponse
 from app.services.model_service import model_manager
-from app.services.cache_service import response_cache
+from app.services.cache_service import response_cache, summary_cache
 from app.services.chat_service import chat_service
+from app.services.job_service import job_manager
+from app.services.flight_service import generation_flights
+from app.services.precompute_service import precompute_service
 from app.core.config import settings
 
 router = APIRouter()
@@ -18,9 +22,12 @@ async def root():
         "status": "operational",
         "docs": "/docs",
         "health": "/health",
+        "metrics": "/metrics",
         "features": [
             "Chat with follow-up context",
             "Batch querying",
+            "Map-reduce summarization of long policies",
+            "Durable background jobs for batches and summaries",
             "Streaming responses",
             "Intelligent response caching",
             "Rate limiting protection",
@@ -31,47 +38,64 @@ async def root():
 @router.get("/health", response_model=HealthResponse, tags=["Admin"])
 async def health_check():
     """Health check with detailed system information"""
+    replicas = await model_manager.get_replica_status()
+    scheduler = await model_manager.get_scheduler_stats()
     uptime = (datetime.now() - model_manager.load_time).total_seconds() if model_manager.load_time else 0
     
     return HealthResponse(
-        status="healthy" if model_manager.model else "unhealthy",
-        model_loaded=model_manager.model is not None,
+        status="healthy" if model_manager.is_loaded else "unhealthy",
+        model_loaded=model_manager.is_loaded,
         uptime_seconds=round(uptime, 2),
         total_requests=model_manager.total_requests,
-        active_conversations=chat_service.get_active_count(),
-        response_cache_stats=response_cache.get_stats(),
+        aborted_requests=model_manager.aborted_requests,
+        active_conversations=await asyncio.to_thread(chat_service.get_active_count),
+        response_cache_stats=await asyncio.to_thread(response_cache.get_stats),
         system_info={
+            "backend": settings.INFERENCE_BACKEND,
             "model_path": settings.MODEL_PATH.split("\\")[-1], # Show only model name
             "context_window": settings.N_CTX,
             "gpu_layers": settings.N_GPU_LAYERS,
-            "cpu_threads": settings.N_THREADS
-        }
+            "cpu_threads": settings.N_THREADS,
+            "replicas": model_manager.n_replicas,
+            "threads_per_replica": model_manager.threads_per_replica
+        },
+        replicas=replicas,
+        scheduler=scheduler,
+        jobs=await asyncio.to_thread(job_manager.store.get_stats)
     )
 
 @router.post("/cache/clear", tags=["Admin"])
 async def clear_cache():
     """Clear all cached responses"""
-    old_stats = response_cache.get_stats()
-    response_cache.clear()
+    old_stats = await asyncio.to_thread(response_cache.get_stats)
+    await asyncio.to_thread(response_cache.clear)
     
     return {
         "message": "Response cache cleared successfully",
         "previous_stats": old_stats,
-        "current_stats": response_cache.get_stats()
+        "current_stats": await asyncio.to_thread(response_cache.get_stats)
     }
 
 @router.get("/cache/stats", tags=["Admin"])
 async def get_cache_stats():
     """Get detailed cache statistics"""
     return {
-        "response_cache_stats": response_cache.get_stats(),
+        "response_cache_stats": await asyncio.to_thread(response_cache.get_stats),
+        "summary_cache_stats": await asyncio.to_thread(summary_cache.get_stats),
         "cache_enabled": settings.CACHE_ENABLED,
         "ttl_hours": settings.CACHE_TTL_HOURS,
+        "single_flight_stats": generation_flights.get_stats(),
+        "precompute_stats": precompute_service.get_stats(),
         "chat_history_stats": {
-            "active_conversations": chat_service.get_active_count(),
+            "active_conversations": await asyncio.to_thread(chat_service.get_active_count),
             "max_size": chat_service.max_size,
             "ttl_hours": chat_service.ttl.total_seconds() / 3600
-        }
+        },
+        "kv_snapshot_enabled": settings.KV_SNAPSHOT_ENABLED,
+        "prefix_cache_enabled": settings.PREFIX_CACHE_ENABLED,
+        "kv_cache_stats": await model_manager.get_kv_cache_stats(),
+        "retrieval_enabled": settings.RETRIEVAL_ENABLED,
+        "retrieval_index_stats": model_manager.retriever.indexes.get_stats()
     }
 
 @router.get("/query-types", tags=["General"])
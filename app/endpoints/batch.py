@@ -1,86 +1,191 @@
 import time
-from fastapi import APIRouter, HTTPException
-from app.models.api_models import BatchQueryRequest, BatchResponse, BatchQueryResponse
+import json
+import asyncio
+from typing import Dict, Tuple
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from app.models.api_models import BatchQueryRequest, BatchStreamRequest, BatchResponse, BatchQueryResponse
 from app.services.model_service import model_manager
-from app.services.cache_service import response_cache
+from app.services.batch_service import (
+    normalize_query, plan_batch, cached_answer, generate_answer, failed_answer, answer_query, shared_answer
+)
 from app.core.config import settings
+from app.core.deadline import request_deadline
+from app.core.client import request_client
 
 router = APIRouter()
 
 @router.post("/batch-query", response_model=BatchResponse, tags=["Inference"])
-async def batch_query(request: BatchQueryRequest):
+async def batch_query(request: BatchQueryRequest, http_request: Request, response: Response):
     """
     Batch inference for multiple queries on the same policy document.
     This endpoint is stateless and does not use chat history.
+
+    - Repeated queries (ignoring case and spacing) are answered once.
+    - The cache is checked for every query before any generation starts.
+    - Misses are generated concurrently and returned in request order.
+    - A query whose generation fails carries an `error` instead of a
+      response; the other answers are still returned.
+    - Each result has its own `usage`; the `Server-Timing` header gives the
+      wall time of the cache and generation phases of the whole batch.
     """
     
-    if not model_manager.model:
+    if not model_manager.is_loaded:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     start_time = time.time()
+    deadline = request_deadline(http_request)
+    client = request_client(http_request)
+
+    unique, duplicate_of = plan_batch(request)
+    answers: Dict[int, BatchQueryResponse] = {}
+    misses = []
+
+    # --- 1. Cache lookups for every distinct query, up front ---
+    for idx in unique:
+        query = request.queries[idx]
+        query_type = request.query_types[idx] if request.query_types else None
+        cached = await cached_answer(request, query, query_type)
+        if cached is not None:
+            answers[idx] = cached
+        else:
+            misses.append(idx)
+
+    cache_done = time.time()
+
+    # --- 2. Every miss at once, so the batch engine decodes them together ---
+    # A failed query gets an error result instead of discarding its siblings' answers
+    generated = await asyncio.gather(*(
+        generate_answer(request, request.queries[idx],
+                        request.query_types[idx] if request.query_types else None,
+                        deadline, client)
+        for idx in misses
+    ), return_exceptions=True)
+    generate_done = time.time()
+
+    timed_out = False
+    for idx, outcome in zip(misses, generated):
+        if not isinstance(outcome, BaseException):
+            answers[idx] = outcome
+            continue
+        if isinstance(outcome, asyncio.TimeoutError):
+            timed_out = True
+            error = "Generation timed out"
+        else:
+            print(f"Batch Query Error: {outcome}")
+            error = str(outcome) or type(outcome).__name__
+        answers[idx] = failed_answer(request, request.queries[idx],
+                                     request.query_types[idx] if request.query_types else None,
+                                     error, generate_done - cache_done)
+
+    if timed_out:
+        # Every query shares the deadline, so the rest were stopped as well
+        model_manager.record_abort("timeout")
+        if all(answers[idx].error for idx in unique):
+            raise HTTPException(status_code=504, detail="Batch generation timed out")
+
+    # --- 3. Reassemble in request order; duplicates share the first answer ---
     results = []
-    
-    # Process each query sequentially
     for idx, query in enumerate(request.queries):
-        query_start = time.time()
-        
-        query_type = request.query_types[idx] if request.query_types else None
-        
-        params = {
-            'temperature': request.temperature,
-            'max_tokens': request.max_tokens,
-            'query_type': query_type
-        }
-        
-        # Check cache
-        cached_response = None
-        if request.use_cache:
-            cached_response = response_cache.get(request.policy_text, query, params)
-        
-        if cached_response:
-            response_text = cached_response
-            is_cached = True
+        original = duplicate_of[idx]
+        if original is None:
+            results.append(answers[idx])
         else:
-            # Generate (using the *non-chat* prompt creator)
-            prompt = model_manager.create_chat_prompt(
-                request.policy_text, 
-                query, 
-                history=[],  # No history for batch
-                query_type=query_type
-            )
-            result = model_manager.generate(
-                prompt, 
-                request.temperature, 
-                request.max_tokens, 
-                stream=False
-            )
-            response_text = result['choices'][0]['text'].strip()
-            
-            # Cache
-            if request.use_cache:
-                response_cache.set(request.policy_text, query, params, response_text)
-            
-            is_cached = False
-        
-        query_time = (time.time() - query_start) * 1000
-        
-        results.append(BatchQueryResponse(
-            query=query,
-            response=response_text,
-            query_type=query_type,
-            processing_time_ms=round(query_time, 2),
-            cached=is_cached,
-            model_info={
-                "model": "mistral-7b-insurance-finetune",
-                "temperature": request.temperature,
-                "max_tokens": request.max_tokens
-            }
-        ))
+            results.append(answers[original].model_copy(update={'query': query, 'duplicate_of': original}))
     
-    total_time = (time.time() - start_time) * 1000
+    total_time = (time.time() - start_time) * 1000  # Wall time; the queries overlap
+    response.headers["Server-Timing"] = (
+        f"cache;dur={round((cache_done - start_time) * 1000, 2)}, "
+        f"generate;dur={round((generate_done - cache_done) * 1000, 2)}, "
+        f"total;dur={round(total_time, 2)}"
+    )
     
     return BatchResponse(
         results=results,
         total_processing_time_ms=round(total_time, 2),
         queries_processed=len(request.queries)
-    )
\ No newline at end of file
+    )
+
+@router.post("/batch-query/stream", tags=["Inference"])
+async def batch_query_stream(request: BatchStreamRequest, http_request: Request):
+    """
+    Streaming batch inference for large question sets on one policy.
+
+    Returns NDJSON: one line per query as soon as it is answered, in
+    completion order and tagged with its input `index`, then a final line
+    with `done: true`. At most BATCH_STREAM_CONCURRENCY queries are in
+    flight and answers are not kept once sent, so server memory does not
+    grow with the size of the batch. A query that fails gets an `error`
+    line and the rest carry on.
+    """
+
+    if not model_manager.is_loaded:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+
+    start_time = time.time()
+    deadline = request_deadline(http_request)
+    client = request_client(http_request)
+    window = max(1, settings.BATCH_STREAM_CONCURRENCY)
+
+    async def stream_generator():
+        pending: Dict[asyncio.Future, int] = {}
+        # Normalized query -> (index, task) for queries still in flight; a repeat
+        # arriving later finds the first answer in the response cache instead
+        inflight: Dict[tuple, Tuple[int, asyncio.Future]] = {}
+        next_idx = 0
+        n_queries = len(request.queries)
+
+        def fill():
+            nonlocal next_idx
+            while next_idx < n_queries and len(pending) < window:
+                idx, query = next_idx, request.queries[next_idx]
+                next_idx += 1
+                query_type = request.query_types[idx] if request.query_types else None
+                key = (normalize_query(query), query_type)
+                if key in inflight:
+                    first_idx, task = inflight[key]
+                    waiter = asyncio.ensure_future(shared_answer(task, query, first_idx))
+                else:
+                    waiter = asyncio.ensure_future(answer_query(request, query, query_type, deadline, client))
+                    inflight[key] = (idx, waiter)
+                pending[waiter] = idx
+
+        try:
+            fill()
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    idx = pending.pop(task)
+                    try:
+                        line = {'index': idx, **task.result().model_dump(mode="json")}
+                    except asyncio.TimeoutError:
+                        model_manager.record_abort("timeout")
+                        yield json.dumps({'index': idx, 'error': 'Batch generation timed out'}) + "\n"
+                        return
+                    except Exception as e:
+                        print(f"Batch Query Error: {e}")
+                        line = {'index': idx, 'error': str(e)}
+                    yield json.dumps(line) + "\n"
+
+                # Forget finished queries so the table only holds the window
+                for key in [key for key, (_, task) in inflight.items() if task.done()]:
+                    del inflight[key]
+
+                if await http_request.is_disconnected():
+                    model_manager.record_abort("disconnect")
+                    return
+                fill()
+
+            total_time = (time.time() - start_time) * 1000
+            yield json.dumps({'done': True, 'queries_processed': n_queries,
+                              'total_processing_time_ms': round(total_time, 2)}) + "\n"
+
+        finally:
+            # Stops the generations still running after a disconnect or timeout
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(
+        stream_generator(),
+        media_type="application/x-ndjson"
+    )
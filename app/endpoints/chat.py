@@ -1,19 +1,27 @@
 import time
 import json
-from typing import AsyncGenerator
-from fastapi import APIRouter, HTTPException, Depends, status
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
 
 from app.models.api_models import ChatRequest, ChatResponse
 from app.services.model_service import model_manager
 from app.services.cache_service import response_cache
 from app.services.chat_service import chat_service
+from app.services.metrics_service import inference_metrics
+from app.services.flight_service import generation_flights, flight_key
+from app.services.precompute_service import precompute_service
+from app.services.scheduler import Priority
 from app.core.config import settings
+from app.core.deadline import request_deadline
+from app.core.client import request_client
+from app.core.timing import response_usage, server_timing
 
 router = APIRouter()
 
 @router.post("/chat", response_model=ChatResponse, tags=["Inference"])
-async def chat_with_policy(request: ChatRequest):
+async def chat_with_policy(request: ChatRequest, http_request: Request, response: Response):
     """
     Main endpoint for policy queries.
     
@@ -22,12 +30,27 @@ async def chat_with_policy(request: ChatRequest):
     - **Follow-up questions**: Provide `conversation_id` and `query`.
     - Intelligent caching for repeated queries.
     - Streaming responses.
+    - Identical requests (same document, history, query and params) made
+      while one is generating share that generation; a stream joining
+      late gets the tokens so far replayed first. `use_cache: false`
+      opts out.
+    - The first question about a new document queues the standard
+      questions (PRECOMPUTE_QUESTIONS) for background precompute.
+    - Generation stops when every client sharing it has disconnected, or
+      when the first requester's deadline (`X-Request-Timeout` header)
+      passes; each client also stops waiting at its own deadline.
+    - `usage` breaks the time down into cache lookup, prompt building,
+      queue wait, prefill and decode, also sent as `Server-Timing` headers
+      (streams send it in the final event; the header only has the stages
+      finished before the first token).
     """
     
-    if not model_manager.model:
+    if not model_manager.is_loaded:
         raise HTTPException(status_code=503, detail="Model not loaded")
 
     start_time = time.time()
+    deadline = request_deadline(http_request)
+    client = request_client(http_request)
     conv_id = request.conversation_id
     
     # --- 1. Identify Conversation ---
@@ -42,6 +65,8 @@ async def chat_with_policy(request: ChatRequest):
         conv_id = await chat_service.start_chat(request.policy_text)
         policy_text = request.policy_text
         history = []
+        # A new document: answer the standard questions while the user reads this answer
+        precompute_service.schedule(policy_text, asked=request.query)
     
     else:
         raise HTTPException(status_code=400, 
@@ -59,8 +84,10 @@ async def chat_with_policy(request: ChatRequest):
     
     # --- 3. Check Response Cache ---
     cached_response = None
+    lookup_start = time.time()
     if request.use_cache:
-        cached_response = response_cache.get(policy_text, request.query, params)
+        cached_response = await response_cache.get_async(policy_text, request.query, params)
+    cache_lookup_ms = (time.time() - lookup_start) * 1000
     
     if cached_response:
         # Add cached interaction to history
@@ -68,6 +95,9 @@ async def chat_with_policy(request: ChatRequest):
         await chat_service.add_message(conv_id, "assistant", cached_response)
         
         processing_time = (time.time() - start_time) * 1000
+        inference_metrics.observe("chat", request.query_type, True, processing_time / 1000)
+        usage = response_usage(cache_lookup_ms=cache_lookup_ms)
+        response.headers["Server-Timing"] = server_timing(usage, processing_time)
         return ChatResponse(
             query=request.query,
             response=cached_response,
@@ -75,66 +105,143 @@ async def chat_with_policy(request: ChatRequest):
             query_type=request.query_type,
             processing_time_ms=round(processing_time, 2),
             cached=True,
+            usage=usage,
             model_info=params
         )
 
     # --- 4. Generate Prompt ---
-    prompt = model_manager.create_chat_prompt(
-        policy_text, 
-        request.query, 
-        history, 
-        request.query_type
+    prompt_start = time.time()
+    try:
+        chat_prompt = await model_manager.create_chat_prompt(
+            policy_text, 
+            request.query, 
+            history, 
+            request.query_type,
+            max_tokens,
+            client=client
+        )
+    except ValueError as e:
+        # The question and answer budget leave no room for the policy
+        raise HTTPException(status_code=400, detail=str(e))
+    prompt_build_ms = (time.time() - prompt_start) * 1000
+    prompt, prefix = chat_prompt.prompt, chat_prompt.prefix
+    speculative = model_manager.use_speculative(request.query_type)
+    
+    # --- 5. Join the identical generation in flight, or start one ---
+    def cache_answer(text: str):
+        # Only a complete answer is cached; a cut-off one must not be served again
+        response_cache.set(policy_text, request.query, params, text)
+    
+    flight, shared = generation_flights.join(
+        flight_key(response_cache.request_key(policy_text, request.query, params), history, Priority.INTERACTIVE)
+        if request.use_cache else None,
+        lambda: model_manager.generate(prompt, temperature, chat_prompt.max_tokens, stream=True,
+                                       session_id=conv_id, prefix=prefix,
+                                       speculative=speculative, deadline=deadline, client=client),
+        on_complete=cache_answer if request.use_cache else None
     )
     
-    # --- 5. Handle Streaming ---
+    # --- 6. Handle Streaming ---
     if request.stream:
         async def stream_generator():
             full_response = ""
+            usage = {}
+            first_token_at = None
+            completed = False
+            aborted: Optional[str] = None  # "disconnect" or "timeout"
+            chunks = flight.stream(deadline)
             try:
-                for chunk in model_manager.generate(prompt, temperature, max_tokens, stream=True):
+                async for chunk in chunks:
                     if 'choices' in chunk:
                         text = chunk['choices'][0].get('text', '')
                         if text:
+                            if first_token_at is None:
+                                first_token_at = time.time()
                             full_response += text
                             yield f"data: {json.dumps({'text': text})}\n\n"
+                    usage = chunk.get('usage', usage)
+                    
+                    # Checked per token so an abandoned stream stops within a token or two
+                    if await http_request.is_disconnected():
+                        aborted = "disconnect"
+                        break
+                else:
+                    completed = True
+            
+            except asyncio.TimeoutError:
+                aborted = "timeout"
+                yield f"data: {json.dumps({'error': 'Generation timed out'})}\n\n"
+            
+            except asyncio.CancelledError:
+                # The server cancels the response once it notices the client is gone
+                aborted = "disconnect"
+                raise
             
             except Exception as e:
                 print(f"Streaming Error: {e}")
                 yield f"data: {json.dumps({'error': str(e)})}\n\n"
             
             finally:
+                # Leaving the flight cancels the generation if nobody else is following it
+                await chunks.aclose()
+                if aborted:
+                    model_manager.record_abort(aborted)
+                
                 # Add full interaction to history
                 await chat_service.add_message(conv_id, "user", request.query)
                 await chat_service.add_message(conv_id, "assistant", full_response)
                 
-                # Cache the complete response
-                if request.use_cache:
-                    response_cache.set(policy_text, request.query, params, full_response)
-                
+                if completed and first_token_at is not None:
+                    end = time.time()
+                    inference_metrics.observe("chat", request.query_type, False, end - start_time,
+                                              ttft=first_token_at - start_time, usage=usage,
+                                              generation_seconds=end - first_token_at)
+            
+            if aborted != "disconnect":
                 # Send final metadata
                 processing_time = (time.time() - start_time) * 1000
-                yield f"data: {json.dumps({'done': True, 'conversation_id': conv_id, 'processing_time_ms': round(processing_time, 2)})}\n\n"
+                done = {'done': True, 'conversation_id': conv_id, 'processing_time_ms': round(processing_time, 2),
+                        'prompt_tokens': chat_prompt.token_counts,
+                        'usage': response_usage(usage, cache_lookup_ms=cache_lookup_ms,
+                                                prompt_build_ms=prompt_build_ms)}
+                if 'speculative' in usage:
+                    done['speculative'] = usage['speculative']
+                if shared:
+                    done['shared_generation'] = True
+                yield f"data: {json.dumps(done)}\n\n"
         
+        # Only the stages finished before streaming starts; the rest arrive in the final event
+        early_usage = response_usage(cache_lookup_ms=cache_lookup_ms, prompt_build_ms=prompt_build_ms)
         return StreamingResponse(
             stream_generator(),
-            media_type="text/event-stream"
+            media_type="text/event-stream",
+            headers={"Server-Timing": server_timing(early_usage)}
         )
     
-    # --- 6. Non-Streaming Inference ---
+    # --- 7. Non-Streaming Inference ---
     try:
-        result = model_manager.generate(prompt, temperature, max_tokens, stream=False)
+        generation_start = time.time()
+        result = await flight.result(deadline)
         response_text = result['choices'][0]['text'].strip()
         
         # Add to history
         await chat_service.add_message(conv_id, "user", request.query)
         await chat_service.add_message(conv_id, "assistant", response_text)
-
-        # Cache result
-        if request.use_cache:
-            response_cache.set(policy_text, request.query, params, response_text)
         
-        processing_time = (time.time() - start_time) * 1000
+        model_info = {**params, 'prompt_tokens': chat_prompt.token_counts}
+        usage = result.get('usage') or {}
+        if 'speculative' in usage:
+            model_info['speculative'] = usage['speculative']
+        if shared:
+            model_info['shared_generation'] = True
         
+        end = time.time()
+        processing_time = (end - start_time) * 1000
+        inference_metrics.observe("chat", request.query_type, False, end - start_time,
+                                  usage=usage, generation_seconds=end - generation_start)
+        
+        usage = response_usage(usage, cache_lookup_ms=cache_lookup_ms, prompt_build_ms=prompt_build_ms)
+        response.headers["Server-Timing"] = server_timing(usage, processing_time)
         return ChatResponse(
             query=request.query,
             response=response_text,
@@ -142,9 +249,14 @@ async def chat_with_policy(request: ChatRequest):
             query_type=request.query_type,
             processing_time_ms=round(processing_time, 2),
             cached=False,
-            model_info=params
+            usage=usage,
+            model_info=model_info
         )
 
+    except asyncio.TimeoutError:
+        model_manager.record_abort("timeout")
+        raise HTTPException(status_code=504, detail="Generation timed out")
+
     except Exception as e:
         print(f"Inference Error: {e}")
         raise HTTPException(status_code=500, detail=f"Model inference failed: {e}")
\ No newline at end of file
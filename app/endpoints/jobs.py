@@ -0,0 +1,68 @@
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, Query
+
+from app.models.api_models import JobRequest, JobResponse, JobResultsResponse, JobKind
+from app.services.job_service import job_manager
+from app.core.client import request_client
+
+router = APIRouter()
+
+def _job_response(job) -> JobResponse:
+    return JobResponse(
+        job_id=job['id'],
+        kind=job['kind'],
+        status=job['status'],
+        completed=job['completed'],
+        total=job['total'],
+        created_at=job['created_at'],
+        started_at=job['started_at'],
+        finished_at=job['finished_at'],
+        error=job['error']
+    )
+
+async def _get_job(job_id: str):
+    job = await asyncio.to_thread(job_manager.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/jobs", response_model=JobResponse, status_code=202, tags=["Jobs"])
+async def create_job(request: JobRequest, http_request: Request):
+    """
+    Queue a batch or summarize request and return its job id at once.
+
+    Jobs are stored on disk and survive restarts: unfinished jobs resume
+    (batch jobs skip the queries already answered) and finished results
+    stay available from `/jobs/{job_id}/results`.
+    """
+    payload = getattr(request, request.kind.value)
+    total = len(payload.queries) if request.kind == JobKind.BATCH else 0
+    job_id = await job_manager.submit(request.kind.value, payload.model_dump(mode="json"),
+                                request_client(http_request), total)
+    return _job_response(await _get_job(job_id))
+
+@router.get("/jobs/{job_id}", response_model=JobResponse, tags=["Jobs"])
+async def get_job(job_id: str):
+    """Status and progress of a job"""
+    return _job_response(await _get_job(job_id))
+
+@router.get("/jobs/{job_id}/results", response_model=JobResultsResponse, tags=["Jobs"])
+async def get_job_results(job_id: str,
+                          offset: int = Query(0, ge=0, description="First input index to return (batch)"),
+                          limit: int = Query(100, ge=1, le=1000)):
+    """
+    Results of a job. Batch answers are available as soon as each one
+    finishes, ordered by input index; a summary once the job completes.
+    """
+    job = await _get_job(job_id)
+    if job['kind'] == JobKind.SUMMARIZE.value:
+        if job['status'] == 'failed':
+            raise HTTPException(status_code=409, detail=f"Job failed: {job['error']}")
+        if job['status'] != 'completed':
+            raise HTTPException(status_code=409, detail="Job has not finished")
+        return JobResultsResponse(job_id=job_id, status=job['status'], summary=json.loads(job['result']))
+
+    results = await asyncio.to_thread(job_manager.store.results, job_id, offset, limit)
+    next_offset = results[-1]['index'] + 1 if len(results) == limit else None
+    return JobResultsResponse(job_id=job_id, status=job['status'], results=results, next_offset=next_offset)
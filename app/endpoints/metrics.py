@@ -0,0 +1,52 @@
+import asyncio
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services.model_service import model_manager
+from app.services.cache_service import response_cache, summary_cache
+from app.services.chat_service import chat_service
+from app.services.rate_limiter import rate_limiter
+from app.services.metrics_service import inference_metrics, render_gauge
+from app.services.flight_service import generation_flights
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse, tags=["Admin"])
+async def metrics():
+    """
+    Prometheus metrics. Latency, time-to-first-token, token count and
+    tokens/s histograms are labeled by endpoint, query_type and cache
+    (hit or miss); queue, conversation, rate-limiter and cache gauges are
+    read when scraped, so they cost nothing between scrapes.
+    """
+    scheduler = await model_manager.get_scheduler_stats()
+    kv_stats = await model_manager.get_kv_cache_stats()
+
+    lines = inference_metrics.render()
+    lines += render_gauge("policy_queue_depth", "Inference jobs waiting for a replica.", {
+        (("priority", name),): stats['queued'] for name, stats in scheduler.get('classes', {}).items()
+    })
+    lines += render_gauge("policy_active_conversations", "Conversations held for follow-ups.",
+                          {(): await asyncio.to_thread(chat_service.get_active_count)})
+    lines += render_gauge("policy_rate_limiter_clients", "Client IPs tracked by the rate limiter.",
+                          {(): await asyncio.to_thread(rate_limiter.get_client_count)})
+
+    cache_bytes = {
+        (("cache", "response"),): await asyncio.to_thread(response_cache.get_nbytes),
+        (("cache", "summary"),): await asyncio.to_thread(summary_cache.get_nbytes),
+        (("cache", "retrieval_index"),): model_manager.retriever.indexes.total_bytes
+    }
+    for name, stats in kv_stats.items():
+        cache_bytes[(("cache", name),)] = stats.get('size_bytes', 0)
+    lines += render_gauge("policy_cache_bytes", "Memory held by each cache.", cache_bytes)
+
+    lines += render_gauge("policy_requests_total", "Generations submitted to the model.",
+                          {(): model_manager.total_requests}, kind="counter")
+    lines += render_gauge("policy_coalesced_requests_total",
+                          "Requests that joined an identical generation already in flight.",
+                          {(): generation_flights.coalesced}, kind="counter")
+    lines += render_gauge("policy_aborted_requests_total", "Generations cut short, by reason.", {
+        (("reason", reason),): count for reason, count in model_manager.aborted_requests.items()
+    }, kind="counter")
+
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
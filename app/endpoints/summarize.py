@@ -0,0 +1,98 @@
+import time
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from app.models.api_models import SummarizeRequest, SummarizeResponse
+from app.services.model_service import model_manager
+from app.services.summary_service import policy_summarizer
+from app.core.config import settings
+from app.core.deadline import request_deadline
+from app.core.client import request_client
+
+router = APIRouter()
+
+@router.post("/summarize", response_model=SummarizeResponse, tags=["Inference"])
+async def summarize_policy(request: SummarizeRequest, http_request: Request):
+    """
+    Summarize a whole policy, however long.
+
+    - Policies that fit the context window are summarized in one pass.
+    - Longer ones are split into token-bounded sections that are summarized
+      in parallel, then merged (map-reduce).
+    - Section summaries are cached by content, so re-uploads and documents
+      sharing sections reuse them.
+    - With `stream`, progress events (`plan`, `section`, `reduce`) and the
+      final `summary` are sent over SSE.
+    - Without an `X-Request-Timeout`, the time allowed grows with the
+      number of sections: REQUEST_TIMEOUT per round of sections the
+      replicas can run at once, plus one for the merge.
+    """
+
+    if not model_manager.is_loaded:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+
+    start_time = time.time()
+    deadline = request_deadline(http_request, default_timeout=0)
+    events = policy_summarizer.summarize(
+        request.policy_text,
+        request.temperature,
+        request.max_tokens,
+        use_cache=request.use_cache,
+        deadline=deadline,
+        client=request_client(http_request),
+        section_timeout=settings.REQUEST_TIMEOUT
+    )
+
+    if request.stream:
+        async def stream_generator():
+            try:
+                async for event in events:
+                    if event['event'] == 'summary':
+                        event['processing_time_ms'] = round((time.time() - start_time) * 1000, 2)
+                        event['done'] = True
+                    yield f"data: {json.dumps(event)}\n\n"
+
+                    if await http_request.is_disconnected():
+                        model_manager.record_abort("disconnect")
+                        break
+
+            except asyncio.TimeoutError:
+                model_manager.record_abort("timeout")
+                yield f"data: {json.dumps({'error': 'Summarization timed out'})}\n\n"
+
+            except Exception as e:
+                print(f"Summarization Error: {e}")
+                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+
+            finally:
+                # Cancels the section generations still running
+                await events.aclose()
+
+        return StreamingResponse(
+            stream_generator(),
+            media_type="text/event-stream"
+        )
+
+    try:
+        async for event in events:
+            final = event
+
+    except asyncio.TimeoutError:
+        model_manager.record_abort("timeout")
+        raise HTTPException(status_code=504, detail="Summarization timed out")
+
+    except Exception as e:
+        print(f"Summarization Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Summarization failed: {e}")
+
+    processing_time = (time.time() - start_time) * 1000
+    return SummarizeResponse(
+        summary=final['summary'],
+        sections_total=final['sections_total'],
+        sections_cached=final['sections_cached'],
+        reduce_passes=final['reduce_passes'],
+        processing_time_ms=round(processing_time, 2),
+        cached=final['cached']
+    )
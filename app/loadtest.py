@@ -0,0 +1,365 @@
+import os
+import sys
+import json
+import time
+import math
+import random
+import asyncio
+import tempfile
+import argparse
+import subprocess
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Optional, Any
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Scenario weights used when --mix is not given
+DEFAULT_MIX = "chat=4,chat_stream=3,followup=2,batch=1"
+
+_VOCABULARY = (
+    "policy coverage insured premium claim benefit exclusion waiting period hospitalisation "
+    "sum rider deductible co-payment renewal nominee maturity surrender grace lapse revival "
+    "accident disability critical illness cashless network reimbursement annual monthly"
+).split()
+
+_QUESTIONS = [
+    "What is the sum insured under this policy?",
+    "What are the premium payment options?",
+    "Which conditions are excluded from coverage?",
+    "How long is the waiting period for pre-existing diseases?",
+    "How do I file a cashless claim?",
+    "What riders can be added to the policy?",
+    "What happens if I miss a premium payment?",
+    "Is there a co-payment on hospitalisation claims?",
+]
+
+_FOLLOW_UPS = ["Can you explain that in simpler terms?", "What about annual payments?",
+               "Are there any limits on that?", "Does this apply to my family members?"]
+
+def synthetic_policy(rng: random.Random, n_sections: int) -> str:
+    """A deterministic policy-like document, so runs are reproducible without real data"""
+    sections = []
+    for number in range(1, n_sections + 1):
+        words = " ".join(rng.choice(_VOCABULARY) for _ in range(rng.randint(40, 120)))
+        sections.append(f"Section {number}. {words.capitalize()}.")
+    return "\n\n".join(sections)
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]  # Nearest rank
+
+    return {
+        'p50': round(rank(50), 2),
+        'p95': round(rank(95), 2),
+        'p99': round(rank(99), 2),
+        'mean': round(sum(ordered) / len(ordered), 2),
+        'max': round(ordered[-1], 2)
+    }
+
+@dataclass
+class ScenarioStats:
+    latency_ms: List[float] = field(default_factory=list)
+    ttft_ms: List[float] = field(default_factory=list)
+    tokens_per_s: List[float] = field(default_factory=list)
+    requests: int = 0
+    cached: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)  # Status code or exception name -> count
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        n_errors = sum(self.errors.values())
+        report = {
+            'requests': self.requests,
+            'throughput_rps': round(self.requests / elapsed, 3) if elapsed else 0.0,
+            'error_rate': round(n_errors / self.requests, 4) if self.requests else 0.0,
+            'errors': self.errors,
+            'cache_hit_ratio': round(self.cached / (self.requests - n_errors), 4) if self.requests > n_errors else 0.0,
+            'latency_ms': percentiles(self.latency_ms)
+        }
+        if self.ttft_ms:
+            report['ttft_ms'] = percentiles(self.ttft_ms)
+        if self.tokens_per_s:
+            report['tokens_per_s'] = percentiles(self.tokens_per_s)
+        return report
+
+class LoadTest:
+    """
+    Closed-loop load generator: each virtual user picks a scenario from the
+    mix, waits for the answer, thinks, and repeats until the run ends.
+    With probability cache_hit_ratio a request repeats an earlier
+    (policy, question) pair, otherwise the question is new.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.policies = [synthetic_policy(self.rng, self.rng.randint(4, args.policy_sections))
+                         for _ in range(args.policies)]
+        self.asked: List[Tuple[int, str]] = []  # (policy index, question) pairs already sent
+        self.counter = 0
+        self.mix = self._parse_mix(args.mix)
+        self.stats: Dict[str, ScenarioStats] = {name: ScenarioStats() for name, _ in self.mix}
+        self.recording = False
+
+    def _parse_mix(self, spec: str) -> List[Tuple[str, float]]:
+        mix = []
+        for item in spec.split(","):
+            name, _, weight = item.strip().partition("=")
+            if not hasattr(self, f"_scenario_{name}"):
+                raise SystemExit(f"Unknown scenario: {name}")
+            if name == "upload" and not self.args.middleware_url:
+                raise SystemExit("The upload scenario needs --middleware-url")
+            mix.append((name, float(weight or 1)))
+        return mix
+
+    def _question(self) -> Tuple[int, str]:
+        """A repeated (policy, question) pair or a fresh one, per the cache-hit ratio"""
+        if self.asked and self.rng.random() < self.args.cache_hit_ratio:
+            return self.rng.choice(self.asked)
+        self.counter += 1
+        pair = (self.rng.randrange(len(self.policies)), f"{self.rng.choice(_QUESTIONS)} (case {self.counter})")
+        self.asked.append(pair)
+        return pair
+
+    def _record(self, name: str, start: float, ttft: Optional[float] = None, tokens: int = 0,
+                first_token: Optional[float] = None, cached: bool = False, error: Optional[str] = None):
+        if not self.recording:
+            return  # Warm-up
+        stats = self.stats[name]
+        stats.requests += 1
+        if error is not None:
+            stats.errors[error] = stats.errors.get(error, 0) + 1
+            return
+        end = time.perf_counter()
+        stats.latency_ms.append((end - start) * 1000)
+        stats.cached += cached
+        if ttft is not None:
+            stats.ttft_ms.append(ttft * 1000)
+        if tokens > 1 and first_token is not None and end > first_token:
+            stats.tokens_per_s.append((tokens - 1) / (end - first_token))  # Decode rate after the first token
+
+    async def _post_json(self, client: httpx.AsyncClient, name: str, url: str, **kwargs) -> Optional[Dict]:
+        start = time.perf_counter()
+        try:
+            response = await client.post(url, **kwargs)
+        except httpx.HTTPError as e:
+            self._record(name, start, error=type(e).__name__)
+            return None
+        if response.status_code >= 400:
+            self._record(name, start, error=str(response.status_code))
+            return None
+        body = response.json()
+        self._record(name, start, cached=bool(body.get('cached')))
+        return body
+
+    async def _scenario_chat(self, client: httpx.AsyncClient, user: Dict):
+        policy, question = self._question()
+        body = await self._post_json(client, "chat", f"{self.args.core_url}/chat",
+                                     json={'policy_text': self.policies[policy], 'query': question})
+        if body:
+            user['conversation_id'] = body['conversation_id']
+
+    async def _scenario_chat_stream(self, client: httpx.AsyncClient, user: Dict):
+        policy, question = self._question()
+        await self._stream(client, "chat_stream", user,
+                           {'policy_text': self.policies[policy], 'query': question, 'stream': True})
+
+    async def _scenario_followup(self, client: httpx.AsyncClient, user: Dict):
+        if not user.get('conversation_id'):
+            await self._scenario_chat(client, user)
+            return
+        await self._stream(client, "followup", user,
+                           {'conversation_id': user['conversation_id'], 'query': self.rng.choice(_FOLLOW_UPS),
+                            'stream': True})
+
+    async def _stream(self, client: httpx.AsyncClient, name: str, user: Dict, payload: Dict):
+        """One SSE chat: time to first token, then one token per 'text' event"""
+        start = time.perf_counter()
+        first_token, tokens, error = None, 0, None
+        try:
+            async with client.stream("POST", f"{self.args.core_url}/chat", json=payload) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    self._record(name, start, error=str(response.status_code))
+                    return
+                if response.headers.get("content-type", "").startswith("application/json"):
+                    # Cache hits are answered with a plain JSON body, not an event stream
+                    body = json.loads(await response.aread())
+                    user['conversation_id'] = body['conversation_id']
+                    self._record(name, start, cached=bool(body.get('cached')))
+                    return
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[6:])
+                    if 'text' in event:
+                        tokens += 1
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                    elif 'error' in event:
+                        error = "stream_error"
+                    elif event.get('done'):
+                        user['conversation_id'] = event['conversation_id']
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        if error:
+            self._record(name, start, error=error)
+            return
+        self._record(name, start, ttft=(first_token - start) if first_token else None, tokens=tokens,
+                     first_token=first_token)
+
+    async def _scenario_batch(self, client: httpx.AsyncClient, user: Dict):
+        policy = self.rng.randrange(len(self.policies))
+        queries = [self._question()[1] for _ in range(self.args.batch_size)]
+        start = time.perf_counter()
+        try:
+            response = await client.post(f"{self.args.core_url}/batch-query",
+                                         json={'policy_text': self.policies[policy], 'queries': queries})
+        except httpx.HTTPError as e:
+            self._record("batch", start, error=type(e).__name__)
+            return
+        if response.status_code >= 400:
+            self._record("batch", start, error=str(response.status_code))
+            return
+        results = response.json()['results']
+        self._record("batch", start, cached=all(result['cached'] for result in results))
+
+    async def _scenario_upload(self, client: httpx.AsyncClient, user: Dict):
+        policy, question = self._question()
+        files = {'file': ("policy.txt", self.policies[policy].encode(), "text/plain")}
+        await self._post_json(client, "upload", f"{self.args.middleware_url}/api/upload-policy",
+                              files=files, data={'query': question})
+
+    async def _user(self, client: httpx.AsyncClient, stop_at: float):
+        user: Dict[str, Any] = {}
+        names = [name for name, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        while time.perf_counter() < stop_at:
+            scenario = self.rng.choices(names, weights)[0]
+            await getattr(self, f"_scenario_{scenario}")(client, user)
+            if self.args.think_time > 0:
+                await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.args.concurrency * 2)
+        async with httpx.AsyncClient(timeout=self.args.timeout, limits=limits) as client:
+            if self.args.warmup > 0:
+                await asyncio.gather(*(self._user(client, time.perf_counter() + self.args.warmup)
+                                       for _ in range(self.args.concurrency)))
+            self.recording = True
+            start = time.perf_counter()
+            stop_at = start + self.args.duration
+            await asyncio.gather(*(self._user(client, stop_at) for _ in range(self.args.concurrency)))
+            elapsed = time.perf_counter() - start
+            server = await self._server_health(client)
+
+        overall = ScenarioStats()
+        for stats in self.stats.values():
+            overall.latency_ms += stats.latency_ms
+            overall.ttft_ms += stats.ttft_ms
+            overall.tokens_per_s += stats.tokens_per_s
+            overall.requests += stats.requests
+            overall.cached += stats.cached
+            for error, count in stats.errors.items():
+                overall.errors[error] = overall.errors.get(error, 0) + count
+
+        return {
+            'config': {key: value for key, value in vars(self.args).items() if key != 'output'},
+            'elapsed_s': round(elapsed, 2),
+            'overall': overall.report(elapsed),
+            'scenarios': {name: stats.report(elapsed) for name, stats in self.stats.items()},
+            'server': server
+        }
+
+    async def _server_health(self, client: httpx.AsyncClient) -> Dict[str, Any]:
+        """Core /health after the run, for the backend, replicas and scheduler waits"""
+        try:
+            response = await client.get(f"{self.args.core_url}/health")
+            health = response.json()
+            return {key: health.get(key) for key in ('system_info', 'scheduler', 'aborted_requests')}
+        except (httpx.HTTPError, ValueError) as e:
+            return {'error': str(e)}
+
+def start_servers(args: argparse.Namespace) -> List[subprocess.Popen]:
+    """Core API on the stub backend (and the middleware, if asked), ready for a reproducible run"""
+    port = httpx.URL(args.core_url).port or 8000
+    scratch = tempfile.mkdtemp(prefix="loadtest-")
+    env = {
+        **os.environ,
+        'INFERENCE_BACKEND': 'stub',
+        'RATE_LIMIT_ENABLED': 'false',  # Every virtual user shares one IP
+        'JOBS_DB_PATH': os.path.join(scratch, "jobs.db"),
+        'CACHE_DB_PATH': os.path.join(scratch, "cache.db"),  # Start cold, leave the real cache alone
+    }
+    servers = [subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+                                 "--log-level", "warning"], cwd=ROOT, env=env)]
+    if args.middleware_url:
+        # The middleware reaches the core API at its configured POLICY_API_BASE_URL
+        middleware_port = httpx.URL(args.middleware_url).port or 8001
+        servers.append(subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port",
+                                         str(middleware_port), "--log-level", "warning"],
+                                        cwd=os.path.join(ROOT, "App2", "middlewareapi")))
+
+    deadline = time.time() + 60
+    for url in [args.core_url] + ([args.middleware_url] if args.middleware_url else []):
+        while True:
+            try:
+                if httpx.get(f"{url}/health", timeout=2).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.time() > deadline or any(server.poll() is not None for server in servers):
+                stop_servers(servers)
+                raise SystemExit(f"Server at {url} did not start")
+            time.sleep(0.5)
+    return servers
+
+def stop_servers(servers: List[subprocess.Popen]):
+    for server in servers:
+        server.terminate()
+    for server in servers:
+        server.wait(timeout=30)
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the policy API and middleware; prints a JSON report")
+    parser.add_argument("--core-url", default="http://localhost:8000")
+    parser.add_argument("--middleware-url", help="Middleware base URL, needed for the upload scenario")
+    parser.add_argument("--start-stub", action="store_true",
+                        help="Start the core API (and middleware) on the stub backend for the run")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"Scenario weights: chat, chat_stream, followup, batch, upload (default: {DEFAULT_MIX})")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="Virtual users")
+    parser.add_argument("-d", "--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=0, help="Unmeasured seconds before the run")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between a user's requests (s)")
+    parser.add_argument("--cache-hit-ratio", type=float, default=0.2, help="Share of requests repeating a question")
+    parser.add_argument("--policies", type=int, default=5, help="Distinct synthetic policies")
+    parser.add_argument("--policy-sections", type=int, default=12, help="Max sections per synthetic policy")
+    parser.add_argument("--batch-size", type=int, default=5, help="Queries per /batch-query")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+def main(argv: List[str] = None):
+    """Run the load test and emit the report"""
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    load_test = LoadTest(args)
+    servers = start_servers(args) if args.start_stub else []
+    try:
+        report = asyncio.run(load_test.run())
+    finally:
+        stop_servers(servers)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"📊 Report written to {args.output}")
+    else:
+        print(text)
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,6 +8,9 @@ from app.api import api_router
 from app.core.config import settings
 from app.services.model_service import model_manager
 from app.services.rate_limiter import rate_limiter
+from app.services.job_service import job_manager
+from app.services.precompute_service import precompute_service
+from app.services.cache_service import response_cache, summary_cache
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -14,6 +18,8 @@ async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Starting Insurance Policy Summarization API...")
     model_manager.load_model()
+    await job_manager.start()  # Also resumes jobs left unfinished by the last run
+    await precompute_service.start()
     
     print(f"✨ API ready at http://localhost:8000")
     print(f"📚 Docs available at http://localhost:8000/docs")
@@ -22,6 +28,11 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     print("👋 Shutting down gracefully...")
+    await precompute_service.stop()
+    await job_manager.stop()
+    await asyncio.to_thread(response_cache.flush)
+    await asyncio.to_thread(summary_cache.flush)
+    model_manager.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
@@ -48,7 +59,7 @@ async def rate_limit_middleware(request: Request, call_next):
         return await call_next(request)
     
     client_ip = request.client.host if request.client else "unknown"
-    allowed, remaining = rate_limiter.is_allowed(client_ip)
+    allowed, remaining = await rate_limiter.check(client_ip)
     
     if not allowed:
         return JSONResponse(
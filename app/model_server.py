@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import asyncio
+from typing import Dict, Any
+
+from app.core.config import settings
+from app.services.model_service import ModelManager
+from app.services.scheduler import Priority
+from app.services.model_ipc import (
+    FRAME_REQUEST, FRAME_CHUNK, FRAME_RESULT, FRAME_ERROR, FRAME_END,
+    pack_frame, pack_json, pack_matrix, read_frame
+)
+
+class ModelServer:
+    """
+    Owns the single ModelManager for a host and serves API workers
+    over a Unix socket. One connection carries one request.
+    """
+
+    def __init__(self, manager: ModelManager, socket_path: str):
+        self.manager = manager
+        self.socket_path = socket_path
+
+    async def _status(self) -> Dict[str, Any]:
+        return {
+            "n_replicas": len(self.manager.replicas),
+            "threads_per_replica": self.manager.threads_per_replica,
+            "load_time": self.manager.load_time.timestamp(),
+            "total_requests": self.manager.total_requests,
+            "replicas": await self.manager.get_replica_status(),
+            "scheduler": await self.manager.get_scheduler_stats(),
+            "kv_cache_stats": await self.manager.get_kv_cache_stats()
+        }
+
+    async def _generate(self, request: Dict[str, Any], writer: asyncio.StreamWriter):
+        args = (request["prompt"], request["temperature"], request["max_tokens"])
+        prefix_len = request.get("prefix_len")
+        timeout = request.get("timeout")
+        options = {
+            "session_id": request.get("session_id"),
+            "prefix": request["prompt"][:prefix_len] if prefix_len else None,
+            "speculative": request.get("speculative", False),
+            "priority": Priority(request.get("priority", Priority.INTERACTIVE)),
+            "client": request.get("client", ""),
+            "deadline": time.monotonic() + timeout if timeout is not None else None
+        }
+
+        if not request.get("stream"):
+            result = await self.manager.generate(*args, stream=False, **options)
+            writer.write(pack_json(FRAME_RESULT, result))
+            return
+
+        usage = None
+        async for chunk in self.manager.generate(*args, stream=True, **options):
+            text = chunk['choices'][0].get('text', '')
+            if text:
+                writer.write(pack_frame(FRAME_CHUNK, text.encode()))
+                # Raises once the client has gone away, which cancels the job
+                await writer.drain()
+            usage = chunk.get('usage', usage)
+        
+        if usage is None:
+            writer.write(pack_frame(FRAME_END))
+        else:
+            writer.write(pack_json(FRAME_END, {'choices': [{'text': ''}], 'usage': usage}))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve a single framed request"""
+        try:
+            frame_type, body = await read_frame(reader)
+            if frame_type != FRAME_REQUEST:
+                raise ValueError(f"Unexpected frame type {frame_type}")
+
+            request = json.loads(body)
+            op = request.get("op")
+
+            if op == "status":
+                writer.write(pack_json(FRAME_RESULT, await self._status()))
+            elif op == "generate":
+                await self._generate(request, writer)
+            elif op == "embed":
+                vectors = await self.manager.embed(request["texts"],
+                                                   Priority(request.get("priority", Priority.INTERACTIVE)),
+                                                   request.get("client", ""))
+                writer.write(pack_json(FRAME_RESULT, pack_matrix(vectors)))
+            elif op == "discard":
+                self.manager.discard_session(request["session_id"])
+                writer.write(pack_json(FRAME_RESULT, {}))
+            else:
+                raise ValueError(f"Unknown op '{op}'")
+
+            await writer.drain()
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass # Client disconnected
+        
+        except asyncio.TimeoutError:
+            pass # Past the client's deadline, it has stopped waiting
+
+        except Exception as e:
+            print(f"Model Server Error: {e}")
+            try:
+                writer.write(pack_frame(FRAME_ERROR, str(e).encode()))
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """Listen on the Unix socket until cancelled"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path) # Stale socket from a previous run
+
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        print(f"✨ Model server listening on {self.socket_path}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+def main():
+    """Load the model once and serve it to API workers"""
+    manager = ModelManager(config=settings)
+    manager.load_model()
+    if not manager.is_loaded:
+        return
+
+    try:
+        asyncio.run(ModelServer(manager, settings.MODEL_SERVER_SOCKET).serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("👋 Shutting down model server...")
+        manager.shutdown()
@@ -1,11 +1,24 @@
 from typing import List, Dict, Optional, Any  # <-- Added Any
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from enum import Enum
 
+from app.core.config import settings
+
 # ============================================================================
 # ENUMS
 # ============================================================================
 
+class JobKind(str, Enum):
+    """Work that can be submitted as an async job"""
+    BATCH = "batch"
+    SUMMARIZE = "summarize"
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 class QueryType(str, Enum):
     """Supported query types based on your fine-tuning"""
     DESCRIPTIVE = "descriptive"
@@ -52,6 +65,21 @@ class ChatRequest(BaseModel):
             }
         }
 
+class UsageInfo(BaseModel):
+    """
+    Where a response's time went. Token counts and prefill/decode come from
+    the inference engine, queue_wait_ms from the scheduler, the rest from the
+    API; stages that did not run (e.g. generation on a cache hit) are omitted.
+    """
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_prompt_tokens: Optional[int] = None  # Prompt tokens whose KV state was reused
+    cache_lookup_ms: Optional[float] = None
+    prompt_build_ms: Optional[float] = None
+    queue_wait_ms: Optional[float] = None
+    prefill_ms: Optional[float] = None  # Until the first generated token
+    decode_ms: Optional[float] = None   # First token to the last
+
 class ChatResponse(BaseModel):
     """Response for single chat query, includes conversation_id"""
     query: str
@@ -60,17 +88,18 @@ class ChatResponse(BaseModel):
     query_type: Optional[str]
     processing_time_ms: float
     cached: bool = False
+    usage: Optional[UsageInfo] = None
     model_info: Dict[str, Any]  # <-- FIX: Was 'any'
 
 # ============================================================================
-# BATCH MODELS (Unchanged)
+# BATCH MODELS
 # ============================================================================
 
 class BatchQueryRequest(BaseModel):
     """Batch inference for multiple queries on same policy"""
     policy_text: str = Field(..., min_length=10, max_length=50000)
-    queries: List[str] = Field(..., min_items=1, max_items=10,
-                               description="Multiple questions to process")
+    queries: List[str] = Field(..., min_items=1, max_items=settings.BATCH_MAX_QUERIES,
+                               description="Multiple questions to process (duplicates are answered once)")
     query_types: Optional[List[QueryType]] = None
     temperature: Optional[float] = Field(0.7, ge=0.0, le=2.0)
     max_tokens: Optional[int] = Field(512, ge=50, le=4096)
@@ -78,15 +107,17 @@ class BatchQueryRequest(BaseModel):
     
     @field_validator('query_types')
     def validate_query_types(cls, v, info):
-        if 'values' in info:  # Pydantic v2 compatibility
-             queries = info.data.get('queries', [])
-        else:
-            queries = info.get('queries', [])
+        queries = info.data.get('queries', [])
 
         if v is not None and len(v) != len(queries):
             raise ValueError("query_types length must match queries length")
         return v
 
+class BatchStreamRequest(BatchQueryRequest):
+    """Large batch answered over NDJSON as each query finishes (/batch-query/stream)"""
+    queries: List[str] = Field(..., min_items=1, max_items=settings.BATCH_STREAM_MAX_QUERIES,
+                               description="Questions to process; results stream in completion order")
+
 class BatchQueryResponse(BaseModel):
     """Response for a single query within a batch"""
     query: str
@@ -94,6 +125,9 @@ class BatchQueryResponse(BaseModel):
     query_type: Optional[str]
     processing_time_ms: float
     cached: bool = False
+    duplicate_of: Optional[int] = None  # Index of the identical earlier query this answer was shared from
+    error: Optional[str] = None  # Why this query has no response; the rest of the batch is unaffected
+    usage: Optional[UsageInfo] = None
     model_info: Dict[str, Any]  # <-- FIX: Was 'any'
 
 class BatchResponse(BaseModel):
@@ -112,6 +146,68 @@ class HealthResponse(BaseModel):
     model_loaded: bool
     uptime_seconds: float
     total_requests: int
+    aborted_requests: Dict[str, int] = Field(default_factory=dict)  # Cut short by disconnects / deadlines
     active_conversations: int
     response_cache_stats: Dict[str, Any]  # <-- FIX: Was 'any'
-    system_info: Dict[str, Any]           # <-- FIX: Was 'any'
\ No newline at end of file
+    system_info: Dict[str, Any]           # <-- FIX: Was 'any'
+    replicas: List[Dict[str, Any]] = Field(default_factory=list)
+    scheduler: Dict[str, Any] = Field(default_factory=dict)  # Queue depth and wait time per priority class
+    jobs: Dict[str, int] = Field(default_factory=dict)  # Async jobs by status
+
+# ============================================================================
+# SUMMARIZATION MODELS
+# ============================================================================
+
+class SummarizeRequest(BaseModel):
+    """Whole-document summary, map-reduced when the policy exceeds the context window"""
+    policy_text: str = Field(..., min_length=10, max_length=500000,
+                             description="Insurance policy document text (any length)")
+    temperature: Optional[float] = Field(0.3, ge=0.0, le=2.0)
+    max_tokens: Optional[int] = Field(512, ge=50, le=2048, description="Length of the final summary")
+    stream: bool = Field(False, description="Stream progress events and the summary over SSE")
+    use_cache: bool = Field(True, description="Reuse cached section and document summaries")
+
+class SummarizeResponse(BaseModel):
+    """Final summary with how it was assembled"""
+    summary: str
+    sections_total: int
+    sections_cached: int
+    reduce_passes: int
+    processing_time_ms: float
+    cached: bool = False
+
+# ============================================================================
+# ASYNC JOB MODELS
+# ============================================================================
+
+class JobRequest(BaseModel):
+    """A batch or summarize request to run in the background; poll /jobs/{job_id} for progress"""
+    kind: JobKind
+    batch: Optional[BatchStreamRequest] = Field(None, description="Required when kind is 'batch'")
+    summarize: Optional[SummarizeRequest] = Field(None, description="Required when kind is 'summarize'")
+
+    @model_validator(mode="after")
+    def validate_payload(self):
+        if getattr(self, self.kind.value) is None:
+            raise ValueError(f"'{self.kind.value}' is required when kind is '{self.kind.value}'")
+        return self
+
+class JobResponse(BaseModel):
+    """State of an async job"""
+    job_id: str
+    kind: JobKind
+    status: JobStatus
+    completed: int  # Queries answered (batch) or sections summarized (summarize)
+    total: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+class JobResultsResponse(BaseModel):
+    """Finished results of an async job; batch results are paged by input index"""
+    job_id: str
+    status: JobStatus
+    results: List[Dict[str, Any]] = Field(default_factory=list)  # Batch: one entry per answered query
+    summary: Optional[Dict[str, Any]] = None  # Summarize: the SummarizeResponse fields
+    next_offset: Optional[int] = None
@@ -0,0 +1,547 @@
+import time
+import queue
+import ctypes
+import codecs
+import hashlib
+from typing import List, Optional, Any, Callable, Tuple
+
+import numpy as np
+import llama_cpp
+from llama_cpp import Llama
+
+from app.services.byte_lru import ByteBoundedLRU
+from app.services.inference_backend import phase_timings
+
+def _resolve(*names: str) -> Callable:
+    """Return the first of several llama_cpp functions (the C API renames them between releases)"""
+    for name in names:
+        fn = getattr(llama_cpp, name, None)
+        if fn is not None:
+            return fn
+    raise AttributeError(f"llama_cpp provides none of: {', '.join(names)}")
+
+def _common_prefix(a: List[int], b: List[int]) -> int:
+    """Length of the shared token prefix of a and b"""
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+def _partial_stop(text: str, stops: List[str]) -> int:
+    """Length of the longest tail of text that could still grow into a stop string"""
+    longest = 0
+    for stop in stops:
+        for size in range(min(len(stop) - 1, len(text)), longest, -1):
+            if text.endswith(stop[:size]):
+                longest = size
+                break
+    return longest
+
+def sample_token(logits: np.ndarray, temperature: float, top_p: float,
+                 top_k: int, rng: np.random.Generator) -> int:
+    """Temperature / top-k / top-p sampling, matching llama.cpp's defaults"""
+    if temperature <= 0:
+        return int(np.argmax(logits))
+
+    k = min(top_k, logits.size)
+    candidates = np.argpartition(logits, -k)[-k:]
+    scaled = logits[candidates] / temperature
+    order = np.argsort(-scaled)
+    candidates, scaled = candidates[order], scaled[order]
+
+    probs = np.exp(scaled - scaled[0])
+    probs /= probs.sum()
+    keep = int(np.searchsorted(np.cumsum(probs), top_p)) + 1
+    probs = probs[:keep] / probs[:keep].sum()
+    return int(rng.choice(candidates[:keep], p=probs))
+
+class SequenceSnapshot:
+    """KV cells of one sequence plus the tokens they cover"""
+
+    def __init__(self, tokens: List[int], data: bytes):
+        self.tokens = tokens
+        self.data = data
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + 4 * len(self.tokens)
+
+class LlamaBatchContext:
+    """
+    A multi-sequence llama.cpp context over an already loaded model.
+    Thin wrapper around the low-level batch, KV-cache and sequence-state calls.
+    """
+
+    def __init__(self, llm: Llama, n_seq: int, n_ctx_per_seq: int, n_batch: int, n_threads: int):
+        self.n_batch = n_batch
+        self.n_vocab = llm.n_vocab()
+
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx_per_seq * n_seq
+        params.n_batch = n_batch
+        params.n_seq_max = n_seq
+        params.n_threads = n_threads
+        params.n_threads_batch = n_threads
+        if hasattr(params, "n_ubatch"):
+            params.n_ubatch = n_batch
+        if hasattr(params, "kv_unified"):
+            params.kv_unified = True # Sequences share prefix cells through seq_cp
+
+        new_context = _resolve("llama_init_from_model", "llama_new_context_with_model")
+        self.ctx = new_context(llm.model, params)
+        if not self.ctx:
+            raise RuntimeError("Failed to create the batched llama.cpp context")
+        self.batch = llama_cpp.llama_batch_init(n_batch, 0, 1)
+
+        if hasattr(llama_cpp, "llama_get_memory"):
+            memory = llama_cpp.llama_get_memory(self.ctx)
+            self._seq_rm = lambda seq, p0, p1: llama_cpp.llama_memory_seq_rm(memory, seq, p0, p1)
+            self._seq_cp = lambda src, dst, p0, p1: llama_cpp.llama_memory_seq_cp(memory, src, dst, p0, p1)
+        else:
+            seq_rm = _resolve("llama_kv_self_seq_rm", "llama_kv_cache_seq_rm")
+            seq_cp = _resolve("llama_kv_self_seq_cp", "llama_kv_cache_seq_cp")
+            self._seq_rm = lambda seq, p0, p1: seq_rm(self.ctx, seq, p0, p1)
+            self._seq_cp = lambda src, dst, p0, p1: seq_cp(self.ctx, src, dst, p0, p1)
+
+    def decode(self, entries: List[Tuple[int, int, int, bool]]) -> int:
+        """Evaluate (token, position, seq_id, want_logits) entries in a single llama_decode"""
+        batch = self.batch
+        for i, (token, pos, seq_id, want_logits) in enumerate(entries):
+            batch.token[i] = token
+            batch.pos[i] = pos
+            batch.n_seq_id[i] = 1
+            batch.seq_id[i][0] = seq_id
+            batch.logits[i] = int(want_logits)
+        batch.n_tokens = len(entries)
+        return llama_cpp.llama_decode(self.ctx, batch)
+
+    def logits(self, index: int) -> np.ndarray:
+        """Logits of the index-th entry of the last decoded batch"""
+        ptr = llama_cpp.llama_get_logits_ith(self.ctx, index)
+        return np.ctypeslib.as_array(ptr, shape=(self.n_vocab,)).copy()
+
+    def seq_rm(self, seq_id: int, p0: int = 0, p1: int = -1):
+        """Drop KV cells of seq_id in positions [p0, p1)"""
+        self._seq_rm(seq_id, p0, p1)
+
+    def seq_cp(self, src: int, dst: int, p0: int, p1: int):
+        """Share src's KV cells in positions [p0, p1) with dst (no copy in a unified cache)"""
+        self._seq_cp(src, dst, p0, p1)
+
+    def seq_state_size(self, seq_id: int) -> int:
+        """Bytes save_seq would produce for seq_id (cheap, nothing is copied)"""
+        return llama_cpp.llama_state_seq_get_size(self.ctx, seq_id)
+
+    def save_seq(self, seq_id: int) -> bytes:
+        """Serialize the KV cells of one sequence"""
+        size = self.seq_state_size(seq_id)
+        buffer = (ctypes.c_uint8 * size)()
+        written = llama_cpp.llama_state_seq_get_data(self.ctx, buffer, size, seq_id)
+        return bytes(memoryview(buffer)[:written])
+
+    def load_seq(self, seq_id: int, data: bytes) -> bool:
+        """Restore serialized KV cells into an (empty) sequence"""
+        buffer = (ctypes.c_uint8 * len(data)).from_buffer_copy(data)
+        return llama_cpp.llama_state_seq_set_data(self.ctx, buffer, len(data), seq_id) > 0
+
+    def close(self):
+        llama_cpp.llama_batch_free(self.batch)
+        llama_cpp.llama_free(self.ctx)
+
+class _Slot:
+    """One sequence of the running batch and the KV cells it holds"""
+
+    def __init__(self, seq_id: int):
+        self.seq_id = seq_id
+        self.cache_tokens: List[int] = [] # Tokens whose KV cells are in this sequence
+        self.last_used = 0.0
+        self.job = None
+        # Conversation whose latest state these cells hold; snapshotted only when
+        # another request is about to overwrite them
+        self.resident_session: Optional[str] = None
+
+    def start(self, job: Any, prompt_tokens: List[int], n_reused: int, max_tokens: int):
+        self.job = job
+        self.resident_session = None
+        self.pending = prompt_tokens[n_reused:] # Tokens still to be evaluated
+        self.n_prompt = len(prompt_tokens)
+        self.n_reused = n_reused
+        self.max_tokens = max_tokens
+        self.prefilled = False
+        self.prompt_tokens = prompt_tokens
+        self.speculative = bool(getattr(job.params, "speculative", False))
+        self.drafted = 0 # Speculative tokens proposed / accepted
+        self.accepted = 0
+        self.generated: List[int] = []
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.text = ""
+        self.emitted = 0
+        self.prefix_save: Optional[Tuple[str, int]] = None # (cache key, prefix length) to snapshot
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+
+class BatchEngine:
+    """
+    Continuous batching for one replica. Sequences join and leave the running
+    batch between decode steps, so concurrent requests share every llama_decode
+    call instead of queueing behind each other.
+    """
+
+    TOP_K = 40
+
+    def __init__(self, llm: Llama, on_done: Callable[[], None], n_seq: int,
+                 n_ctx_per_seq: int, n_batch: int, n_threads: int,
+                 prefix_cache: Optional[ByteBoundedLRU] = None,
+                 session_cache: Optional[ByteBoundedLRU] = None,
+                 draft_tokens: int = 0, ngram_size: int = 3):
+        self.llm = llm
+        self.on_done = on_done
+        self.n_seq = n_seq
+        self.n_ctx_per_seq = n_ctx_per_seq
+        self.context = LlamaBatchContext(llm, n_seq, n_ctx_per_seq, n_batch, n_threads)
+        self.slots = [_Slot(seq_id) for seq_id in range(n_seq)]
+        self.prefix_cache = prefix_cache
+        self.session_cache = session_cache
+        self.draft_tokens = draft_tokens
+        self.ngram_size = ngram_size
+        self.eos = llm.token_eos()
+        self.rng = np.random.default_rng()
+
+    @property
+    def n_active(self) -> int:
+        return sum(1 for slot in self.slots if slot.job is not None)
+
+    # ------------------------------------------------------------------
+    # Main loop
+    # ------------------------------------------------------------------
+
+    def serve(self, jobs: queue.Queue, run_other: Callable[[Any], None]):
+        """
+        Run on the replica thread until a None job arrives. Generation jobs are
+        admitted into free slots; anything else (tokenize, embed...) runs inline.
+        """
+        while True:
+            while self.n_active < self.n_seq:
+                try:
+                    # Block only when there is nothing to decode
+                    job = jobs.get(block=self.n_active == 0)
+                except queue.Empty:
+                    break
+
+                if job is None:
+                    self._shutdown()
+                    return
+                if getattr(job, "params", None) is None:
+                    run_other(job)
+                else:
+                    self._admit(job)
+
+            if self.n_active:
+                self._step()
+
+    def _shutdown(self):
+        for slot in self.slots:
+            if slot.job is not None:
+                self._retire(slot, error=RuntimeError("Inference engine shut down"))
+        self.context.close()
+
+    # ------------------------------------------------------------------
+    # Admission and KV reuse
+    # ------------------------------------------------------------------
+
+    def _admit(self, job: Any):
+        params = job.params
+        if job.cancelled.is_set():
+            job.finish()
+            self.on_done()
+            return
+
+        try:
+            tokens = self.llm.tokenize(params.prompt.encode("utf-8"))
+            if len(tokens) >= self.n_ctx_per_seq:
+                raise ValueError(f"Requested tokens ({len(tokens)}) exceed context window of {self.n_ctx_per_seq}")
+        except Exception as e:
+            job.fail(e)
+            self.on_done()
+            return
+
+        # Prefer the free slot whose cached tokens match this prompt the longest
+        slot = max(
+            (s for s in self.slots if s.job is None),
+            key=lambda s: (_common_prefix(s.cache_tokens, tokens), -s.last_used)
+        )
+        if params.session_id:
+            # This turn supersedes any state of the conversation left in other slots
+            for other in self.slots:
+                if other is not slot and other.resident_session == params.session_id:
+                    other.resident_session = None
+        if slot.resident_session is not None and slot.resident_session != params.session_id:
+            self._save_session(slot) # Its cells are about to be overwritten
+        n_reused, prefix_save = self._reuse_kv(slot, tokens, params)
+        max_tokens = min(params.max_tokens, self.n_ctx_per_seq - len(tokens))
+        slot.start(job, tokens, n_reused, max_tokens)
+        slot.prefix_save = prefix_save
+
+    def _snapshot(self, slot: _Slot, cache: ByteBoundedLRU) -> Optional[SequenceSnapshot]:
+        """The slot's KV cells, or None when they would not fit in cache anyway (checked before copying)"""
+        if self.context.seq_state_size(slot.seq_id) + 4 * len(slot.cache_tokens) > cache.max_bytes:
+            return None
+        return SequenceSnapshot(list(slot.cache_tokens), self.context.save_seq(slot.seq_id))
+
+    def _save_session(self, slot: _Slot):
+        """Snapshot the conversation state a slot still holds, before its cells are reused"""
+        session_id, slot.resident_session = slot.resident_session, None
+        snapshot = self._snapshot(slot, self.session_cache)
+        if snapshot is not None:
+            self.session_cache.put(session_id, snapshot, snapshot.nbytes)
+
+    def _prefix_key(self, prefix: str) -> Tuple[List[int], str]:
+        prefix_tokens = self.llm.tokenize(prefix.encode("utf-8"))
+        key = hashlib.sha256(np.asarray(prefix_tokens, dtype=np.int32).tobytes()).hexdigest()
+        return prefix_tokens, key
+
+    def _reuse_kv(self, slot: _Slot, tokens: List[int], params: Any) -> Tuple[int, Optional[Tuple[str, int]]]:
+        """
+        Seed the slot's KV cells with the longest available prefix of tokens:
+        its own leftovers, another sequence's cells, the conversation snapshot
+        or the shared policy-prefix snapshot. Returns (tokens reused, prefix to save).
+        """
+        best = _common_prefix(slot.cache_tokens, tokens)
+        source_slot: Optional[_Slot] = None
+        snapshot: Optional[SequenceSnapshot] = None
+
+        for other in self.slots:
+            if other is not slot:
+                n = _common_prefix(other.cache_tokens, tokens)
+                if n > best:
+                    best, source_slot = n, other
+
+        if params.session_id and self.session_cache is not None:
+            candidate = self.session_cache.get(params.session_id)
+            if isinstance(candidate, SequenceSnapshot):
+                n = _common_prefix(candidate.tokens, tokens)
+                if n > best:
+                    best, source_slot, snapshot = n, None, candidate
+
+        prefix_save = None
+        if params.prefix and self.prefix_cache is not None:
+            prefix_tokens, key = self._prefix_key(params.prefix)
+            n_prefix = _common_prefix(prefix_tokens, tokens)
+            if best >= n_prefix:
+                self.prefix_cache.touch(key)
+            else:
+                candidate = self.prefix_cache.get(key)
+                if isinstance(candidate, SequenceSnapshot):
+                    n = _common_prefix(candidate.tokens, tokens)
+                    if n > best:
+                        best, source_slot, snapshot = n, None, candidate
+                else:
+                    prefix_save = (key, n_prefix)
+
+        # Always leave at least one prompt token to evaluate so we get logits
+        best = min(best, len(tokens) - 1)
+
+        if source_slot is not None:
+            self.context.seq_rm(slot.seq_id)
+            self.context.seq_cp(source_slot.seq_id, slot.seq_id, 0, best)
+        elif snapshot is not None:
+            self.context.seq_rm(slot.seq_id)
+            if not self.context.load_seq(slot.seq_id, snapshot.data):
+                self.context.seq_rm(slot.seq_id)
+                best = 0
+
+        self.context.seq_rm(slot.seq_id, best, -1)
+        slot.cache_tokens = tokens[:best]
+        return best, prefix_save
+
+    # ------------------------------------------------------------------
+    # Decoding
+    # ------------------------------------------------------------------
+
+    def _step(self):
+        """Build one batch from every active sequence and decode it"""
+        for slot in self.slots:
+            if slot.job is not None and slot.job.cancelled.is_set():
+                self._retire(slot, "cancelled")
+
+        active = [s for s in self.slots if s.job is not None]
+        # Sequences that are generating go first: one token each keeps their latency flat,
+        # prompt prefill fills whatever room is left in the batch
+        active.sort(key=lambda s: not s.prefilled)
+
+        entries: List[Tuple[int, int, int, bool]] = []
+        plan: List[Tuple[_Slot, int, int, Optional[int]]] = []
+        budget = self.context.n_batch
+
+        for slot in active:
+            if budget == 0:
+                break
+            n_draft = 0
+            if slot.prefilled and slot.speculative:
+                draft = self._draft(slot, budget - 1)
+                slot.pending.extend(draft)
+                n_draft = len(draft)
+
+            n = min(budget, len(slot.pending))
+            if slot.prefix_save and len(slot.cache_tokens) < slot.prefix_save[1]:
+                # Stop exactly at the end of the policy prefix so it can be snapshotted
+                n = min(n, slot.prefix_save[1] - len(slot.cache_tokens))
+
+            done_prompt = n == len(slot.pending)
+            start = len(slot.cache_tokens)
+            # Draft tokens need logits too: each one is checked against the model's own pick
+            first_logits = n - 1 - n_draft
+            for i in range(n):
+                entries.append((slot.pending[i], start + i, slot.seq_id, done_prompt and i >= first_logits))
+            plan.append((slot, n, n_draft, len(entries) - 1 - n_draft if done_prompt else None))
+            budget -= n
+
+        if not entries:
+            return
+
+        result = self.context.decode(entries)
+        if result != 0:
+            for slot, _, _, _ in plan:
+                self.context.seq_rm(slot.seq_id, len(slot.cache_tokens), -1)
+                self._retire(slot, error=RuntimeError(f"llama_decode failed ({result}): KV cache is full"))
+            return
+
+        for slot, n, n_draft, logits_index in plan:
+            slot.cache_tokens.extend(slot.pending[:n])
+            del slot.pending[:n]
+
+            if slot.prefix_save and len(slot.cache_tokens) == slot.prefix_save[1]:
+                key = slot.prefix_save[0]
+                slot.prefix_save = None
+                snapshot = self._snapshot(slot, self.prefix_cache)
+                if snapshot is not None:
+                    self.prefix_cache.put(key, snapshot, snapshot.nbytes)
+
+            if logits_index is not None:
+                slot.prefilled = True
+                self._sample(slot, logits_index, n_draft)
+
+    def _draft(self, slot: _Slot, limit: int) -> List[int]:
+        """
+        Prompt-lookup drafting: find the latest earlier occurrence of the last
+        few tokens in the prompt or output and propose the tokens that followed it
+        """
+        limit = min(limit, self.draft_tokens,
+                    slot.max_tokens - len(slot.generated) - 1,
+                    self.n_ctx_per_seq - len(slot.cache_tokens) - 1)
+        if limit <= 0:
+            return []
+
+        history = np.asarray(slot.prompt_tokens + slot.generated, dtype=np.int32)
+        for n in range(min(self.ngram_size, len(history) - 1), 0, -1):
+            windows = np.lib.stride_tricks.sliding_window_view(history[:-1], n)
+            matches = np.flatnonzero((windows == history[-n:]).all(axis=1))
+            if matches.size:
+                start = int(matches[-1]) + n
+                return history[start:start + limit].tolist()
+        return []
+
+    def _sample(self, slot: _Slot, logits_index: int, n_draft: int):
+        """
+        Sample the next token. With a draft, keep sampling along it while the
+        model agrees, so one decode can yield several tokens; the first
+        disagreement is itself a valid sample and ends the step.
+        """
+        params = slot.job.params
+        draft = slot.cache_tokens[len(slot.cache_tokens) - n_draft:]
+        tokens: List[int] = []
+        for i in range(n_draft + 1):
+            token = sample_token(self.context.logits(logits_index + i), params.temperature,
+                                 params.top_p, self.TOP_K, self.rng)
+            tokens.append(token)
+            if i == n_draft or token != draft[i]:
+                break
+
+        if n_draft:
+            n_accepted = len(tokens) - 1
+            slot.drafted += n_draft
+            slot.accepted += n_accepted
+            # Drop the KV cells of rejected draft tokens
+            keep = len(slot.cache_tokens) - n_draft + n_accepted
+            self.context.seq_rm(slot.seq_id, keep, -1)
+            del slot.cache_tokens[keep:]
+
+        for token in tokens:
+            self._accept(slot, token)
+            if slot.job is None:
+                break
+
+    def _accept(self, slot: _Slot, token: int):
+        """Append a sampled token, handling EOS, stop strings and max_tokens"""
+        if token == self.eos:
+            self._retire(slot, "stop")
+            return
+
+        if slot.first_token_at is None:
+            slot.first_token_at = time.perf_counter()
+        slot.generated.append(token)
+        slot.text += slot.decoder.decode(self.llm.detokenize([token]))
+        stops = slot.job.params.stop
+
+        search_from = max(0, slot.emitted - max((len(s) for s in stops), default=0))
+        hits = [i for i in (slot.text.find(s, search_from) for s in stops) if i >= 0]
+        if hits:
+            slot.text = slot.text[:min(hits)]
+            self._retire(slot, "stop")
+        elif len(slot.generated) >= slot.max_tokens:
+            self._retire(slot, "length")
+        else:
+            self._flush(slot, len(slot.text) - _partial_stop(slot.text, stops))
+            slot.pending = [token]
+
+    def _flush(self, slot: _Slot, upto: int):
+        """Stream text up to the given offset"""
+        if upto > slot.emitted:
+            if slot.job.stream:
+                chunk = slot.text[slot.emitted:upto]
+                slot.job.emit({'choices': [{'text': chunk, 'index': 0, 'finish_reason': None}]})
+            slot.emitted = upto
+
+    def _retire(self, slot: _Slot, finish_reason: Optional[str] = None, error: Optional[Exception] = None):
+        """Remove a sequence from the batch; its KV cells stay for prefix reuse"""
+        job = slot.job
+        if error is not None:
+            job.fail(error)
+        elif finish_reason == "cancelled":
+            job.finish()
+        else:
+            self._complete(slot, finish_reason)
+
+        slot.job = None
+        slot.last_used = time.time()
+        self.on_done()
+
+    def _complete(self, slot: _Slot, finish_reason: str):
+        job = slot.job
+        usage = {
+            'prompt_tokens': slot.n_prompt,
+            'completion_tokens': len(slot.generated),
+            'total_tokens': slot.n_prompt + len(slot.generated),
+            'cached_prompt_tokens': slot.n_reused,
+            # Wall time on the replica; other sequences' steps run in the same decode calls
+            **phase_timings(slot.started, slot.first_token_at)
+        }
+        if slot.speculative:
+            usage['speculative'] = {
+                'drafted_tokens': slot.drafted,
+                'accepted_tokens': slot.accepted,
+                'acceptance_rate': round(slot.accepted / slot.drafted, 3) if slot.drafted else 0.0
+            }
+
+        if job.stream:
+            self._flush(slot, len(slot.text))
+            job.emit({'choices': [{'text': '', 'index': 0, 'finish_reason': finish_reason}], 'usage': usage})
+            job.finish()
+        else:
+            job.finish({'choices': [{'text': slot.text, 'index': 0, 'finish_reason': finish_reason}], 'usage': usage})
+
+        if job.params.session_id and self.session_cache is not None:
+            # The cells stay in the slot, where a follow-up on this replica reuses them
+            # directly; serializing them waits until the slot is needed for another request
+            slot.resident_session = job.params.session_id
@@ -0,0 +1,161 @@
+import time
+import asyncio
+from typing import List, Dict, Tuple, Optional
+
+from app.models.api_models import BatchQueryRequest, BatchQueryResponse
+from app.services.model_service import model_manager
+from app.services.cache_service import response_cache
+from app.services.metrics_service import inference_metrics
+from app.services.scheduler import Priority
+from app.services.flight_service import generation_flights, flight_key
+from app.core.timing import response_usage
+
+# Answering one query of a batch, shared by /batch-query, its streaming
+# variant and batch jobs
+
+def normalize_query(query: str) -> str:
+    """Case and whitespace do not change the answer, so they do not make a query distinct"""
+    return " ".join(query.split()).casefold()
+
+def model_info_for(request: BatchQueryRequest) -> Dict:
+    return {
+        "model": "mistral-7b-insurance-finetune",
+        "temperature": request.temperature,
+        "max_tokens": request.max_tokens
+    }
+
+def query_params(request: BatchQueryRequest, query_type) -> Dict:
+    return {
+        'temperature': request.temperature,
+        'max_tokens': request.max_tokens,
+        'query_type': query_type
+    }
+
+async def cached_answer(request: BatchQueryRequest, query: str, query_type) -> Optional[BatchQueryResponse]:
+    """The cached answer to one query, or None"""
+    if not request.use_cache:
+        return None
+    lookup_start = time.time()
+    cached_response = await response_cache.get_async(request.policy_text, query, query_params(request, query_type))
+    if cached_response is None:
+        return None
+    lookup_time = time.time() - lookup_start
+    inference_metrics.observe("batch", query_type, True, lookup_time)
+    return BatchQueryResponse(
+        query=query,
+        response=cached_response,
+        query_type=query_type,
+        processing_time_ms=round(lookup_time * 1000, 2),
+        cached=True,
+        usage=response_usage(cache_lookup_ms=lookup_time * 1000),
+        model_info=model_info_for(request)
+    )
+
+async def generate_answer(request: BatchQueryRequest, query: str, query_type,
+                          deadline: Optional[float], client: str,
+                          priority: Priority = Priority.BATCH, endpoint: str = "batch") -> BatchQueryResponse:
+    """Run one cache miss through the model and cache the answer (endpoint labels the metrics)"""
+    query_start = time.time()
+
+    # Generate (using the *non-chat* prompt creator)
+    chat_prompt = await model_manager.create_chat_prompt(
+        request.policy_text, 
+        query, 
+        history=[],  # No history for batch
+        query_type=query_type,
+        max_tokens=request.max_tokens,
+        priority=priority,
+        client=client
+    )
+    generation_start = time.time()
+    prompt_build_ms = (generation_start - query_start) * 1000
+    params = query_params(request, query_type)
+
+    def cache_answer(text: str):
+        response_cache.set(request.policy_text, query, params, text)
+
+    # Joins an identical query already generating for another batch or job
+    flight, shared = generation_flights.join(
+        flight_key(response_cache.request_key(request.policy_text, query, params), [], priority)
+        if request.use_cache else None,
+        lambda: model_manager.generate(
+            chat_prompt.prompt, 
+            request.temperature, 
+            chat_prompt.max_tokens, 
+            stream=True,
+            prefix=chat_prompt.prefix,  # Shared by every query in the batch when the policy fits
+            speculative=model_manager.use_speculative(query_type),
+            deadline=deadline,
+            # Queued behind interactive chat, and shared fairly with other clients' batches
+            priority=priority,
+            client=client
+        ),
+        on_complete=cache_answer if request.use_cache else None
+    )
+    result = await flight.result(deadline)
+    response_text = result['choices'][0]['text'].strip()
+    
+    model_info = model_info_for(request)
+    model_info["prompt_tokens"] = chat_prompt.token_counts
+    usage = result.get('usage') or {}
+    if 'speculative' in usage:
+        model_info["speculative"] = usage['speculative']
+    if shared:
+        model_info["shared_generation"] = True
+    
+    end = time.time()
+    inference_metrics.observe(endpoint, query_type, False, end - query_start,
+                              usage=usage, generation_seconds=end - generation_start)
+    return BatchQueryResponse(
+        query=query,
+        response=response_text,
+        query_type=query_type,
+        processing_time_ms=round((end - query_start) * 1000, 2),
+        cached=False,
+        usage=response_usage(usage, prompt_build_ms=prompt_build_ms),
+        model_info=model_info
+    )
+
+def failed_answer(request: BatchQueryRequest, query: str, query_type, error: str,
+                  elapsed: float) -> BatchQueryResponse:
+    """The result of a query whose generation failed, so its batch can still be returned"""
+    return BatchQueryResponse(
+        query=query,
+        response="",
+        query_type=query_type,
+        processing_time_ms=round(elapsed * 1000, 2),
+        error=error,
+        model_info=model_info_for(request)
+    )
+
+def plan_batch(request: BatchQueryRequest) -> Tuple[List[int], List[Optional[int]]]:
+    """
+    (indices of the distinct queries, and for every query the index of the
+    first identical one or None). Queries are identical when their
+    normalized text and query type match.
+    """
+    first: Dict[tuple, int] = {}
+    unique, duplicate_of = [], []
+    for idx, query in enumerate(request.queries):
+        query_type = request.query_types[idx] if request.query_types else None
+        key = (normalize_query(query), query_type)
+        if key in first:
+            duplicate_of.append(first[key])
+        else:
+            first[key] = idx
+            unique.append(idx)
+            duplicate_of.append(None)
+    return unique, duplicate_of
+
+async def answer_query(request: BatchQueryRequest, query: str, query_type,
+                       deadline: Optional[float], client: str) -> BatchQueryResponse:
+    """Cached answer if there is one, otherwise a generated one"""
+    cached = await cached_answer(request, query, query_type)
+    if cached is not None:
+        return cached
+    return await generate_answer(request, query, query_type, deadline, client)
+
+async def shared_answer(task: asyncio.Future, query: str, first_idx: int) -> BatchQueryResponse:
+    """A repeat of an in-flight query: wait for the first one's answer"""
+    result = await asyncio.shield(task)
+    return result.model_copy(update={'query': query, 'duplicate_of': first_idx})
@@ -0,0 +1,107 @@
+import time
+import threading
+from typing import Dict, Optional, Any
+from collections import OrderedDict
+
+class ByteBoundedLRU:
+    """
+    LRU store for in-process objects whose size the caller knows, capped by
+    total bytes: llama.cpp state snapshots (KV cache + tokens) and per-document
+    embedding indexes. Touched from inference threads, so all access goes
+    through a lock. With ttl_seconds, entries unused that long are dropped.
+    """
+    
+    def __init__(self, max_bytes: int, ttl_seconds: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.entries: OrderedDict = OrderedDict()  # key -> (value, nbytes, last use monotonic), oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return the value for key and mark it most recently used"""
+        with self.lock:
+            self._expire()
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries[key] = (entry[0], entry[1], time.monotonic())
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def touch(self, key: str):
+        """Record a use of a value the caller already holds (e.g. a state resident in a replica)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries[key] = (entry[0], entry[1], time.monotonic())
+                self.entries.move_to_end(key)
+            self.hits += 1
+    
+    def put(self, key: str, value: Any, nbytes: int):
+        """Store a value, evicting least recently used ones past the byte cap"""
+        if nbytes > self.max_bytes:
+            return # Would evict everything and still not fit
+        
+        with self.lock:
+            self._expire()
+            self._remove(key)
+            self.entries[key] = (value, nbytes, time.monotonic())
+            self.total_bytes += nbytes
+            
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_bytes, _) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+                self.evictions += 1
+    
+    def _expire(self):
+        """Drop entries past the TTL; least recently used come first, so stop at the first live one"""
+        if self.ttl is None:
+            return
+        cutoff = time.monotonic() - self.ttl
+        while self.entries:
+            key, (_, nbytes, used_at) = next(iter(self.entries.items()))
+            if used_at >= cutoff:
+                break
+            del self.entries[key]
+            self.total_bytes -= nbytes
+    
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+    
+    def discard(self, key: str):
+        """Drop an entry (e.g. the snapshot of an expired conversation)"""
+        with self.lock:
+            self._remove(key)
+    
+    def get_stats(self) -> Dict:
+        """Return cache statistics"""
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total > 0 else 0
+        
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate_percent': round(hit_rate, 2),
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'size_mb': round(self.total_bytes / (1024 * 1024), 2),
+            'size_bytes': self.total_bytes,
+            'max_size_mb': round(self.max_bytes / (1024 * 1024), 2)
+        }
+    
+    def clear(self):
+        """Drop all entries"""
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
@@ -1,99 +1,241 @@
-import time
+import os
+import re
 import json
+import math
+import asyncio
 import hashlib
-from typing import List, Dict, Optional, Any
-from datetime import datetime, timedelta
-from collections import deque
+from typing import List, Dict, Optional
+from collections import Counter
 from app.core.config import settings
+from app.services.prompt_builder import PROMPT_VERSION
+from app.services.cache_store import CacheStore, create_cache_store
+
+# Policies are hashed a slice at a time so a long document is never
+# encoded to one large bytes copy just to key the cache
+_HASH_SLICE_CHARS = 64 * 1024
+
+def document_digest(text: str) -> str:
+    """SHA-256 of the whole document, fed in slices"""
+    digest = hashlib.sha256()
+    for i in range(0, len(text), _HASH_SLICE_CHARS):
+        digest.update(text[i:i + _HASH_SLICE_CHARS].encode("utf-8"))
+    return digest.hexdigest()
+
+def model_tag() -> str:
+    """Which model and prompt set produced an answer; part of every cache key"""
+    model = "stub" if settings.INFERENCE_BACKEND == "stub" else os.path.basename(settings.MODEL_PATH.replace("\\", "/"))
+    return f"{model}:prompt-v{PROMPT_VERSION}"
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CONTRACTIONS = {
+    "what's": "what is", "whats": "what is", "it's": "it is", "isn't": "is not", "aren't": "are not",
+    "doesn't": "does not", "don't": "do not", "won't": "will not", "can't": "can not", "cannot": "can not"
+}
+# Words that do not change what is being asked about
+_FILLER = {
+    "what", "is", "are", "the", "a", "an", "of", "my", "this", "policy", "please", "tell", "me", "about",
+    "does", "do", "there", "any", "in", "for", "under", "amount", "how", "much", "which", "can", "you",
+    "i", "it", "to", "on", "be", "will", "get", "list"
+}
+# Two questions differing in these ask different things however similar they look
+_NEGATIONS = {"not", "no", "never", "without", "except", "excluded", "exclusion", "exclusions"}
+
+def normalize_question(query: str) -> str:
+    """Lowercase content words, contractions expanded and filler dropped"""
+    text = query.casefold().replace("\u2019", "'")
+    text = re.sub(r"[a-z]+'?[a-z]*", lambda m: _CONTRACTIONS.get(m.group(0), m.group(0)), text)
+    return " ".join(word for word in _WORD.findall(text) if word not in _FILLER)
+
+def _trigrams(text: str) -> Counter:
+    padded = f" {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def _guard_terms(words: List[str]) -> frozenset:
+    return frozenset(word for word in words if word.isdigit() or word in _NEGATIONS)
+
+def question_similarity(a: str, b: str) -> float:
+    """
+    Cosine similarity of the character trigrams of two normalized
+    questions, or 0 when they differ in a number or a negation
+    """
+    words_a, words_b = a.split(), b.split()
+    if _guard_terms(words_a) != _guard_terms(words_b):
+        return 0.0
+    grams_a, grams_b = _trigrams(a), _trigrams(b)
+    dot = sum(count * grams_b[gram] for gram, count in grams_a.items())
+    norm = math.sqrt(sum(c * c for c in grams_a.values()) * sum(c * c for c in grams_b.values()))
+    return dot / norm if norm else 0.0
+
+class SemanticCacheTier:
+    """
+    Second tier for paraphrases of a question already answered about the
+    same document with the same query type and params. Each such scope keeps
+    the normalized questions answered in it, pointing at their exact-tier
+    entries; a lookup returns the answer of the most similar one at or above
+    the threshold. The lists live in their own store namespace, whose
+    hit/miss counters count semantic lookups.
+    """
+
+    MAX_QUESTIONS = 64  # Most recent questions remembered per scope
+
+    def __init__(self, answers: CacheStore, index: CacheStore, threshold: float):
+        self.answers = answers
+        self.index = index
+        self.threshold = threshold
+
+    def _questions(self, scope: str) -> List[List[str]]:
+        return json.loads(self.index.get(scope, count=False) or "[]")  # [[normalized question, exact key], ...]
+
+    def get(self, scope: str, query: str) -> Optional[str]:
+        normalized = normalize_question(query)
+        best_key, best_score = None, self.threshold
+        for question, key in self._questions(scope) if normalized else []:
+            score = question_similarity(normalized, question)
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        answer = self.answers.get(best_key, count=False) if best_key else None
+        self.index.record(answer is not None)
+        return answer
+
+    def add(self, scope: str, query: str, key: str):
+        normalized = normalize_question(query)
+        if not normalized:
+            return
+
+        def append(current: Optional[str]) -> str:
+            questions = [entry for entry in json.loads(current or "[]") if entry[0] != normalized]
+            questions.append([normalized, key])
+            return json.dumps(questions[-self.MAX_QUESTIONS:])
+
+        # One atomic read-modify-write, so concurrent adds to a scope don't drop each other
+        self.index.update(scope, append)
+
+    def get_stats(self) -> Dict:
+        stats = self.index.get_stats()
+        total = stats['hits'] + stats['misses']
+        return {
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'hit_rate_percent': round(stats['hits'] / total * 100, 2) if total else 0,
+            'scopes': stats['entries'],
+            'threshold': self.threshold
+        }
+
+    def clear(self):
+        self.index.clear()
 
 class ResponseCacheService:
     """
-    LRU cache with TTL for identical (policy, query, params) requests.
-    Speeds up repeated queries significantly.
+    TTL cache for identical (policy, query, params) requests. Keys hash the
+    whole policy plus a version tag, so a different document, model or
+    prompt set never gets another's answer. Storage, the byte cap, TTL and
+    hit counters belong to the store (CACHE_BACKEND): on SQLite or Redis
+    every worker shares one cache and it survives restarts. Exact misses
+    fall through to the semantic tier, when there is one.
     """
     
-    def __init__(self, max_size: int = 100, ttl_hours: int = 24):
-        self.max_size = max_size
-        self.ttl = timedelta(hours=ttl_hours)
-        self.cache: Dict[str, Dict] = {}
-        self.access_order: deque = deque()
-        self.hits = 0
-        self.misses = 0
+    def __init__(self, store: CacheStore, version: str = "", semantic: Optional[SemanticCacheTier] = None):
+        self.store = store
+        self.version = version
+        self.semantic = semantic
     
-    def _generate_key(self, policy_text: str, query: str, params: Dict) -> str:
+    def _scope(self, digest: str, params: Dict) -> str:
+        """Everything but the question: the document, model/prompt version and params (incl. query type)"""
+        return hashlib.sha256(f"{self.version}|{digest}|{json.dumps(params, sort_keys=True)}".encode("utf-8")).hexdigest()
+    
+    def _generate_key(self, scope: str, query: str) -> str:
         """Generate cache key from request parameters"""
-        # Create deterministic hash
-        content = f"{policy_text[:500]}|{query}|{json.dumps(params, sort_keys=True)}"
-        return hashlib.sha256(content.encode()).hexdigest()
+        return hashlib.sha256(f"{scope}|{query}".encode("utf-8")).hexdigest()
+    
+    def request_key(self, policy_text: str, query: str, params: Dict) -> str:
+        """The exact-tier key for a request, also used to spot identical requests in flight"""
+        return self._generate_key(self._scope(document_digest(policy_text), params), query)
+    
+    def contains(self, policy_text: str, query: str, params: Dict) -> bool:
+        """Whether the exact request is cached, without counting a lookup"""
+        if not settings.CACHE_ENABLED:
+            return False
+        return self.store.get(self.request_key(policy_text, query, params), count=False) is not None
     
     def get(self, policy_text: str, query: str, params: Dict) -> Optional[str]:
         """Retrieve from cache if exists and not expired"""
         if not settings.CACHE_ENABLED:
             return None
-            
-        key = self._generate_key(policy_text, query, params)
-        
-        if key in self.cache:
-            entry = self.cache[key]
-            # Check TTL
-            if datetime.now() - entry['timestamp'] < self.ttl:
-                self.hits += 1
-                # Update LRU order
-                self.access_order.remove(key)
-                self.access_order.append(key)
-                return entry['response']
-            else:
-                # Expired
-                del self.cache[key]
-                self.access_order.remove(key)
-        
-        self.misses += 1
-        return None
+        scope = self._scope(document_digest(policy_text), params)
+        response = self.store.get(self._generate_key(scope, query))
+        if response is None and self.semantic is not None:
+            response = self.semantic.get(scope, query)
+        return response
+    
+    async def get_async(self, policy_text: str, query: str, params: Dict) -> Optional[str]:
+        """get() for coroutines: SQLite and Redis lookups are I/O, so they run off the event loop"""
+        return await asyncio.to_thread(self.get, policy_text, query, params)
+    
+    async def contains_async(self, policy_text: str, query: str, params: Dict) -> bool:
+        """contains() off the event loop"""
+        return await asyncio.to_thread(self.contains, policy_text, query, params)
     
     def set(self, policy_text: str, query: str, params: Dict, response: str):
-        """Store in cache with LRU eviction"""
+        """Store in cache; the store evicts least recently used entries past its byte cap"""
         if not settings.CACHE_ENABLED:
             return
-            
-        key = self._generate_key(policy_text, query, params)
-        
-        # Evict oldest if at capacity
-        if len(self.cache) >= self.max_size and key not in self.cache:
-            oldest_key = self.access_order.popleft()
-            if oldest_key in self.cache:
-                 del self.cache[oldest_key]
-        
-        self.cache[key] = {
-            'response': response,
-            'timestamp': datetime.now()
-        }
-        
-        if key in self.access_order:
-            self.access_order.remove(key)
-        self.access_order.append(key)
+        scope = self._scope(document_digest(policy_text), params)
+        key = self._generate_key(scope, query)
+        self.store.set(key, response)
+        if self.semantic is not None:
+            self.semantic.add(scope, query, key)
     
     def get_stats(self) -> Dict:
         """Return cache statistics"""
-        total = self.hits + self.misses
-        hit_rate = (self.hits / total * 100) if total > 0 else 0
+        stats = self.store.get_stats()
+        total = stats['hits'] + stats['misses']
+        hit_rate = (stats['hits'] / total * 100) if total > 0 else 0
         
         return {
-            'hits': self.hits,
-            'misses': self.misses,
+            'hits': stats['hits'],
+            'misses': stats['misses'],
             'hit_rate_percent': round(hit_rate, 2),
-            'size': len(self.cache),
-            'max_size': self.max_size
+            'evictions': stats['evictions'],
+            'size': stats['entries'],
+            'size_mb': round(stats['bytes'] / (1024 * 1024), 2),
+            'max_size_mb': round(self.store.max_bytes / (1024 * 1024), 2),
+            'backend': type(self.store).__name__,
+            'version': self.version,
+            # Exact misses answered by a paraphrase; misses above include these lookups
+            'semantic': self.semantic.get_stats() if self.semantic is not None else None
         }
     
+    def get_nbytes(self) -> int:
+        """Approximate memory (or disk) held by cached responses"""
+        return self.store.nbytes()
+    
     def clear(self):
         """Clear all cache"""
-        self.cache.clear()
-        self.access_order.clear()
-        self.hits = 0
-        self.misses = 0
+        self.store.clear()
+        if self.semantic is not None:
+            self.semantic.clear()
+
+    def flush(self):
+        """Write buffered access times and counters (shared stores); blocks until done"""
+        self.store.flush()
+        if self.semantic is not None:
+            self.semantic.index.flush()
 
 # Single instance for the app
+_response_store = create_cache_store(settings, "response", max_bytes=settings.CACHE_MAX_MB * 1024 * 1024)
 response_cache = ResponseCacheService(
-    max_size=settings.CACHE_MAX_SIZE, 
-    ttl_hours=settings.CACHE_TTL_HOURS
+    _response_store,
+    version=model_tag(),
+    semantic=SemanticCacheTier(
+        _response_store,
+        create_cache_store(settings, "response-semantic", max_bytes=settings.SEMANTIC_CACHE_MAX_MB * 1024 * 1024),
+        threshold=settings.SEMANTIC_CACHE_THRESHOLD
+    ) if settings.SEMANTIC_CACHE_ENABLED else None
+)
+
+# Chunk and document summaries from /summarize, keyed by content hash
+summary_cache = ResponseCacheService(
+    create_cache_store(settings, "summary", max_bytes=settings.SUMMARY_CACHE_MAX_MB * 1024 * 1024),
+    version=model_tag()
 )
\ No newline at end of file
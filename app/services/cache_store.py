@@ -0,0 +1,558 @@
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import Dict, Optional, Callable
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+# Approximate per-entry cost beyond the value text: key, bookkeeping and index entries
+ENTRY_OVERHEAD_BYTES = 200
+
+class CacheStore:
+    """
+    Storage behind a ResponseCacheService. A store enforces its own byte cap
+    (least recently used entries go first) and TTL, and keeps the hit, miss
+    and eviction counters, so shared stores report shared statistics.
+    """
+
+    def get(self, key: str, count: bool = True) -> Optional[str]:
+        """The value, or None; count=False leaves the hit/miss counters alone"""
+        raise NotImplementedError
+
+    def record(self, hit: bool):
+        """Count a hit or miss decided by the caller (e.g. a semantic match)"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: str):
+        raise NotImplementedError
+
+    def update(self, key: str, fn: Callable[[Optional[str]], Optional[str]]):
+        """
+        Replace the value with fn(current value, or None) atomically, even
+        against other processes sharing the store; for values several
+        requests modify, like the semantic tier's question lists. fn
+        returning None leaves the key as it is.
+        """
+        raise NotImplementedError
+
+    def nbytes(self) -> int:
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, int]:
+        """hits, misses, evictions, entries and bytes"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def flush(self):
+        """Write anything buffered; called on shutdown"""
+
+class MemoryCacheStore(CacheStore):
+    """
+    Per-process OrderedDict LRU; lost on restart and not shared between
+    workers. Lookups may come from worker threads, so access is locked.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.entries: OrderedDict = OrderedDict()  # key -> (value, nbytes, stored_at monotonic)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def get(self, key: str, count: bool = True) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[2] >= self.ttl:
+                self._remove(key)  # Expired
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+            if count:
+                self.record(entry is not None)
+            return entry[0] if entry is not None else None
+
+    def record(self, hit: bool):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def set(self, key: str, value: str):
+        nbytes = len(value.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+        if nbytes > self.max_bytes:
+            return  # Would evict everything and still not fit
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (value, nbytes, time.monotonic())
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_bytes, _) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def update(self, key: str, fn: Callable[[Optional[str]], Optional[str]]):
+        with self.lock:
+            value = fn(self.get(key, count=False))
+            if value is not None:
+                self.set(key, value)
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def nbytes(self) -> int:
+        return self.total_bytes
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self.entries), 'bytes': self.total_bytes}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    nbytes INTEGER NOT NULL,
+    stored_at REAL NOT NULL,         -- Wall clock, so TTLs survive restarts
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_lru ON cache_entries (namespace, accessed_at);
+CREATE INDEX IF NOT EXISTS cache_expiry ON cache_entries (namespace, stored_at);
+CREATE TABLE IF NOT EXISTS cache_meta (
+    namespace TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    evictions INTEGER NOT NULL DEFAULT 0
+);
+-- Byte totals follow the entries table whichever process writes it
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache_entries BEGIN
+    INSERT OR IGNORE INTO cache_meta (namespace) VALUES (NEW.namespace);
+    UPDATE cache_meta SET bytes = bytes + NEW.nbytes WHERE namespace = NEW.namespace;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF nbytes ON cache_entries BEGIN
+    UPDATE cache_meta SET bytes = bytes + NEW.nbytes - OLD.nbytes WHERE namespace = NEW.namespace;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache_entries BEGIN
+    UPDATE cache_meta SET bytes = bytes - OLD.nbytes WHERE namespace = OLD.namespace;
+END;
+"""
+class SharedCacheStore(CacheStore):
+    """
+    Base for stores shared between processes. Lookups only read: the access
+    times and hit/miss counts they produce are buffered here and written
+    with the next batch of writes. Writes (sets, those flushes, clears) run
+    in order on one background thread per store, so a request never waits
+    on a database lock or a round trip to store something. A value whose
+    write is still queued is served from memory meanwhile.
+    """
+
+    # Buffered access times and counters are written at least this often
+    FLUSH_INTERVAL_SECONDS = 1.0
+
+    def __init__(self):
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-writer")
+        self.pending_lock = threading.Lock()  # Held only to swap the buffers below
+        self.pending_sets: Dict[str, str] = {}
+        self.pending_access: Dict[str, float] = {}  # key -> last read, wall clock
+        self.pending_hits = 0
+        self.pending_misses = 0
+        self.last_flush = time.monotonic()
+
+    def get(self, key: str, count: bool = True) -> Optional[str]:
+        with self.pending_lock:
+            value = self.pending_sets.get(key)
+        if value is None:
+            value = self._read(key)
+        with self.pending_lock:
+            if value is not None:
+                self.pending_access[key] = time.time()
+            if count:
+                self._count(value is not None)
+        self._maybe_flush()
+        return value
+
+    def _count(self, hit: bool):
+        if hit:
+            self.pending_hits += 1
+        else:
+            self.pending_misses += 1
+
+    def record(self, hit: bool):
+        with self.pending_lock:
+            self._count(hit)
+        self._maybe_flush()
+
+    def set(self, key: str, value: str) -> Optional[Future]:
+        """Queues the write; the returned future completes once it is stored (see written())"""
+        nbytes = len(value.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+        if nbytes > self.max_bytes:
+            return None
+        with self.pending_lock:
+            self.pending_sets[key] = value
+        return self.writer.submit(self._apply, key, value, nbytes)
+
+    def update(self, key: str, fn: Callable[[Optional[str]], Optional[str]]) -> Future:
+        """Queued like set(); lookups see the new value once it is written"""
+        return self.writer.submit(self._apply_update, key, fn)
+
+    def _apply_update(self, key: str, fn: Callable[[Optional[str]], Optional[str]]):
+        try:
+            self._update(key, fn)
+        except Exception as e:
+            print(f"Cache Write Error: {e}")
+
+    def flush(self):
+        """Write buffered access times and counters now, and wait for every queued write"""
+        self.writer.submit(self._apply).result()
+
+    def _maybe_flush(self):
+        now = time.monotonic()
+        if now - self.last_flush >= self.FLUSH_INTERVAL_SECONDS:
+            self.last_flush = now
+            self.writer.submit(self._apply)
+
+    def _apply(self, key: Optional[str] = None, value: Optional[str] = None, nbytes: int = 0):
+        """On the writer thread: one write with the buffered updates and, if given, a new entry"""
+        with self.pending_lock:
+            access, self.pending_access = self.pending_access, {}
+            hits, misses = self.pending_hits, self.pending_misses
+            self.pending_hits = self.pending_misses = 0
+        try:
+            if key is not None or access or hits or misses:
+                self._write(key, value, nbytes, access, hits, misses)
+        except Exception as e:
+            print(f"Cache Write Error: {e}")
+        finally:
+            if key is not None:
+                with self.pending_lock:
+                    if self.pending_sets.get(key) is value:
+                        del self.pending_sets[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = self._stats()
+        with self.pending_lock:
+            stats['hits'] += self.pending_hits
+            stats['misses'] += self.pending_misses
+        return stats
+
+    def clear(self):
+        """Waits for the writer, so stats read right after show the empty cache"""
+        self.writer.submit(self._apply_clear).result()
+
+    def _apply_clear(self):
+        with self.pending_lock:
+            self.pending_sets.clear()
+            self.pending_access.clear()
+            self.pending_hits = self.pending_misses = 0
+        self._clear()
+
+    def _read(self, key: str) -> Optional[str]:
+        """The stored value if present and not expired; must not write"""
+        raise NotImplementedError
+
+    def _write(self, key: Optional[str], value: Optional[str], nbytes: int,
+               access: Dict[str, float], hits: int, misses: int):
+        raise NotImplementedError
+
+    def _update(self, key: str, fn: Callable[[Optional[str]], Optional[str]]):
+        raise NotImplementedError
+
+    def _stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+class SQLiteCacheStore(SharedCacheStore):
+    """
+    On-disk store shared by every API worker process and kept across
+    restarts. Each cache is a namespace in the same file; the byte cap and
+    TTL apply per namespace. WAL mode lets lookups, on their own connection,
+    read while another process writes.
+    """
+
+    # Expired entries are swept at most this often; lookups skip them regardless
+    PURGE_INTERVAL_SECONDS = 60
+    EVICT_BATCH = 32
+
+    def __init__(self, path: str, namespace: str, max_bytes: int, ttl_seconds: float):
+        super().__init__()
+        self.path = path
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.last_purge = 0.0
+        # Written only from the writer thread (and here, before it starts)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # A lost last write only costs a regeneration
+        self.conn.executescript(_SCHEMA)
+        self.conn.execute("INSERT OR IGNORE INTO cache_meta (namespace) VALUES (?)", (namespace,))
+        self.read_lock = threading.Lock()
+        self.reader = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+
+    def _read(self, key: str) -> Optional[str]:
+        with self.read_lock:
+            row = self.reader.execute("SELECT value, stored_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                                      (self.namespace, key)).fetchone()
+        return row[0] if row is not None and time.time() - row[1] < self.ttl else None
+
+    def _write(self, key: Optional[str], value: Optional[str], nbytes: int,
+               access: Dict[str, float], hits: int, misses: int):
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if access:
+                # Another process may have stored the key again since it was read
+                self.conn.executemany(
+                    "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ? AND accessed_at < ?",
+                    [(at, self.namespace, accessed, at) for accessed, at in access.items()]
+                )
+            if hits or misses:
+                self.conn.execute("UPDATE cache_meta SET hits = hits + ?, misses = misses + ? WHERE namespace = ?",
+                                  (hits, misses, self.namespace))
+            if key is not None:
+                self._upsert(key, value, nbytes, now)
+            if now - self.last_purge > self.PURGE_INTERVAL_SECONDS:
+                self.conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND stored_at < ?",
+                                  (self.namespace, now - self.ttl))
+                self.last_purge = now
+            if key is not None:
+                self._evict()
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _upsert(self, key: str, value: str, nbytes: int, now: float):
+        self.conn.execute(
+            "INSERT INTO cache_entries (namespace, key, value, nbytes, stored_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (namespace, key) DO UPDATE SET "
+            "value = excluded.value, nbytes = excluded.nbytes, "
+            "stored_at = excluded.stored_at, accessed_at = excluded.accessed_at",
+            (self.namespace, key, value, nbytes, now, now)
+        )
+
+    def _update(self, key: str, fn: Callable[[Optional[str]], Optional[str]]):
+        now = time.time()
+        # The write lock is taken before reading, so no other process can interleave
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT value, stored_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                                    (self.namespace, key)).fetchone()
+            value = fn(row[0] if row is not None and now - row[1] < self.ttl else None)
+            nbytes = len(value.encode("utf-8")) + ENTRY_OVERHEAD_BYTES if value is not None else 0
+            if value is not None and nbytes <= self.max_bytes:
+                self._upsert(key, value, nbytes, now)
+                self._evict()
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self):
+        """Drop least recently used entries until the namespace fits (inside the caller's transaction)"""
+        excess = self._bytes(self.conn) - self.max_bytes
+        evicted = 0
+        while excess > 0:
+            rows = self.conn.execute(
+                "SELECT key, nbytes FROM cache_entries WHERE namespace = ? ORDER BY accessed_at LIMIT ?",
+                (self.namespace, self.EVICT_BATCH)
+            ).fetchall()
+            if not rows:
+                break
+            victims = []
+            for key, nbytes in rows:
+                victims.append((self.namespace, key))
+                excess -= nbytes
+                if excess <= 0:
+                    break
+            self.conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+            evicted += len(victims)
+        if evicted:
+            self.conn.execute("UPDATE cache_meta SET evictions = evictions + ? WHERE namespace = ?",
+                              (evicted, self.namespace))
+
+    def _bytes(self, conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT bytes FROM cache_meta WHERE namespace = ?", (self.namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def nbytes(self) -> int:
+        with self.read_lock:
+            return self._bytes(self.reader)
+
+    def _stats(self) -> Dict[str, int]:
+        with self.read_lock:
+            meta = self.reader.execute("SELECT hits, misses, evictions, bytes FROM cache_meta WHERE namespace = ?",
+                                       (self.namespace,)).fetchone()
+            entries = self.reader.execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?",
+                                          (self.namespace,)).fetchone()[0]
+        return {'hits': meta[0], 'misses': meta[1], 'evictions': meta[2], 'entries': entries, 'bytes': meta[3]}
+
+    def _clear(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+        self.conn.execute("UPDATE cache_meta SET bytes = 0, hits = 0, misses = 0, evictions = 0 "
+                          "WHERE namespace = ?", (self.namespace,))
+        self.conn.execute("COMMIT")
+
+class RedisCacheStore(SharedCacheStore):
+    """
+    Store on a Redis server (or anything speaking its protocol), shared by
+    every worker on every host. Redis expires entries itself; the byte cap
+    is kept here with a sorted set of access times and a per-entry size
+    hash, so the cache can share a server with other data. Counts are
+    approximate when several workers evict at once. Takes any redis-py
+    compatible client, e.g. fakeredis for tests.
+    """
+
+    EVICT_BATCH = 32
+
+    def __init__(self, url: str, namespace: str, max_bytes: int, ttl_seconds: float, client=None):
+        super().__init__()
+        if client is None:
+            import redis  # Optional dependency, only needed for this backend
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        prefix = f"policy-cache:{namespace}"
+        self.entry_prefix = f"{prefix}:entry:"
+        self.lru_key = f"{prefix}:lru"        # Sorted set: key -> last access time
+        self.sizes_key = f"{prefix}:sizes"    # Hash: key -> nbytes
+        self.bytes_key = f"{prefix}:bytes"
+        self.stats_key = f"{prefix}:stats"    # Hash: hits, misses, evictions
+
+    def _read(self, key: str) -> Optional[str]:
+        return self.client.get(self.entry_prefix + key)
+
+    def _write(self, key: Optional[str], value: Optional[str], nbytes: int,
+               access: Dict[str, float], hits: int, misses: int):
+        previous = self.client.hget(self.sizes_key, key) if key is not None else None
+        pipe = self.client.pipeline()
+        if access:
+            pipe.zadd(self.lru_key, access, xx=True, gt=True)
+        if hits:
+            pipe.hincrby(self.stats_key, "hits", hits)
+        if misses:
+            pipe.hincrby(self.stats_key, "misses", misses)
+        if key is not None:
+            pipe.set(self.entry_prefix + key, value, px=max(1, int(self.ttl * 1000)))
+            pipe.zadd(self.lru_key, {key: time.time()})
+            pipe.hset(self.sizes_key, key, nbytes)
+            pipe.incrby(self.bytes_key, nbytes - int(previous or 0))
+        results = pipe.execute()
+        if key is not None and results[-1] > self.max_bytes:
+            self._evict(results[-1])
+
+    def _update(self, key: str, fn: Callable[[Optional[str]], Optional[str]]):
+        entry_key = self.entry_prefix + key
+
+        def attempt(pipe):
+            # Watched: if another worker writes the entry before EXEC, redis-py retries
+            value = fn(pipe.get(entry_key))
+            if value is None:
+                return
+            nbytes = len(value.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+            if nbytes > self.max_bytes:
+                return
+            previous = pipe.hget(self.sizes_key, key)
+            pipe.multi()
+            pipe.set(entry_key, value, px=max(1, int(self.ttl * 1000)))
+            pipe.zadd(self.lru_key, {key: time.time()})
+            pipe.hset(self.sizes_key, key, nbytes)
+            pipe.incrby(self.bytes_key, nbytes - int(previous or 0))
+
+        results = self.client.transaction(attempt, entry_key)
+        if results and results[-1] > self.max_bytes:
+            self._evict(results[-1])
+
+    def _evict(self, total: int):
+        # Entries not read for a whole TTL have expired in Redis; only their bookkeeping is left
+        stale = self.client.zrangebyscore(self.lru_key, "-inf", time.time() - self.ttl)
+        evicted = 0
+        while True:
+            victims = stale or self.client.zrange(self.lru_key, 0, self.EVICT_BATCH - 1)
+            if not victims:
+                break
+            sizes = [int(size or 0) for size in self.client.hmget(self.sizes_key, victims)]
+            if not stale:
+                # Least recently used first, only as many as it takes to fit
+                excess, n = total - self.max_bytes, 0
+                while n < len(victims) and excess > 0:
+                    excess -= sizes[n]
+                    n += 1
+                victims, sizes = victims[:n], sizes[:n]
+            freed = sum(sizes)
+            pipe = self.client.pipeline()
+            pipe.delete(*(self.entry_prefix + victim for victim in victims))
+            pipe.zrem(self.lru_key, *victims)
+            pipe.hdel(self.sizes_key, *victims)
+            pipe.decrby(self.bytes_key, freed)
+            total = pipe.execute()[-1]
+            if not stale:
+                evicted += len(victims)
+            stale = None
+            if total <= self.max_bytes:
+                break
+        if evicted:
+            self.client.hincrby(self.stats_key, "evictions", evicted)
+
+    def nbytes(self) -> int:
+        return int(self.client.get(self.bytes_key) or 0)
+
+    def _stats(self) -> Dict[str, int]:
+        pipe = self.client.pipeline()
+        pipe.hgetall(self.stats_key)
+        pipe.zcard(self.lru_key)
+        pipe.get(self.bytes_key)
+        counters, entries, nbytes = pipe.execute()
+        return {'hits': int(counters.get('hits', 0)), 'misses': int(counters.get('misses', 0)),
+                'evictions': int(counters.get('evictions', 0)), 'entries': entries, 'bytes': int(nbytes or 0)}
+
+    def _clear(self):
+        keys = self.client.zrange(self.lru_key, 0, -1)
+        pipe = self.client.pipeline()
+        if keys:
+            pipe.delete(*(self.entry_prefix + key for key in keys))
+        pipe.delete(self.lru_key, self.sizes_key, self.bytes_key, self.stats_key)
+        pipe.execute()
+
+async def written(pending: Optional[Future]):
+    """Wait for a write queued by set() or update() (None: already done) without blocking the loop"""
+    if pending is not None:
+        await asyncio.wrap_future(pending)
+
+def create_cache_store(config, namespace: str, max_bytes: int, ttl_seconds: Optional[float] = None) -> CacheStore:
+    """
+    Store selected by CACHE_BACKEND; each cache passes its own namespace and
+    byte cap, and a TTL when CACHE_TTL_HOURS is not the right one
+    """
+    if ttl_seconds is None:
+        ttl_seconds = config.CACHE_TTL_HOURS * 3600
+    if config.CACHE_BACKEND == "sqlite":
+        return SQLiteCacheStore(config.CACHE_DB_PATH, namespace, max_bytes, ttl_seconds)
+    if config.CACHE_BACKEND == "redis":
+        return RedisCacheStore(config.CACHE_REDIS_URL, namespace, max_bytes, ttl_seconds)
+    if config.CACHE_BACKEND == "memory":
+        return MemoryCacheStore(max_bytes, ttl_seconds)
+    raise ValueError(f"Unknown CACHE_BACKEND '{config.CACHE_BACKEND}' (expected 'sqlite', 'redis' or 'memory')")
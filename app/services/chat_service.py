@@ -1,10 +1,12 @@
 import uuid
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Callable
 from datetime import datetime, timedelta
 from collections import deque
 import asyncio
 from pydantic import BaseModel, Field  # <-- FIX: Added imports
 from app.core.config import settings
+from app.services.byte_lru import ByteBoundedLRU
+from app.services.cache_store import CacheStore, create_cache_store, written
 
 # Structure for a single message in the history
 class ChatMessage(BaseModel):  # <-- FIX: Needs BaseModel
@@ -22,14 +24,20 @@ class ChatHistoryService:
     """
     Manages conversation history for follow-up questions.
     Uses an LRU cache with TTL to manage memory.
+    Also keeps a llama.cpp state snapshot per conversation so follow-ups
+    only evaluate the tokens added since the previous answer.
     """
     
-    def __init__(self, max_size: int, ttl_hours: int):
+    def __init__(self, max_size: int, ttl_hours: int, snapshot_max_mb: int):
         self.conversations: Dict[str, Conversation] = {}
         self.access_order: deque = deque()
         self.max_size = max_size
         self.ttl = timedelta(hours=ttl_hours)
         self.lock = asyncio.Lock() # Protects shared state
+        # Snapshots also expire on their own, for conversations dropped where no discard reaches them
+        self.kv_snapshots = ByteBoundedLRU(max_bytes=snapshot_max_mb * 1024 * 1024, ttl_seconds=ttl_hours * 3600)
+        # Drops an evicted conversation's snapshot; the remote model manager points this at the model server
+        self.discard_snapshot: Callable[[str], None] = self.kv_snapshots.discard
     
     async def _evict(self):
         """Evict oldest conversations if over max_size or TTL"""
@@ -45,6 +53,7 @@ class ChatHistoryService:
                 del self.conversations[cid]
             if cid in self.access_order:
                 self.access_order.remove(cid)
+            self.discard_snapshot(cid)
 
         # Evict by LRU
         while len(self.conversations) > self.max_size:
@@ -52,6 +61,7 @@ class ChatHistoryService:
                 oldest_cid = self.access_order.popleft()
                 if oldest_cid in self.conversations:
                     del self.conversations[oldest_cid]
+                self.discard_snapshot(oldest_cid)
             except IndexError:
                 break # Queue is empty
     
@@ -80,6 +90,7 @@ class ChatHistoryService:
                 if datetime.now() - conversation.last_access > self.ttl:
                     del self.conversations[conv_id]
                     self.access_order.remove(conv_id)
+                    self.discard_snapshot(conv_id)
                     return None # Conversation expired
                 
                 # Update LRU
@@ -104,8 +115,58 @@ class ChatHistoryService:
         """Returns the number of active conversations"""
         return len(self.conversations)
 
-# Single instance for the app
-chat_service = ChatHistoryService(
-    max_size=settings.CHAT_HISTORY_MAX_SIZE,
-    ttl_hours=settings.CHAT_HISTORY_TTL_HOURS
-)
\ No newline at end of file
+class SharedChatHistoryService(ChatHistoryService):
+    """
+    Conversation history in a CacheStore (CACHE_BACKEND), so a follow-up
+    can land on any API worker. The store's TTL restarts with each message
+    and its byte cap takes the place of max_size. Snapshots live with the
+    model server, where they expire after the same TTL.
+    """
+    
+    def __init__(self, store: CacheStore, max_size: int, ttl_hours: int, snapshot_max_mb: int):
+        super().__init__(max_size, ttl_hours, snapshot_max_mb)
+        self.store = store
+    
+    async def start_chat(self, policy_text: str) -> str:
+        conversation = Conversation(conversation_id=str(uuid.uuid4()), policy_text=policy_text)
+        # Waits for the write, so the next request can find it on any worker
+        await written(self.store.set(conversation.conversation_id, conversation.model_dump_json()))
+        return conversation.conversation_id
+    
+    async def get_chat(self, conv_id: str) -> Optional[Tuple[str, List[Dict]]]:
+        value = await asyncio.to_thread(self.store.get, conv_id, False)
+        if value is None:
+            return None # Not found or expired
+        conversation = Conversation.model_validate_json(value)
+        return conversation.policy_text, [msg.model_dump() for msg in conversation.history]
+    
+    async def add_message(self, conv_id: str, role: str, content: str):
+        def append(current: Optional[str]) -> Optional[str]:
+            if current is None:
+                return None # Expired meanwhile
+            conversation = Conversation.model_validate_json(current)
+            conversation.history.append(ChatMessage(role=role, content=content))
+            conversation.last_access = datetime.now()
+            return conversation.model_dump_json()
+        
+        # Atomic, so messages added by two workers at once both stay
+        await written(self.store.update(conv_id, append))
+    
+    def get_active_count(self) -> int:
+        return self.store.get_stats()['entries']
+
+# Single instance for the app; several API workers must share conversations
+if settings.API_WORKERS > 1:
+    chat_service = SharedChatHistoryService(
+        create_cache_store(settings, "conversations", max_bytes=settings.CHAT_HISTORY_MAX_MB * 1024 * 1024,
+                           ttl_seconds=settings.CHAT_HISTORY_TTL_HOURS * 3600),
+        max_size=settings.CHAT_HISTORY_MAX_SIZE,
+        ttl_hours=settings.CHAT_HISTORY_TTL_HOURS,
+        snapshot_max_mb=settings.KV_SNAPSHOT_MAX_MB
+    )
+else:
+    chat_service = ChatHistoryService(
+        max_size=settings.CHAT_HISTORY_MAX_SIZE,
+        ttl_hours=settings.CHAT_HISTORY_TTL_HOURS,
+        snapshot_max_mb=settings.KV_SNAPSHOT_MAX_MB
+    )
\ No newline at end of file
@@ -0,0 +1,120 @@
+import json
+import time
+import asyncio
+import hashlib
+from typing import List, Dict, Tuple, Optional, Any, Callable, AsyncIterator
+
+def flight_key(*parts: Any) -> str:
+    """Key for requests that would produce the same generation"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class Flight:
+    """
+    One streaming generation, run in its own task and shared by every
+    request subscribed to it. Chunks are kept as they arrive, so a
+    subscriber that joins late first gets a replay of everything so far.
+    The generation is cancelled once its last subscriber leaves.
+    """
+
+    def __init__(self, chunks: AsyncIterator[Dict[str, Any]], on_complete: Optional[Callable[[str], None]]):
+        self.chunks: List[Dict[str, Any]] = []
+        self.done = False
+        self.abandoned = False
+        self.error: Optional[Exception] = None
+        self.subscribers = 0
+        self._wakeup = asyncio.Event()
+        self.task = asyncio.ensure_future(self._run(chunks, on_complete))
+
+    def _notify(self):
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    async def _run(self, chunks: AsyncIterator[Dict[str, Any]], on_complete: Optional[Callable[[str], None]]):
+        try:
+            async for chunk in chunks:
+                self.chunks.append(chunk)
+                self._notify()
+            if on_complete is not None:
+                on_complete(self.text().strip())
+        except Exception as e:
+            self.error = e
+        finally:
+            # Closing the stream cancels the generation on the inference thread
+            await chunks.aclose()
+            self.done = True
+            self._notify()
+
+    def text(self) -> str:
+        return "".join(chunk['choices'][0].get('text', '') for chunk in self.chunks if 'choices' in chunk)
+
+    async def stream(self, deadline: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Every chunk from the first one on; raises the generation's error, or
+        asyncio.TimeoutError past this subscriber's own deadline
+        (a time.monotonic() value)
+        """
+        self.subscribers += 1
+        try:
+            sent = 0
+            while True:
+                while sent < len(self.chunks):
+                    yield self.chunks[sent]
+                    sent += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.abandoned = True
+                self.task.cancel()
+
+    async def result(self, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """The whole completion, shaped like a non-streaming generate() result"""
+        usage = {}
+        async for chunk in self.stream(deadline):
+            usage = chunk.get('usage', usage)
+        return {'choices': [{'text': self.text()}], 'usage': usage}
+
+class SingleFlight:
+    """
+    Identical requests arriving while a generation is in flight attach to
+    it instead of starting their own. Lives on the event loop, so no locks.
+    """
+
+    def __init__(self):
+        self.flights: Dict[str, Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key: Optional[str], start: Callable[[], AsyncIterator[Dict[str, Any]]],
+             on_complete: Optional[Callable[[str], None]] = None) -> Tuple[Flight, bool]:
+        """
+        (the running flight for key, True), or (a new one from start(), a
+        streaming generate call, False). key=None always starts a private
+        flight. on_complete gets the stripped text once the generation finishes.
+        """
+        flight = self.flights.get(key) if key is not None else None
+        if flight is not None and not flight.done and not flight.abandoned:
+            self.coalesced += 1
+            return flight, True
+
+        flight = Flight(start(), on_complete)
+        self.started += 1
+        if key is not None:
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        return flight, False
+
+    def _forget(self, key: str, flight: Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'started': self.started, 'coalesced': self.coalesced, 'in_flight': len(self.flights)}
+
+# Single instance for the app
+generation_flights = SingleFlight()
@@ -0,0 +1,68 @@
+import time
+from typing import List, Dict, Optional, Any, Callable
+
+from app.services.byte_lru import ByteBoundedLRU
+
+def phase_timings(started: float, first_token_at: Optional[float]) -> Dict[str, float]:
+    """
+    usage fields splitting a sequence's time on the replica (time.perf_counter
+    values) into prefill (until the first token) and decode (the rest)
+    """
+    now = time.perf_counter()
+    first = first_token_at if first_token_at is not None else now
+    return {'prefill_ms': round((first - started) * 1000, 2), 'decode_ms': round((now - first) * 1000, 2)}
+
+class InferenceBackend:
+    """
+    What ModelManager needs from an inference library. A backend loads one
+    model per replica (on that replica's thread), optionally wraps it in a
+    batch engine, and turns GenerationParams into work for the replica.
+
+    Models must provide llama.cpp's tokenize(text, add_bos, special) so
+    prompts can be sized. Generation returns llama.cpp-style completion
+    dicts, or an iterator of chunk dicts when streaming; the usage of both
+    (the last chunk when streaming) carries prefill_ms and decode_ms.
+    """
+
+    name = "base"
+
+    @property
+    def source(self) -> str:
+        """Where the weights come from, for startup logs and /health"""
+        return self.name
+
+    def load(self, n_threads: int) -> Any:
+        """Create one replica's model (runs on its inference thread)"""
+        raise NotImplementedError
+
+    def create_engine(self, model: Any, on_done: Callable[[], None], n_threads: int) -> Optional[Any]:
+        """
+        Continuous-batching engine for one replica, or None to run jobs one at
+        a time. Engines provide serve(jobs, run_other), n_active and n_seq.
+        """
+        return None
+
+    def generation(self, params: Any, stream: bool) -> Callable[[Any], Any]:
+        """Single-sequence generation: fn(model) -> completion dict or chunk iterator"""
+        raise NotImplementedError
+
+    def embed(self, model: Any, texts: List[str]) -> Any:
+        """Unit-length embedding per text as a float32 np.ndarray (runs on the replica thread)"""
+        raise NotImplementedError
+
+    def load_tokenizer(self) -> Optional[Any]:
+        """A tokenizer without the full model, for API workers in remote mode"""
+        return None
+
+def create_backend(config, prefix_cache: ByteBoundedLRU, session_cache: ByteBoundedLRU) -> InferenceBackend:
+    """
+    Backend selected by INFERENCE_BACKEND. Imported lazily so the stub
+    runs on machines without llama-cpp-python or a GGUF file.
+    """
+    if config.INFERENCE_BACKEND == "stub":
+        from app.services.stub_backend import StubBackend
+        return StubBackend(config)
+    if config.INFERENCE_BACKEND == "llama":
+        from app.services.llama_backend import LlamaBackend
+        return LlamaBackend(config, prefix_cache, session_cache)
+    raise ValueError(f"Unknown INFERENCE_BACKEND '{config.INFERENCE_BACKEND}' (expected 'llama' or 'stub')")
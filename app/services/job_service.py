@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import threading
+from typing import List, Dict, Optional, Any
+
+from app.core.config import settings
+from app.models.api_models import BatchStreamRequest, SummarizeRequest
+from app.services.batch_service import normalize_query, answer_query, shared_answer
+from app.services.summary_service import policy_summarizer
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,            -- queued, running, completed, failed
+    request TEXT NOT NULL,           -- JSON body of the request
+    client TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    result TEXT,                     -- JSON, summarize jobs only
+    error TEXT,
+    owner TEXT,                      -- Worker process holding the lease
+    heartbeat_at REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    result TEXT NOT NULL,            -- JSON, one batch query's answer or error
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+class JobStore:
+    """
+    SQLite persistence for jobs and their results. Every API worker process
+    opens the same file; a job is owned through a lease its worker renews,
+    so a job whose process died is picked up again once the lease expires.
+    """
+
+    def __init__(self, path: str, lease_seconds: float):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def create(self, kind: str, request: Dict[str, Any], client: str, total: int) -> str:
+        job_id = str(uuid.uuid4())
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, kind, status, request, client, total, created_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(request), client, total, time.time())
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[sqlite3.Row]:
+        with self.lock:
+            return self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def claim(self, owner: str) -> Optional[sqlite3.Row]:
+        """Take the oldest queued job, or a running one whose lease has expired"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now - self.lease_seconds,)
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, heartbeat_at = ?, "
+                    "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (owner, now, now, row['id'])
+                )
+                job = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+                self.conn.execute("COMMIT")
+                return job
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self, job_id: str, owner: str):
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND owner = ?",
+                              (time.time(), job_id, owner))
+
+    def release(self, owner: str):
+        """Hand this process's running jobs back to the queue (clean shutdown)"""
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET status = 'queued', owner = NULL WHERE status = 'running' AND owner = ?",
+                              (owner,))
+
+    def add_result(self, job_id: str, idx: int, result: Dict[str, Any]):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            cursor = self.conn.execute("INSERT OR IGNORE INTO job_results (job_id, idx, result) VALUES (?, ?, ?)",
+                                       (job_id, idx, json.dumps(result)))
+            if cursor.rowcount:
+                self.conn.execute("UPDATE jobs SET completed = completed + 1 WHERE id = ?", (job_id,))
+            self.conn.execute("COMMIT")
+
+    def done_indices(self, job_id: str) -> set:
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT idx FROM job_results WHERE job_id = ?", (job_id,))}
+
+    def results(self, job_id: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT idx, result FROM job_results WHERE job_id = ? AND idx >= ? ORDER BY idx LIMIT ?",
+                (job_id, offset, limit)
+            ).fetchall()
+        return [{'index': row['idx'], **json.loads(row['result'])} for row in rows]
+
+    def set_progress(self, job_id: str, completed: int, total: int):
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET completed = ?, total = ? WHERE id = ?", (completed, total, job_id))
+
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, owner = NULL, finished_at = ? WHERE id = ?",
+                ('failed' if error else 'completed', json.dumps(result) if result is not None else None,
+                 error, time.time(), job_id)
+            )
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+class JobManager:
+    """
+    Runs persisted jobs on a pool of asyncio workers. Jobs go through the
+    same inference scheduler as HTTP requests (batch priority, on behalf of
+    the submitting client). Batch jobs store each answer as it finishes, so
+    a job resumed after a restart only runs the queries it had not answered.
+    """
+
+    def __init__(self, store: JobStore, n_workers: int, poll_seconds: float, concurrency: int):
+        self.store = store
+        self.n_workers = max(1, n_workers)
+        self.poll_seconds = poll_seconds
+        self.concurrency = max(1, concurrency)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.workers: List[asyncio.Task] = []
+        self.wake: Optional[asyncio.Event] = None
+
+    async def submit(self, kind: str, request: Dict[str, Any], client: str, total: int) -> str:
+        job_id = await asyncio.to_thread(self.store.create, kind, request, client, total)
+        if self.wake is not None:
+            self.wake.set()
+        return job_id
+
+    async def start(self):
+        self.wake = asyncio.Event()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.n_workers)]
+        print(f"📋 Job workers: {self.n_workers} (store: {self.store.path})")
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        # Unfinished jobs go straight back to the queue instead of waiting out the lease
+        await asyncio.to_thread(self.store.release, self.owner)
+
+    async def _worker(self):
+        while True:
+            job = await asyncio.to_thread(self.store.claim, self.owner)
+            if job is None:
+                # Other processes may queue jobs too, so poll as well as waiting for local submits
+                try:
+                    await asyncio.wait_for(self.wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self.wake.clear()
+                continue
+
+            heartbeat = asyncio.create_task(self._heartbeat(job['id']))
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job {job['id']} failed: {e}")
+                await asyncio.to_thread(self.store.finish, job['id'], error=str(e))
+            finally:
+                heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            await asyncio.to_thread(self.store.heartbeat, job_id, self.owner)
+
+    async def _run(self, job: sqlite3.Row):
+        request = json.loads(job['request'])
+        if job['kind'] == 'batch':
+            await self._run_batch(job['id'], BatchStreamRequest(**request), job['client'])
+        elif job['kind'] == 'summarize':
+            await self._run_summarize(job['id'], SummarizeRequest(**request), job['client'])
+        else:
+            raise ValueError(f"Unknown job kind: {job['kind']}")
+
+    async def _run_batch(self, job_id: str, request: BatchStreamRequest, client: str):
+        done = await asyncio.to_thread(self.store.done_indices, job_id)
+        todo = iter([idx for idx in range(len(request.queries)) if idx not in done])
+        pending: Dict[asyncio.Future, int] = {}
+        inflight: Dict[tuple, tuple] = {}  # Normalized query -> (index, task) while it runs
+
+        def fill():
+            for idx in todo:
+                query = request.queries[idx]
+                query_type = request.query_types[idx] if request.query_types else None
+                key = (normalize_query(query), query_type)
+                if key in inflight:
+                    first_idx, task = inflight[key]
+                    waiter = asyncio.ensure_future(shared_answer(task, query, first_idx))
+                else:
+                    waiter = asyncio.ensure_future(answer_query(request, query, query_type, None, client))
+                    inflight[key] = (idx, waiter)
+                pending[waiter] = idx
+                if len(pending) >= self.concurrency:
+                    return
+
+        try:
+            fill()
+            while pending:
+                finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    idx = pending.pop(task)
+                    try:
+                        result = task.result().model_dump(mode="json")
+                    except Exception as e:
+                        result = {'query': request.queries[idx], 'error': str(e)}
+                    await asyncio.to_thread(self.store.add_result, job_id, idx, result)
+                for key in [key for key, (_, task) in inflight.items() if task.done()]:
+                    del inflight[key]
+                fill()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        await asyncio.to_thread(self.store.finish, job_id)
+
+    async def _run_summarize(self, job_id: str, request: SummarizeRequest, client: str):
+        start_time = time.time()
+        events = policy_summarizer.summarize(
+            request.policy_text,
+            request.temperature,
+            request.max_tokens,
+            use_cache=request.use_cache,
+            client=client
+        )
+        final = None
+        try:
+            async for event in events:
+                if event['event'] == 'plan':
+                    await asyncio.to_thread(self.store.set_progress, job_id, 0, event['sections'])
+                elif event['event'] == 'section':
+                    await asyncio.to_thread(self.store.set_progress, job_id, event['completed'], event['total'])
+                elif event['event'] == 'summary':
+                    final = event
+        finally:
+            await events.aclose()
+
+        if final is None:
+            await asyncio.to_thread(self.store.finish, job_id, error="Summarizer finished without a summary")
+            return
+
+        final.pop('event')
+        await asyncio.to_thread(self.store.set_progress, job_id, final['sections_total'], final['sections_total'])
+        final['processing_time_ms'] = round((time.time() - start_time) * 1000, 2)
+        await asyncio.to_thread(self.store.finish, job_id, result=final)
+
+# Single instance for the app
+job_manager = JobManager(
+    JobStore(settings.JOBS_DB_PATH, lease_seconds=settings.JOB_LEASE_SECONDS),
+    n_workers=settings.JOB_WORKERS,
+    poll_seconds=settings.JOB_POLL_SECONDS,
+    concurrency=settings.BATCH_STREAM_CONCURRENCY
+)
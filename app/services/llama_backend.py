@@ -0,0 +1,227 @@
+import time
+import hashlib
+from typing import List, Dict, Optional, Any, Callable
+
+import numpy as np
+import llama_cpp
+from llama_cpp import Llama, StoppingCriteriaList
+from llama_cpp._internals import LlamaModel
+
+from app.services.byte_lru import ByteBoundedLRU
+from app.services.batch_engine import BatchEngine
+from app.services.inference_backend import InferenceBackend, phase_timings
+
+def _state_nbytes(state) -> int:
+    """Approximate memory held by a LlamaState"""
+    return int(state.llama_state_size) + state.input_ids.nbytes + state.scores.nbytes
+
+def _reset_perf(model: Llama):
+    """Zero llama.cpp's prompt-eval and eval timers (no-op on builds without them)"""
+    try:
+        llama_cpp.llama_perf_context_reset(model._ctx.ctx)
+    except AttributeError:
+        pass
+
+def _perf_timings(model: Llama) -> Optional[Dict[str, float]]:
+    """llama.cpp's own prefill / decode times since the last reset, if this build reports them"""
+    try:
+        perf = llama_cpp.llama_perf_context(model._ctx.ctx)
+    except AttributeError:
+        return None
+    return {'prefill_ms': round(perf.t_p_eval_ms, 2), 'decode_ms': round(perf.t_eval_ms, 2)}
+
+class LlamaBackend(InferenceBackend):
+    """The fine-tuned GGUF model at MODEL_PATH, run through llama-cpp-python"""
+
+    name = "llama"
+
+    def __init__(self, config, prefix_cache: ByteBoundedLRU, session_cache: ByteBoundedLRU):
+        self.config = config
+        self.prefix_cache = prefix_cache
+        self.session_cache = session_cache
+        self.embedders: Dict[int, Llama] = {}  # Replica model id -> its embedding context
+        # Replica model id -> conversation whose latest state that replica holds, not yet snapshotted
+        self.resident_sessions: Dict[int, str] = {}
+
+    @property
+    def batching(self) -> bool:
+        return self.config.BATCH_MAX_SEQUENCES > 1
+
+    @property
+    def source(self) -> str:
+        return self.config.MODEL_PATH
+
+    def load(self, n_threads: int) -> Llama:
+        """Instantiate one Llama replica (runs on its inference thread)"""
+        return Llama(
+            model_path=self.config.MODEL_PATH,
+            # With batching, generation runs in the engine's own context and this
+            # one only serves tokenization, so keep it small
+            n_ctx=self.config.N_BATCH if self.batching else self.config.N_CTX,
+            n_threads=n_threads,
+            n_gpu_layers=self.config.N_GPU_LAYERS,
+            use_mmap=self.config.USE_MMAP,
+            verbose=self.config.DEBUG
+        )
+
+    def create_engine(self, model: Llama, on_done: Callable[[], None], n_threads: int) -> Optional[BatchEngine]:
+        """Continuous-batching engine for one replica (runs on its inference thread)"""
+        if not self.batching:
+            return None
+        return BatchEngine(
+            model,
+            on_done=on_done,
+            n_seq=self.config.BATCH_MAX_SEQUENCES,
+            n_ctx_per_seq=self.config.N_CTX,
+            n_batch=self.config.N_BATCH,
+            n_threads=n_threads,
+            prefix_cache=self.prefix_cache if self.config.PREFIX_CACHE_ENABLED else None,
+            session_cache=self.session_cache if self.config.KV_SNAPSHOT_ENABLED else None,
+            draft_tokens=self.config.SPECULATIVE_DRAFT_TOKENS,
+            ngram_size=self.config.SPECULATIVE_NGRAM_SIZE
+        )
+
+    def _embedder(self, model: Llama) -> Llama:
+        """
+        Embedding-mode twin of a replica, created on first use. The weights
+        are memory-mapped, so it only adds a small context.
+        """
+        embedder = self.embedders.get(id(model))
+        if embedder is None:
+            embedder = Llama(
+                model_path=self.config.MODEL_PATH,
+                embedding=True,
+                pooling_type=llama_cpp.LLAMA_POOLING_TYPE_MEAN,
+                # Pooled embeddings need a whole section in one micro-batch
+                n_ctx=self.config.N_BATCH,
+                n_batch=self.config.N_BATCH,
+                n_ubatch=self.config.N_BATCH,
+                n_threads=model.n_threads,
+                n_gpu_layers=self.config.N_GPU_LAYERS,
+                use_mmap=self.config.USE_MMAP,
+                verbose=self.config.DEBUG
+            )
+            self.embedders[id(model)] = embedder
+        return embedder
+
+    def embed(self, model: Llama, texts: List[str]) -> np.ndarray:
+        vectors = self._embedder(model).embed(texts, normalize=True, truncate=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def load_tokenizer(self) -> LlamaModel:
+        """Load just the vocabulary so prompts can be sized without a round trip"""
+        params = llama_cpp.llama_model_default_params()
+        params.vocab_only = True
+        return LlamaModel(path_model=self.config.MODEL_PATH, params=params, verbose=False)
+
+    def _restore_session(self, model: Llama, session_id: str) -> bool:
+        """Load the conversation's last llama.cpp state, if we still have it"""
+        snapshot = self.session_cache.get(session_id)
+        if snapshot is None:
+            return False
+
+        # Skip the copy when this replica still holds exactly that state
+        if model.n_tokens != snapshot.n_tokens or not np.array_equal(
+                model.input_ids[:model.n_tokens], snapshot.input_ids[:snapshot.n_tokens]):
+            # llama.cpp then re-uses the longest matching token prefix
+            # and only evaluates the new history and question
+            model.load_state(snapshot)
+        return True
+
+    def _snapshot_session(self, model: Llama, session_id: str):
+        """
+        Save a conversation's state before the replica moves on to another
+        request, so a later follow-up can resume from it. Skipped when the
+        state would not fit in the snapshot cache anyway (checked before copying).
+        """
+        get_size = getattr(llama_cpp, "llama_state_get_size", None) or llama_cpp.llama_get_state_size
+        if get_size(model.ctx) > self.session_cache.max_bytes:
+            return
+        state = model.save_state()
+        self.session_cache.put(session_id, state, _state_nbytes(state))
+
+    def _restore_prefix(self, model: Llama, prefix: str):
+        """
+        Make the replica's KV cache start with the evaluated policy prefix,
+        restoring it from the shared prefix cache or prefilling and saving it.
+        """
+        prefix_tokens = model.tokenize(prefix.encode("utf-8"))
+        key = hashlib.sha256(np.asarray(prefix_tokens, dtype=np.int32).tobytes()).hexdigest()
+        n_prefix = len(prefix_tokens)
+
+        # Already resident from the previous request on this replica
+        if model.n_tokens >= n_prefix and model.input_ids[:n_prefix].tolist() == prefix_tokens:
+            self.prefix_cache.touch(key)
+            return
+
+        state = self.prefix_cache.get(key)
+        if state is not None:
+            model.load_state(state)
+            return
+
+        model.reset()
+        model.eval(prefix_tokens)
+        state = model.save_state()
+        self.prefix_cache.put(key, state, _state_nbytes(state))
+
+    def _resident_after_stream(self, model: Llama, session_id: str, chunks):
+        yield from chunks
+        self.resident_sessions[id(model)] = session_id
+
+    def _timed_stream(self, model: Llama, prompt: str, chunks):
+        """
+        The high-level streaming API reports no usage, so count the chunks
+        and end with a usage chunk like the batch engine's
+        """
+        started = time.perf_counter()
+        first_token_at, completion_tokens = None, 0
+        for chunk in chunks:
+            if chunk['choices'][0].get('text'):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                completion_tokens += 1
+            yield chunk
+
+        n_prompt = len(model.tokenize(prompt.encode("utf-8")))
+        usage = {'prompt_tokens': n_prompt, 'completion_tokens': completion_tokens,
+                 'total_tokens': n_prompt + completion_tokens}
+        usage.update(_perf_timings(model) or phase_timings(started, first_token_at))
+        yield {'choices': [{'text': '', 'index': 0, 'finish_reason': None}], 'usage': usage}
+
+    def generation(self, params: Any, stream: bool) -> Callable[[Llama], Any]:
+        """Single-sequence path through the high-level Llama API (BATCH_MAX_SEQUENCES=1)"""
+        def run(model: Llama):
+            resident = self.resident_sessions.pop(id(model), None)
+            if resident is not None and resident != params.session_id:
+                self._snapshot_session(model, resident)  # Its state is about to be replaced
+            # A follow-up on the replica that answered the last turn resumes in place
+            restored = params.session_id is not None and (
+                resident == params.session_id or self._restore_session(model, params.session_id))
+            if params.prefix is not None and not restored:
+                self._restore_prefix(model, params.prefix)
+
+            _reset_perf(model)
+            output = model(
+                params.prompt,
+                temperature=params.temperature,
+                max_tokens=params.max_tokens,
+                top_p=params.top_p,
+                stream=stream,
+                stop=params.stop,
+                # Lets a cancelled request stop mid-generation, not just between chunks
+                stopping_criteria=StoppingCriteriaList([lambda input_ids, logits: params.cancelled.is_set()])
+            )
+
+            if stream:
+                output = self._timed_stream(model, params.prompt, output)
+            else:
+                output['usage'].update(_perf_timings(model) or {})
+
+            if params.session_id is None:
+                return output
+            if stream:
+                return self._resident_after_stream(model, params.session_id, output)
+            self.resident_sessions[id(model)] = params.session_id
+            return output
+
+        return run
@@ -0,0 +1,109 @@
+import bisect
+from typing import List, Dict, Tuple, Optional, Iterable
+
+# Bucket upper bounds; +Inf is implicit
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+TTFT_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+REQUEST_LABELS = ("endpoint", "query_type", "cache")
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Histogram:
+    """
+    Prometheus histogram. observe() is a bisect and three increments with
+    no lock: every observation is made on the event loop thread, so they
+    never interleave. Buckets are stored per bucket and made cumulative
+    only when scraped.
+    """
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...],
+                 label_names: Tuple[str, ...] = REQUEST_LABELS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self.series: Dict[Tuple[str, ...], List] = {}  # labels -> [bucket counts, sum, count]
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0, 0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in list(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.label_names, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+def render_gauge(name: str, help_text: str, samples: Dict[Tuple[Tuple[str, str], ...], float],
+                 kind: str = "gauge") -> List[str]:
+    """Gauge (or counter) lines from {((label, value), ...): sample}"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples.items():
+        lines.append(f"{name}{_format_labels([l for l, _ in labels], [v for _, v in labels])} {_format_value(value)}")
+    return lines
+
+class InferenceMetrics:
+    """Per-request histograms, labeled by endpoint, query type and cache hit or miss"""
+
+    def __init__(self):
+        self.latency = Histogram("policy_request_latency_seconds",
+                                 "Time from request start to the complete answer.", LATENCY_BUCKETS)
+        self.ttft = Histogram("policy_time_to_first_token_seconds",
+                              "Time from request start to the first answer token (the whole answer for cache hits).",
+                              TTFT_BUCKETS)
+        self.prompt_tokens = Histogram("policy_prompt_tokens", "Prompt length in tokens.", TOKEN_BUCKETS)
+        self.generated_tokens = Histogram("policy_generated_tokens", "Answer length in tokens.", TOKEN_BUCKETS)
+        self.tokens_per_second = Histogram("policy_generation_tokens_per_second",
+                                           "Generated tokens per second of generation "
+                                           "(from the first token when streaming).", RATE_BUCKETS)
+
+    def observe(self, endpoint: str, query_type: Optional[str], cached: bool, latency: float,
+                ttft: Optional[float] = None, usage: Optional[Dict] = None,
+                generation_seconds: Optional[float] = None):
+        """
+        Record one answered query. usage is the generation's usage dict
+        (prompt/completion tokens); generation_seconds the time its tokens
+        took to produce. Cache hits have neither.
+        """
+        labels = (endpoint, getattr(query_type, "value", query_type) or "none", "hit" if cached else "miss")
+        self.latency.observe(latency, *labels)
+        if ttft is None and cached:
+            ttft = latency  # A cached answer arrives all at once
+        if ttft is not None:
+            self.ttft.observe(ttft, *labels)
+        if usage:
+            self.prompt_tokens.observe(usage.get('prompt_tokens', 0), *labels)
+            completion_tokens = usage.get('completion_tokens', 0)
+            self.generated_tokens.observe(completion_tokens, *labels)
+            if generation_seconds and completion_tokens:
+                self.tokens_per_second.observe(completion_tokens / generation_seconds, *labels)
+
+    def render(self) -> List[str]:
+        lines = []
+        for histogram in (self.latency, self.ttft, self.prompt_tokens, self.generated_tokens, self.tokens_per_second):
+            lines += histogram.render()
+        return lines
+
+# Single instance for the app
+inference_metrics = InferenceMetrics()
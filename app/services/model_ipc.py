@@ -0,0 +1,69 @@
+import json
+import base64
+import socket
+import struct
+import asyncio
+from typing import Tuple, Dict, Any
+
+import numpy as np
+
+# ============================================================================
+# FRAMED PROTOCOL
+# ============================================================================
+#
+# Every frame is a 5-byte header (1 byte type, 4 byte big-endian length)
+# followed by the payload. Requests and results are JSON, streamed tokens
+# are sent as raw UTF-8 so each token costs only 5 bytes of overhead.
+# A client cancels a request simply by closing its connection.
+
+FRAME_REQUEST = 1   # JSON: {"op": ..., **params}
+FRAME_CHUNK = 2     # UTF-8 token text
+FRAME_RESULT = 3    # JSON result
+FRAME_ERROR = 4     # UTF-8 error message
+FRAME_END = 5       # End of a token stream (optional JSON final chunk with usage)
+
+_HEADER = struct.Struct("!BI")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+def pack_frame(frame_type: int, payload: bytes = b"") -> bytes:
+    """Encode a single frame"""
+    return _HEADER.pack(frame_type, len(payload)) + payload
+
+def pack_json(frame_type: int, data: Dict[str, Any]) -> bytes:
+    """Encode a JSON frame"""
+    return pack_frame(frame_type, json.dumps(data, separators=(",", ":")).encode())
+
+def pack_matrix(matrix: np.ndarray) -> Dict[str, Any]:
+    """JSON-safe float32 matrix (base64 is far smaller than a list of floats)"""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    return {"shape": list(matrix.shape), "data": base64.b64encode(matrix.tobytes()).decode()}
+
+def unpack_matrix(data: Dict[str, Any]) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data["data"]), dtype=np.float32).reshape(data["shape"])
+
+def _check_length(length: int):
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes exceeds limit of {MAX_FRAME_SIZE}")
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Read one frame from an asyncio stream"""
+    header = await reader.readexactly(_HEADER.size)
+    frame_type, length = _HEADER.unpack(header)
+    _check_length(length)
+    payload = await reader.readexactly(length) if length else b""
+    return frame_type, payload
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Model server closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+def recv_frame(sock: socket.socket) -> Tuple[int, bytes]:
+    """Read one frame from a blocking socket (used during startup)"""
+    frame_type, length = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    _check_length(length)
+    return frame_type, _recv_exactly(sock, length) if length else b""
@@ -1,52 +1,434 @@
 import time
-from typing import Optional, List, Dict
+import json
+import socket
+import asyncio
+import threading
+from typing import Optional, List, Dict, Any, Callable, AsyncIterator
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime
-from llama_cpp import Llama
+import numpy as np
 from app.core.config import settings
 from app.models.api_models import QueryType
+from app.services.chat_service import chat_service
+from app.services.byte_lru import ByteBoundedLRU
+from app.services.cache_service import document_digest
+from app.services.inference_backend import InferenceBackend, create_backend
+from app.services.prompt_builder import PromptBuilder, ChatPrompt
+from app.services.retrieval_service import PolicyRetriever
+from app.services.scheduler import InferenceScheduler, Priority, parse_weights
+from app.services.model_ipc import (
+    FRAME_REQUEST, FRAME_CHUNK, FRAME_RESULT, FRAME_ERROR, FRAME_END,
+    pack_json, unpack_matrix, read_frame, recv_frame
+)
+
+# Sentinel marking the end of a streamed job
+_END = object()
+
+# Stop strings shared by every generation path
+STOP_SEQUENCES = ["###", "User:", "Question:"]
+
+# Documents whose token counts are remembered (a hash and an int each)
+TOKEN_COUNT_CACHE_SIZE = 1024
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left until a time.monotonic() deadline (None = no deadline)"""
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+class _JobError:
+    """Wraps an exception raised on the inference thread"""
+    def __init__(self, error: Exception):
+        self.error = error
+
+class InferenceJob:
+    """
+    A unit of work for the inference thread.
+    Results travel back to the event loop through a future (non-streaming)
+    or an asyncio.Queue of chunks (streaming).
+    priority, client and deadline decide when the scheduler starts it.
+    """
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop, fn: Callable[[Any], Any], stream: bool,
+                 priority: Priority = Priority.INTERACTIVE, client: str = "",
+                 deadline: Optional[float] = None):
+        self.loop = loop
+        self.fn = fn
+        self.stream = stream
+        self.priority = priority
+        self.client = client
+        self.deadline = deadline
+        self.queue_wait = 0.0  # Seconds spent in the scheduler, set when started
+        self.cancelled = threading.Event()
+        self.future: Optional[asyncio.Future] = None if stream else loop.create_future()
+        self.chunks: Optional[asyncio.Queue] = asyncio.Queue() if stream else None
+    
+    def _resolve(self, result: Any):
+        if not self.future.done():
+            if isinstance(result, _JobError):
+                self.future.set_exception(result.error)
+            else:
+                self.future.set_result(result)
+    
+    def _emit(self, item: Any):
+        self.loop.call_soon_threadsafe(self.chunks.put_nowait, item)
+    
+    def _add_queue_wait(self, result: Any):
+        """Report the time spent in the scheduler alongside the engine's usage"""
+        if isinstance(result, dict) and isinstance(result.get('usage'), dict):
+            result['usage']['queue_wait_ms'] = round(self.queue_wait * 1000, 2)
+    
+    # --- Thread-side API (also used by the batch engine) ---
+    
+    def emit(self, chunk: Any):
+        """Hand one streamed chunk to the event loop"""
+        self._add_queue_wait(chunk)
+        self._emit(chunk)
+    
+    def finish(self, result: Any = None):
+        """Complete the job: resolve the future, or close the stream"""
+        if self.stream:
+            self._emit(_END)
+        else:
+            self._add_queue_wait(result)
+            self.loop.call_soon_threadsafe(self._resolve, result)
+    
+    def fail(self, error: Exception):
+        """Complete the job with an error"""
+        if self.stream:
+            self._emit(_JobError(error))
+        else:
+            self.loop.call_soon_threadsafe(self._resolve, _JobError(error))
+    
+    def run(self, model: Any):
+        """Execute on the inference thread"""
+        if self.cancelled.is_set():
+            if self.stream:
+                self._emit(_END)
+            return
+        
+        try:
+            if self.stream:
+                iterator = self.fn(model)
+                try:
+                    for chunk in iterator:
+                        if self.cancelled.is_set():
+                            break
+                        self.emit(chunk)
+                finally:
+                    iterator.close()
+                self.finish()
+            else:
+                self.finish(self.fn(model))
+        except Exception as e:
+            self.fail(e)
+    
+    # --- Event-loop-side API ---
+    
+    async def result(self) -> Any:
+        """Await the result of a non-streaming job"""
+        try:
+            return await self.future
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+    
+    async def iter_chunks(self, deadline: Optional[float] = None) -> AsyncIterator[Any]:
+        """Yield the chunks of a streaming job; raises asyncio.TimeoutError past the deadline"""
+        try:
+            while True:
+                item = await asyncio.wait_for(self.chunks.get(), _remaining(deadline))
+                if item is _END:
+                    break
+                if isinstance(item, _JobError):
+                    raise item.error
+                yield item
+        finally:
+            # Stops the thread-side loop if the consumer went away early
+            self.cancelled.set()
+
+@dataclass
+class GenerationParams:
+    """Everything the inference thread needs to run one completion"""
+    prompt: str
+    temperature: float
+    max_tokens: int
+    top_p: float
+    stop: List[str] = field(default_factory=lambda: list(STOP_SEQUENCES))
+    session_id: Optional[str] = None
+    prefix: Optional[str] = None
+    speculative: bool = False
+    # Set when the caller goes away or runs out of time; checked once per token
+    cancelled: threading.Event = field(default_factory=threading.Event)
+
+class GenerationJob(InferenceJob):
+    """
+    A completion request. Replicas with a batch engine decode it alongside
+    other sequences; otherwise fn runs it through the backend's single-sequence path.
+    """
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop, fn: Callable[[Any], Any],
+                 stream: bool, params: GenerationParams, **scheduling):
+        super().__init__(loop, fn, stream, **scheduling)
+        self.params = params
+        self.cancelled = params.cancelled
+
+class InferenceExecutor:
+    """
+    Owns one model replica on a dedicated thread.
+    The event loop only enqueues jobs and awaits their results,
+    so health checks and cache hits are served during generation.
+    Every replica pulls from the same scheduler, so whichever one frees
+    up first starts the most urgent job.
+    """
+    
+    def __init__(self, scheduler: InferenceScheduler, index: int = 0, n_threads: int = 1,
+                 engine_factory: Optional[Callable[[Any, "InferenceExecutor"], Any]] = None):
+        self.index = index
+        self.n_threads = n_threads
+        self.name = f"inference-worker-{index}"
+        self.scheduler = scheduler
+        self.model: Optional[Any] = None
+        self.engine: Optional[Any] = None  # BatchEngine or the backend's equivalent
+        self.engine_factory = engine_factory
+        self.load_error: Optional[Exception] = None
+        self.thread: Optional[threading.Thread] = None
+        self.running = 0  # Jobs currently executing on the thread
+        self.inflight = 0  # Jobs taken from the scheduler and not finished yet
+        self.completed = 0
+        self._count_lock = threading.Lock()
+    
+    def start(self, loader: Callable[[], Any]):
+        """Start the worker thread and block until the model is loaded"""
+        ready = threading.Event()
+        self.thread = threading.Thread(
+            target=self._worker, args=(loader, ready), name=self.name, daemon=True
+        )
+        self.thread.start()
+        ready.wait()
+    
+    def _worker(self, loader: Callable[[], Any], ready: threading.Event):
+        try:
+            self.model = loader()
+            if self.engine_factory:
+                self.engine = self.engine_factory(self.model, self)
+        except Exception as e:
+            self.model = None
+            self.load_error = e
+        finally:
+            ready.set()
+        
+        if self.model is None:
+            return
+        
+        if self.engine:
+            self.engine.serve(self, self.run_job)
+            return
+        
+        while True:
+            job = self.get()
+            if job is None:
+                break
+            self.run_job(job)
+    
+    def get(self, block: bool = True) -> Optional[InferenceJob]:
+        """Take the next job from the scheduler (the queue interface batch engines pull from)"""
+        job = self.scheduler.get(block)
+        if job is not None:
+            with self._count_lock:
+                self.inflight += 1
+        return job
+    
+    def run_job(self, job: InferenceJob):
+        """Run a job to completion on this thread"""
+        self.running += 1
+        try:
+            job.run(self.model)
+        finally:
+            self.running -= 1
+            self.job_done()
+    
+    def job_done(self):
+        """Account for a finished job (called by run_job and the batch engine)"""
+        with self._count_lock:
+            self.inflight -= 1
+            self.completed += 1
+    
+    def stop(self):
+        """Ask the worker thread to exit after the current job"""
+        if self.thread and self.thread.is_alive():
+            self.scheduler.put(None)
+    
+    @property
+    def busy(self) -> bool:
+        return self.running > 0 or (self.engine is not None and self.engine.n_active > 0)
+    
+    @property
+    def is_alive(self) -> bool:
+        return self.model is not None and self.thread is not None and self.thread.is_alive()
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Snapshot of this replica's state for /health"""
+        status = {
+            "replica": self.index,
+            "state": "busy" if self.busy else "idle",
+            "alive": self.is_alive,
+            "inflight": self.inflight,
+            "completed": self.completed,
+            "threads": self.n_threads
+        }
+        if self.engine:
+            status["active_sequences"] = self.engine.n_active
+            status["max_sequences"] = self.engine.n_seq
+        return status
 
 class ModelManager:
-    """Manages model lifecycle and inference"""
+    """Manages model lifecycle and inference across a pool of replicas"""
     
     def __init__(self, config: settings):
         self.config = config
-        self.model: Optional[Llama] = None
+        self.model: Optional[Any] = None
         self.load_time: Optional[datetime] = None
         self.total_requests = 0
+        self.aborted_requests = {"disconnect": 0, "timeout": 0}
+        self.n_replicas = max(1, config.N_REPLICAS)
+        self.threads_per_replica = config.N_THREADS_PER_REPLICA or max(1, config.N_THREADS // self.n_replicas)
+        self.replicas: List[InferenceExecutor] = []
+        self.scheduler = InferenceScheduler(
+            urgent_seconds=config.SCHEDULER_URGENT_SECONDS,
+            weights=parse_weights(config.SCHEDULER_CLIENT_WEIGHTS)
+        )
+        self.prefix_cache = ByteBoundedLRU(max_bytes=config.PREFIX_CACHE_MAX_MB * 1024 * 1024)
+        self.backend: InferenceBackend = create_backend(config, self.prefix_cache, chat_service.kv_snapshots)
+        self.tokenizer: Optional[Any] = None  # Anything with llama.cpp's tokenize(text, add_bos, special)
+        self.document_token_counts: OrderedDict = OrderedDict()  # document digest -> tokens, oldest first
+        self._token_count_lock = threading.Lock()
+        self.prompt_builder = PromptBuilder(self.count_tokens, config.N_CTX,
+                                            count_document_tokens=self.count_document_tokens)
+        self.retriever = PolicyRetriever(self.embed, config.RETRIEVAL_BATCH_SIZE,
+                                         max_bytes=config.RETRIEVAL_CACHE_MAX_MB * 1024 * 1024)
         
+    @property
+    def batching(self) -> bool:
+        return self.config.BATCH_MAX_SEQUENCES > 1
+    
+    def _create_engine(self, model: Any, replica: InferenceExecutor) -> Optional[Any]:
+        """Continuous-batching engine for one replica (runs on its inference thread)"""
+        return self.backend.create_engine(model, replica.job_done, replica.n_threads)
+    
     def load_model(self):
-        """Load GGUF model with optimized settings"""
-        print(f"🔄 Loading model from: {self.config.MODEL_PATH}")
+        """Load model replicas through the configured backend"""
+        print(f"🔄 Loading {self.n_replicas} replica(s) from: {self.backend.source}")
         start = time.time()
         
-        try:
-            self.model = Llama(
-                model_path=self.config.MODEL_PATH,
-                n_ctx=self.config.N_CTX,
-                n_threads=self.config.N_THREADS,
-                n_gpu_layers=self.config.N_GPU_LAYERS,
-                verbose=self.config.DEBUG
+        for index in range(self.n_replicas):
+            replica = InferenceExecutor(
+                self.scheduler,
+                index=index,
+                n_threads=self.threads_per_replica,
+                engine_factory=self._create_engine if self.batching else None
             )
-        except Exception as e:
-            print(f"❌ FAILED to load model: {e}")
-            print("Please ensure the MODEL_PATH in your .env file is correct and the file exists.")
+            replica.start(lambda: self.backend.load(replica.n_threads))
+            if replica.load_error:
+                print(f"❌ FAILED to load replica {index}: {replica.load_error}")
+                print("Please ensure the MODEL_PATH in your .env file is correct and the file exists.")
+                continue
+            self.replicas.append(replica)
+        
+        if not self.replicas:
             return
+        
+        self.model = self.replicas[0].model
+        self.tokenizer = self.model  # Tokenizing only reads the vocab, so any thread may use it
 
         self.load_time = datetime.now()
         elapsed = time.time() - start
         print(f"✅ Model loaded successfully in {elapsed:.2f}s")
-        print(f"   - Context window: {self.config.N_CTX}")
-        print(f"   - GPU layers: {self.config.N_GPU_LAYERS}")
-        print(f"   - CPU threads: {self.config.N_THREADS}")
-    
-    def create_chat_prompt(self, 
-                           policy_text: str, 
-                           new_query: str, 
-                           history: List[Dict[str, str]],
-                           query_type: Optional[QueryType] = None) -> str:
+        print(f"   - Backend: {self.backend.name}")
+        print(f"   - Replicas: {len(self.replicas)}")
+        print(f"   - Context window: {self.config.N_CTX}")
+        print(f"   - GPU layers: {self.config.N_GPU_LAYERS}")
+        print(f"   - CPU threads per replica: {self.threads_per_replica}")
+        print(f"   - Memory-mapped weights: {self.config.USE_MMAP}")
+        print(f"   - Sequences per batch: {self.config.BATCH_MAX_SEQUENCES}")
+    
+    def shutdown(self):
+        """Stop all replica threads"""
+        for replica in self.replicas:
+            replica.stop()
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
+    
+    async def get_replica_status(self) -> List[Dict[str, Any]]:
+        """Per-replica busy/idle state"""
+        return [replica.get_status() for replica in self.replicas]
+    
+    async def get_scheduler_stats(self) -> Dict[str, Any]:
+        """Queue depth and wait time per priority class"""
+        return self.scheduler.get_stats()
+    
+    def use_speculative(self, query_type: Optional[QueryType]) -> bool:
+        """
+        Whether to draft tokens from the prompt for this query type.
+        Extraction-style answers copy long spans of the policy, so most drafts are accepted.
+        """
+        enabled = {name.strip() for name in self.config.SPECULATIVE_QUERY_TYPES.split(",")}
+        return query_type is not None and QueryType(query_type).value in enabled
+    
+    def record_abort(self, reason: str):
+        """Count a generation cut short by a client disconnect or a deadline"""
+        self.aborted_requests[reason] += 1
+    
+    def count_tokens(self, text: str) -> int:
+        """Tokens text takes up in the context window (estimated if no tokenizer is loaded)"""
+        if self.tokenizer is None:
+            return len(text.encode("utf-8")) // 3 + 1  # Conservative for English text
+        return len(self.tokenizer.tokenize(text.encode("utf-8"), False, False))
+    
+    def count_document_tokens(self, text: str) -> int:
+        """
+        count_tokens for a whole policy, memoized by content hash: every
+        question on a document sizes it, several times per prompt
+        """
+        key = document_digest(text)
+        with self._token_count_lock:
+            n_tokens = self.document_token_counts.get(key)
+            if n_tokens is not None:
+                self.document_token_counts.move_to_end(key)
+                return n_tokens
+        
+        n_tokens = self.count_tokens(text)
+        with self._token_count_lock:
+            self.document_token_counts[key] = n_tokens
+            if len(self.document_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+                self.document_token_counts.popitem(last=False)
+        return n_tokens
+    
+    async def embed(self, texts: List[str], priority: Priority = Priority.INTERACTIVE,
+                    client: str = "") -> np.ndarray:
+        """Unit-length embeddings, one row per text, computed on a replica"""
+        if not self.is_loaded:
+            raise RuntimeError("Model is not loaded.")
+        job = InferenceJob(asyncio.get_running_loop(), lambda model: self.backend.embed(model, texts),
+                           stream=False, priority=priority, client=client)
+        self.scheduler.put(job)
+        return await job.result()
+    
+    async def create_chat_prompt(self, 
+                                 policy_text: str, 
+                                 new_query: str, 
+                                 history: List[Dict[str, str]],
+                                 query_type: Optional[QueryType] = None,
+                                 max_tokens: Optional[int] = None,
+                                 priority: Priority = Priority.INTERACTIVE,
+                                 client: str = "") -> ChatPrompt:
         """
         Create optimized prompt including conversation history
-        for follow-up questions.
+        for follow-up questions, sized to leave max_tokens for the answer.
+        Policies that do not fit are cut down to the sections closest to the
+        question by embedding similarity (RETRIEVAL_ENABLED).
+        Use the returned prefix and max_tokens when generating.
         """
         
         # Query type specific instructions
@@ -60,49 +442,257 @@ class ModelManager:
         }
         
         instruction = instructions.get(query_type, "Provide a clear and accurate answer based *only* on the policy document and conversation history.")
+        max_tokens = max_tokens or self.config.MAX_TOKENS
         
-        # Build history string
-        history_str = ""
-        if history:
-            history_str = "--- Conversation History ---\n"
-            for msg in history:
-                role = "User" if msg['role'] == 'user' else 'Answer'
-                history_str += f"{role}: {msg['content']}\n"
-            history_str += "--- End History ---\n\n"
-
-        # Truncate policy text to save context window space
-        # We assume the model can find details in ~8k characters
-        truncated_policy = policy_text[:8000]
-
-        prompt = f"""### Insurance Policy Document:
-{truncated_policy}
-
-{history_str}### New Question:
-{new_query}
-
-### Instructions:
-{instruction}
-
-### Answer:"""
+        # Tokenizing a long policy takes a while; keep it off the event loop
+        sections, ranking = None, None
+        if self.config.RETRIEVAL_ENABLED and not await asyncio.to_thread(
+                self.prompt_builder.policy_fits, policy_text, new_query, instruction, max_tokens):
+            try:
+                sections, ranking = await self.retriever.rank(policy_text, new_query, self.config.RETRIEVAL_TOP_K,
+                                                              priority=priority, client=client)
+            except Exception as e:
+                # Term-overlap ranking still gives a usable prompt
+                print(f"Retrieval Error: {e}")
         
-        return prompt
+        return await asyncio.to_thread(
+            self.prompt_builder.build,
+            policy_text,
+            new_query,
+            history,
+            instruction,
+            max_tokens,
+            sections=sections,
+            ranking=ranking
+        )
+    
+    async def get_kv_cache_stats(self) -> Dict[str, Any]:
+        """Conversation snapshot and policy-prefix cache statistics"""
+        return {
+            "conversation_snapshots": chat_service.kv_snapshots.get_stats(),
+            "policy_prefix": self.prefix_cache.get_stats()
+        }
+    
+    def discard_session(self, session_id: str):
+        """Drop a conversation's state snapshot once the conversation is gone"""
+        chat_service.kv_snapshots.discard(session_id)
     
     def generate(self, prompt: str, temperature: float, 
-                 max_tokens: int, stream: bool = False):
-        """Generate response from model"""
-        if not self.model:
+                 max_tokens: int, stream: bool = False,
+                 session_id: Optional[str] = None,
+                 prefix: Optional[str] = None,
+                 speculative: bool = False,
+                 deadline: Optional[float] = None,
+                 priority: Priority = Priority.INTERACTIVE,
+                 client: str = ""):
+        """
+        Queue a generation on the inference thread.
+        Returns an awaitable result, or an async iterator of chunks when streaming.
+        Pass the conversation ID as session_id to resume from its KV snapshot,
+        and the policy prefix (see create_chat_prompt) to share its KV state.
+        speculative enables prompt-lookup decoding (see use_speculative); the
+        acceptance rate is reported in usage['speculative'].
+        Past the deadline (a time.monotonic() value) generation stops and
+        asyncio.TimeoutError is raised; abandoning the stream also stops it.
+        The scheduler starts jobs by priority class, then deadline and
+        fair share between clients (an API key or IP).
+        """
+        if not self.is_loaded:
             raise RuntimeError("Model is not loaded.")
             
         self.total_requests += 1
-        
-        return self.model(
-            prompt,
+        params = GenerationParams(
+            prompt=prompt,
             temperature=temperature,
             max_tokens=max_tokens,
             top_p=self.config.TOP_P,
-            stream=stream,
-            stop=["###", "User:", "Question:"] # Stop tokens
+            session_id=session_id if self.config.KV_SNAPSHOT_ENABLED else None,
+            prefix=prefix if self.config.PREFIX_CACHE_ENABLED and prefix and prompt.startswith(prefix) else None,
+            # Verifying drafts needs the batch engine's multi-token decode
+            speculative=speculative and self.batching
         )
+        job = GenerationJob(asyncio.get_running_loop(), self.backend.generation(params, stream),
+                            stream, params, priority=priority, client=client, deadline=deadline)
+        self.scheduler.put(job)
+        
+        if stream:
+            return job.iter_chunks(deadline)
+        return asyncio.wait_for(job.result(), _remaining(deadline))
+
+class RemoteModelManager(ModelManager):
+    """
+    Thin client for a model server process (see app/model_server.py).
+    Prompt building stays in the API worker; generation is forwarded over
+    a Unix socket so every uvicorn worker shares one copy of the weights.
+    """
+    
+    def __init__(self, config: settings):
+        super().__init__(config)
+        self.socket_path = config.MODEL_SERVER_SOCKET
+        self.server_status: Dict[str, Any] = {}
+        # Snapshots live in the model server, so evictions have to reach it there
+        chat_service.discard_snapshot = self.discard_session
+    
+    def load_model(self):
+        """Wait for the model server to come up instead of loading weights"""
+        print(f"🔌 Connecting to model server at: {self.socket_path}")
+        deadline = time.time() + self.config.MODEL_SERVER_CONNECT_TIMEOUT
+        
+        while True:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.socket_path)
+                    sock.sendall(pack_json(FRAME_REQUEST, {"op": "status"}))
+                    frame_type, body = recv_frame(sock)
+                if frame_type == FRAME_RESULT:
+                    self._apply_status(json.loads(body))
+                    break
+            except OSError:
+                pass
+            
+            if time.time() > deadline:
+                print(f"❌ FAILED to reach model server at {self.socket_path}")
+                print("Start it with `python run_model_server.py` or set INFERENCE_MODE=local.")
+                return
+            time.sleep(1)
+        
+        print(f"✅ Connected to model server ({self.n_replicas} replica(s))")
+        self._load_tokenizer()
+    
+    def _load_tokenizer(self):
+        """Load just the vocabulary so prompts can be sized without a round trip"""
+        try:
+            self.tokenizer = self.backend.load_tokenizer()
+        except Exception as e:
+            print(f"⚠️ Could not load the tokenizer ({e}), estimating prompt sizes instead")
+    
+    def _apply_status(self, status: Dict[str, Any]):
+        self.server_status = status
+        self.n_replicas = status["n_replicas"]
+        self.threads_per_replica = status["threads_per_replica"]
+        self.load_time = datetime.fromtimestamp(status["load_time"])
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self.load_time is not None
+    
+    def shutdown(self):
+        """Nothing to stop: the model server outlives API workers"""
+    
+    async def _open(self):
+        return await asyncio.open_unix_connection(self.socket_path)
+    
+    async def _call(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a request and wait for its single RESULT frame (cancelling closes the connection)"""
+        reader, writer = await self._open()
+        try:
+            writer.write(pack_json(FRAME_REQUEST, request))
+            await writer.drain()
+            frame_type, body = await read_frame(reader)
+            if frame_type == FRAME_ERROR:
+                raise RuntimeError(body.decode())
+            return json.loads(body)
+        finally:
+            writer.close()
+    
+    async def _stream(self, request: Dict[str, Any],
+                      deadline: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Send a request and yield CHUNK frames as llama.cpp-style chunks"""
+        reader, writer = await self._open()
+        try:
+            writer.write(pack_json(FRAME_REQUEST, request))
+            await writer.drain()
+            while True:
+                frame_type, body = await asyncio.wait_for(read_frame(reader), _remaining(deadline))
+                if frame_type == FRAME_CHUNK:
+                    yield {'choices': [{'text': body.decode()}]}
+                elif frame_type == FRAME_END:
+                    if body:
+                        yield json.loads(body) # Final chunk with usage
+                    break
+                elif frame_type == FRAME_ERROR:
+                    raise RuntimeError(body.decode())
+        finally:
+            # Closing the socket early cancels generation on the server
+            writer.close()
+    
+    async def get_replica_status(self) -> List[Dict[str, Any]]:
+        """Per-replica state as reported by the model server"""
+        try:
+            self._apply_status(await self._call({"op": "status"}))
+        except (OSError, asyncio.IncompleteReadError):
+            return []
+        return self.server_status["replicas"]
+    
+    async def embed(self, texts: List[str], priority: Priority = Priority.INTERACTIVE,
+                    client: str = "") -> np.ndarray:
+        """Embeddings computed by the model server"""
+        if not self.is_loaded:
+            raise RuntimeError("Model server is not connected.")
+        request = {"op": "embed", "texts": texts, "priority": int(priority), "client": client}
+        return unpack_matrix(await self._call(request))
+    
+    async def get_scheduler_stats(self) -> Dict[str, Any]:
+        """The model server's scheduler, shared by every API worker"""
+        try:
+            self._apply_status(await self._call({"op": "status"}))
+        except (OSError, asyncio.IncompleteReadError):
+            return {}
+        return self.server_status["scheduler"]
+    
+    async def get_kv_cache_stats(self) -> Dict[str, Any]:
+        """KV cache statistics, which live in the model server process"""
+        try:
+            self._apply_status(await self._call({"op": "status"}))
+        except (OSError, asyncio.IncompleteReadError):
+            return {}
+        return self.server_status["kv_cache_stats"]
+    
+    def discard_session(self, session_id: str):
+        """Ask the model server to drop a snapshot, without waiting for it"""
+        asyncio.ensure_future(self._discard(session_id))
+    
+    async def _discard(self, session_id: str):
+        try:
+            await self._call({"op": "discard", "session_id": session_id})
+        except (OSError, asyncio.IncompleteReadError, RuntimeError):
+            pass # The snapshot expires on the server anyway
+    
+    def generate(self, prompt: str, temperature: float, 
+                 max_tokens: int, stream: bool = False,
+                 session_id: Optional[str] = None,
+                 prefix: Optional[str] = None,
+                 speculative: bool = False,
+                 deadline: Optional[float] = None,
+                 priority: Priority = Priority.INTERACTIVE,
+                 client: str = ""):
+        """Forward a generation to the model server"""
+        if not self.is_loaded:
+            raise RuntimeError("Model server is not connected.")
+        
+        self.total_requests += 1
+        request = {
+            "op": "generate",
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream,
+            "session_id": session_id,
+            "speculative": speculative,
+            "priority": int(priority),
+            "client": client,
+            # Lets the server stop non-streaming work that nobody will wait for
+            "timeout": _remaining(deadline),
+            # The prefix is always the start of the prompt, so its length is enough
+            "prefix_len": len(prefix) if prefix is not None and prompt.startswith(prefix) else None
+        }
+        
+        if stream:
+            return self._stream(request, deadline)
+        return asyncio.wait_for(self._call(request), _remaining(deadline))
 
 # Single instance for the app
-model_manager = ModelManager(config=settings)
\ No newline at end of file
+if settings.INFERENCE_MODE == "remote":
+    model_manager = RemoteModelManager(config=settings)
+else:
+    model_manager = ModelManager(config=settings)
\ No newline at end of file
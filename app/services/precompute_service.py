@@ -0,0 +1,116 @@
+import asyncio
+from typing import List, Dict, Optional
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.models.api_models import BatchQueryRequest
+from app.services.batch_service import normalize_query, query_params, generate_answer
+from app.services.cache_service import response_cache, document_digest
+from app.services.scheduler import Priority
+
+class PrecomputeService:
+    """
+    Answers a standard list of questions about each new document ahead of
+    time, so the UI's suggested questions come straight from the response
+    cache. Generations run at background priority, which the scheduler only
+    starts when no chat or batch work is waiting, and one at a time so the
+    other batch slots stay free for interactive requests. Answers use the
+    same params as a /chat request that sets neither temperature nor
+    max_tokens, so they are cached under the keys those clicks look up.
+    """
+
+    MAX_SEEN_DOCUMENTS = 4096  # Document hashes remembered so a document is only queued once
+
+    def __init__(self, questions: List[str], queue_size: int):
+        self.questions = questions
+        self.queue_size = max(1, queue_size)
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.seen: OrderedDict = OrderedDict()  # document digest -> None, oldest first
+        self.scheduled = 0
+        self.dropped = 0
+        self.answered = 0
+        self.already_cached = 0
+        self.failed = 0
+
+    async def start(self):
+        if not self.questions:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.worker = asyncio.create_task(self._worker())
+        print(f"🧮 Precompute: {len(self.questions)} question(s) per new document")
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+        self.queue = None
+
+    def schedule(self, policy_text: str, asked: Optional[str] = None):
+        """
+        Queue a document the first time it is seen. asked is the question
+        that started the conversation; it is being answered already.
+        """
+        if self.queue is None:
+            return
+        digest = document_digest(policy_text)
+        if digest in self.seen:
+            self.seen.move_to_end(digest)
+            return
+
+        try:
+            self.queue.put_nowait((policy_text, normalize_query(asked) if asked else None))
+        except asyncio.QueueFull:
+            self.dropped += 1  # Busy; a later conversation on the same document can try again
+            return
+        self.seen[digest] = None
+        if len(self.seen) > self.MAX_SEEN_DOCUMENTS:
+            self.seen.popitem(last=False)
+        self.scheduled += 1
+
+    async def _worker(self):
+        while True:
+            policy_text, asked = await self.queue.get()
+            try:
+                request = BatchQueryRequest(policy_text=policy_text, queries=self.questions,
+                                            temperature=settings.TEMPERATURE, max_tokens=settings.MAX_TOKENS)
+            except ValueError as e:
+                print(f"Precompute Error: {e}")
+                continue
+            for question in self.questions:
+                if normalize_query(question) == asked:
+                    continue
+                await self._answer(request, question)
+
+    async def _answer(self, request: BatchQueryRequest, question: str):
+        # Checked just before generating: a user may have asked it in the meantime
+        if await response_cache.contains_async(request.policy_text, question, query_params(request, None)):
+            self.already_cached += 1
+            return
+        try:
+            await generate_answer(request, question, None, deadline=None, client="precompute",
+                                  priority=Priority.BACKGROUND, endpoint="precompute")
+            self.answered += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Precompute Error: {e}")
+
+    def get_stats(self) -> Dict:
+        return {
+            'enabled': self.queue is not None,
+            'questions': self.questions,
+            'documents_scheduled': self.scheduled,
+            'documents_dropped': self.dropped,
+            'documents_waiting': self.queue.qsize() if self.queue is not None else 0,
+            'answered': self.answered,
+            'already_cached': self.already_cached,
+            'failed': self.failed
+        }
+
+# Single instance for the app
+precompute_service = PrecomputeService(
+    questions=[q.strip() for q in settings.PRECOMPUTE_QUESTIONS.split("|") if q.strip()]
+    if settings.PRECOMPUTE_ENABLED else [],
+    queue_size=settings.PRECOMPUTE_QUEUE_SIZE
+)
@@ -0,0 +1,232 @@
+import re
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Dict, Callable, Tuple, Optional
+
+SECTION_MAX_CHARS = 1200
+
+# Bump when the chat prompts change so answers cached from the old ones are not served
+PROMPT_VERSION = 1
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;:])\s+|\n+")
+_STOPWORDS = {
+    "the", "and", "for", "are", "what", "which", "who", "how", "does", "this",
+    "that", "with", "from", "any", "can", "will", "there", "about", "policy",
+    "under", "have", "has", "into", "than", "then", "them", "they", "their",
+    "you", "your", "our", "its", "was", "were", "been", "not", "all", "also"
+}
+
+@dataclass
+class ChatPrompt:
+    """A prompt that fits the context window, and what went into it"""
+    prompt: str
+    prefix: str  # Policy block the prompt starts with (shared KV state)
+    max_tokens: int  # Output budget, lowered only if the prompt could not shrink further
+    token_counts: Dict[str, int] = field(default_factory=dict)
+
+def split_sections(policy_text: str) -> List[str]:
+    """Paragraphs of the policy, with long ones broken at sentence ends"""
+    sections = []
+    for paragraph in re.split(r"\n\s*\n", policy_text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= SECTION_MAX_CHARS:
+            if paragraph:
+                sections.append(paragraph)
+            continue
+
+        current = ""
+        for sentence in _SENTENCE_BREAK.split(paragraph):
+            # A run-on "sentence" (e.g. a table flattened to one line) is cut by size
+            for start in range(0, len(sentence), SECTION_MAX_CHARS):
+                piece = sentence[start:start + SECTION_MAX_CHARS]
+                if current and len(current) + len(piece) + 1 > SECTION_MAX_CHARS:
+                    sections.append(current)
+                    current = piece
+                else:
+                    current = f"{current} {piece}" if current else piece
+        if current:
+            sections.append(current)
+    return sections
+
+def _terms(text: str) -> set:
+    return {w for w in _WORD.findall(text.lower()) if len(w) > 2 and w not in _STOPWORDS}
+
+def rank_sections(sections: List[str], query: str) -> List[int]:
+    """Section indices, most relevant to the query first (idf-weighted term overlap)"""
+    query_terms = _terms(query)
+    matched = [_terms(section) & query_terms for section in sections]
+    df = Counter(term for terms in matched for term in terms)
+    n = len(sections)
+    scores = [sum(math.log(1 + n / df[term]) for term in terms) for terms in matched]
+    # Ties keep document order
+    return sorted(range(n), key=lambda i: (-scores[i], i))
+
+class PromptBuilder:
+    """
+    Builds chat prompts against a token budget instead of fixed character cuts.
+    max_tokens is reserved for the answer; the rest of the context window is
+    filled with the instructions, the question, the most relevant policy
+    sections and finally as much recent history as still fits.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], n_ctx: int,
+                 count_document_tokens: Optional[Callable[[str], int]] = None):
+        self.count_tokens = count_tokens
+        # Used for the whole-policy block, which every request sizes; may be memoized
+        self.count_document_tokens = count_document_tokens or count_tokens
+        self.n_ctx = n_ctx
+
+    @staticmethod
+    def format_policy(policy_text: str) -> str:
+        """Document block that opens every prompt"""
+        return f"### Insurance Policy Document:\n{policy_text}\n\n"
+
+    @staticmethod
+    def format_question(question: str, instruction: str) -> str:
+        return f"""### New Question:
+{question}
+
+### Instructions:
+{instruction}
+
+### Answer:"""
+
+    def _budget(self, n_tail: int, max_tokens: int) -> Tuple[int, int]:
+        """(output tokens, tokens left for policy and history)"""
+        # The instructions and question always go in (+1 for BOS); output gets
+        # max_tokens unless even that would not fit
+        fixed = n_tail + 1
+        max_tokens = max(1, min(max_tokens, self.n_ctx - fixed))
+        return max_tokens, self.n_ctx - fixed - max_tokens
+
+    def policy_fits(self, policy_text: str, question: str, instruction: str, max_tokens: int) -> bool:
+        """Whether build() will include the whole policy, i.e. no section ranking is needed"""
+        _, budget = self._budget(self.count_tokens(self.format_question(question, instruction)), max_tokens)
+        return self.count_document_tokens(self.format_policy(policy_text)) <= budget
+
+    def build(self, policy_text: str, question: str, history: List[Dict[str, str]],
+              instruction: str, max_tokens: int,
+              sections: Optional[List[str]] = None,
+              ranking: Optional[List[int]] = None) -> ChatPrompt:
+        """
+        Pass sections (from split_sections) and their ranking to override the
+        lexical relevance order used when the policy does not fit.
+        """
+        tail = self.format_question(question, instruction)
+        n_question = self.count_tokens(question)
+        n_tail = self.count_tokens(tail)
+        max_tokens, budget = self._budget(n_tail, max_tokens)
+
+        prefix, n_policy, sections_used, sections_total = self._fit_policy(
+            policy_text, question, budget, sections, ranking
+        )
+        history_str, n_history = self._fit_history(history, budget - n_policy)
+
+        prompt = prefix + history_str + tail
+        # The policy block ends in a blank line, so nothing merges across that seam and its
+        # count is reused instead of tokenizing the whole prompt again
+        total = n_policy + self.count_tokens(history_str + tail) + 1
+        # History and question were counted separately; merges at their seam can shift the total slightly
+        overflow = total + max_tokens - self.n_ctx
+        if overflow > 0:
+            max_tokens = max(1, max_tokens - overflow)
+
+        return ChatPrompt(
+            prompt=prompt,
+            prefix=prefix,
+            max_tokens=max_tokens,
+            token_counts={
+                "instructions": n_tail - n_question,
+                "question": n_question,
+                "policy": n_policy,
+                "history": n_history,
+                "total": total,
+                "policy_sections_used": sections_used,
+                "policy_sections_total": sections_total
+            }
+        )
+
+    def _fit_policy(self, policy_text: str, question: str, budget: int,
+                    sections: Optional[List[str]] = None,
+                    ranking: Optional[List[int]] = None) -> Tuple[str, int, int, int]:
+        """
+        The whole policy when it fits, so the prefix is identical for every
+        question on the document. Otherwise the sections most relevant to
+        this question, kept in document order. If not even one section fits,
+        the most relevant one is cut down to the budget; raises ValueError
+        when there is no room for any policy text at all.
+        """
+        block = self.format_policy(policy_text)
+        n_block = self.count_document_tokens(block)
+        if n_block <= budget:
+            return block, n_block, 1, 1
+
+        if sections is None:
+            sections, ranking = split_sections(policy_text), None
+        if ranking is None:
+            ranking = rank_sections(sections, question)
+        remaining = budget - self.count_tokens(self.format_policy(""))
+        chosen = []
+        for index in ranking:
+            cost = self.count_tokens(sections[index]) + 1  # +1 for the blank-line separator
+            # Keep scanning: a shorter, less relevant section may still fit
+            if cost <= remaining:
+                chosen.append(index)
+                remaining -= cost
+
+        if not chosen:
+            top = sections[ranking[0]] if sections else ""
+            head = self._truncate(top, remaining)
+            if not head:
+                raise ValueError("Context window too small for any of the policy; shorten the question or lower max_tokens")
+            block = self.format_policy(head)
+            return block, self.count_tokens(block), 1, len(sections)
+
+        block = self.format_policy("\n\n".join(sections[i] for i in sorted(chosen)))
+        return block, self.count_tokens(block), len(chosen), len(sections)
+
+    def _truncate(self, text: str, budget: int) -> str:
+        """The longest start of text that is at most budget tokens, cut between words where possible"""
+        if budget <= 0:
+            return ""
+        # Binary search on length: token count grows with every character kept
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count_tokens(text[:mid]) <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        head = text[:low]
+        if 0 < low < len(text) and not text[low].isspace() and not head[-1].isspace():
+            # A word split at the cut would tokenize differently from the original
+            cut = head.rfind(" ")
+            if cut > 0:
+                head = head[:cut]
+        return head.rstrip()
+
+    def _fit_history(self, history: List[Dict[str, str]], budget: int) -> Tuple[str, int]:
+        """The most recent messages that fit, oldest first"""
+        if not history or budget <= 0:
+            return "", 0
+
+        header = "--- Conversation History ---\n"
+        footer = "--- End History ---\n\n"
+        remaining = budget - self.count_tokens(header + footer)
+        lines = []
+        for msg in reversed(history):
+            role = "User" if msg['role'] == 'user' else 'Answer'
+            line = f"{role}: {msg['content']}\n"
+            cost = self.count_tokens(line)
+            if cost > remaining:
+                break
+            lines.append(line)
+            remaining -= cost
+
+        if not lines:
+            return "", 0
+
+        history_str = header + "".join(reversed(lines)) + footer
+        return history_str, self.count_tokens(history_str)
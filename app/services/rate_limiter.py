@@ -1,7 +1,9 @@
+import json
 import time
-from typing import Dict
+from typing import Dict, Optional
 from collections import defaultdict, deque
 from app.core.config import settings
+from app.services.cache_store import CacheStore, create_cache_store, written
 
 class RateLimiter:
     """Token bucket rate limiter per client IP"""
@@ -11,7 +13,7 @@ class RateLimiter:
         self.window = window_seconds
         self.clients: Dict[str, deque] = defaultdict(deque)
     
-    def is_allowed(self, client_ip: str) -> tuple[bool, int]:
+    async def check(self, client_ip: str) -> tuple[bool, int]:
         """Check if request is allowed, return (allowed, remaining)"""
         now = time.time()
         client_history = self.clients[client_ip]
@@ -25,9 +27,61 @@ class RateLimiter:
             return True, self.max_requests - len(client_history)
         
         return False, 0
+    
+    def get_client_count(self) -> int:
+        """Client IPs currently tracked"""
+        return len(self.clients)
+
+class SharedRateLimiter:
+    """
+    Counts kept in a CacheStore, so all API workers enforce one limit per
+    client instead of one each. Each client has a counter for the current
+    and the previous fixed window; the previous one is weighted by how much
+    of it still falls inside the sliding window, so a request costs one
+    atomic update rather than a list of timestamps.
+    """
+    
+    def __init__(self, store: CacheStore, max_requests: int = 100, window_seconds: int = 60):
+        self.max_requests = max_requests
+        self.window = window_seconds
+        self.store = store
+    
+    async def check(self, client_ip: str) -> tuple[bool, int]:
+        """Same contract as RateLimiter.check(), counted across workers"""
+        now = time.time()
+        window = int(now // self.window)
+        overlap = 1 - (now % self.window) / self.window
+        result = (False, 0)
+        
+        def count(current: Optional[str]) -> str:
+            nonlocal result  # Set on the store's writer thread; may run again if a Redis transaction retries
+            counts = json.loads(current) if current else {}
+            previous, this = counts.get(str(window - 1), 0), counts.get(str(window), 0)
+            used = previous * overlap + this
+            if used < self.max_requests:
+                this += 1
+                result = (True, max(0, int(self.max_requests - used - 1)))
+            else:
+                result = (False, 0)
+            return json.dumps({str(window - 1): previous, str(window): this})
+        
+        await written(self.store.update(client_ip, count))
+        return result
+    
+    def get_client_count(self) -> int:
+        return self.store.get_stats()['entries']
 
-# Single instance for the app
-rate_limiter = RateLimiter(
-    max_requests=settings.RATE_LIMIT_REQUESTS, 
-    window_seconds=settings.RATE_LIMIT_WINDOW
-)
\ No newline at end of file
+# Single instance for the app; several API workers must share the counts
+if settings.API_WORKERS > 1:
+    rate_limiter = SharedRateLimiter(
+        # Two windows of counts per client, a few hundred bytes each
+        create_cache_store(settings, "rate-limit", max_bytes=16 * 1024 * 1024,
+                           ttl_seconds=2 * settings.RATE_LIMIT_WINDOW),
+        max_requests=settings.RATE_LIMIT_REQUESTS,
+        window_seconds=settings.RATE_LIMIT_WINDOW
+    )
+else:
+    rate_limiter = RateLimiter(
+        max_requests=settings.RATE_LIMIT_REQUESTS, 
+        window_seconds=settings.RATE_LIMIT_WINDOW
+    )
\ No newline at end of file
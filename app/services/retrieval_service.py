@@ -0,0 +1,77 @@
+import asyncio
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Callable, Awaitable
+
+import numpy as np
+
+from app.services.byte_lru import ByteBoundedLRU
+from app.services.cache_service import document_digest
+from app.services.prompt_builder import split_sections
+
+@dataclass
+class PolicyIndex:
+    """A policy's sections and their embeddings, one unit-length row per section"""
+    sections: List[str]
+    vectors: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + sum(len(section) for section in self.sections)
+
+class PolicyRetriever:
+    """
+    Ranks policy sections by embedding similarity to the question.
+    Each document is split and embedded once; the vectors are kept per
+    document hash, so every later question only embeds itself and costs a
+    single matrix-vector product.
+    """
+
+    def __init__(self, embed: Callable[..., Awaitable[np.ndarray]],
+                 batch_size: int, max_bytes: int):
+        self.embed = embed
+        self.batch_size = max(1, batch_size)
+        self.indexes = ByteBoundedLRU(max_bytes=max_bytes)
+        self._building: Dict[str, asyncio.Future] = {}
+
+    async def get_index(self, policy_text: str, **scheduling) -> PolicyIndex:
+        """The document's index, building it once even if several questions arrive together"""
+        key = document_digest(policy_text)
+        index = self.indexes.get(key)
+        if index is not None:
+            return index
+
+        task = self._building.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._build(key, policy_text, **scheduling))
+            self._building[key] = task
+            task.add_done_callback(lambda _: self._building.pop(key, None))
+        # A cancelled request must not abort the build other requests are waiting on
+        return await asyncio.shield(task)
+
+    async def _build(self, key: str, policy_text: str, **scheduling) -> PolicyIndex:
+        sections = split_sections(policy_text)
+        # Batches keep each embedding job short, so generations interleave with them
+        batches = [await self.embed(sections[i:i + self.batch_size], **scheduling)
+                   for i in range(0, len(sections), self.batch_size)]
+        vectors = np.vstack(batches) if batches else np.zeros((0, 1), dtype=np.float32)
+
+        index = PolicyIndex(sections, vectors)
+        self.indexes.put(key, index, index.nbytes)
+        return index
+
+    async def rank(self, policy_text: str, question: str, top_k: int = 0,
+                   **scheduling) -> Tuple[List[str], List[int]]:
+        """
+        (sections, indices of the top_k most similar sections, best first); top_k=0 ranks all.
+        scheduling (priority, client) is passed on to the embedding jobs.
+        """
+        index = await self.get_index(policy_text, **scheduling)
+        if not index.sections:
+            return index.sections, []
+
+        query = (await self.embed([question], **scheduling))[0]
+        scores = index.vectors @ query  # Cosine similarity: every row is unit length
+        order = np.argsort(-scores, kind="stable")
+        if top_k > 0:
+            order = order[:top_k]
+        return index.sections, order.tolist()
@@ -0,0 +1,149 @@
+import time
+import heapq
+import queue
+import itertools
+import threading
+from enum import IntEnum
+from typing import List, Dict, Optional, Any
+
+class Priority(IntEnum):
+    """Scheduling classes; a lower value is always served first"""
+    INTERACTIVE = 0  # /chat
+    BATCH = 1        # /batch-query, /summarize
+    BACKGROUND = 2   # Precompute and other idle-time work
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """'client:weight,client:weight' -> {client: weight}"""
+    weights = {}
+    for item in spec.split(","):
+        client, _, weight = item.strip().rpartition(":")
+        if client:
+            weights[client] = float(weight)
+    return weights
+
+class _Client:
+    """One client's queued jobs in one class, earliest deadline first"""
+
+    def __init__(self, weight: float, vtime: float):
+        self.weight = weight
+        self.jobs: List[tuple] = []  # (deadline, seq, job) heap
+        self.vtime = vtime  # Virtual time consumed, in jobs / weight
+
+class _Class:
+    def __init__(self):
+        self.clients: Dict[str, _Client] = {}
+        self.vclock = 0.0  # Virtual time of the last job started
+        self.depth = 0
+        self.started = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+class InferenceScheduler:
+    """
+    Shared job queue for every replica thread.
+
+    Classes are strictly ordered (interactive, batch, background). Within a
+    class each client (API key or IP) has its own earliest-deadline-first
+    queue, and clients take turns by weighted fair queuing, so a client
+    submitting large batches cannot starve the others. A job whose deadline
+    is less than urgent_seconds away is served first regardless of turns.
+
+    Speaks the queue.Queue subset the replicas use: put, get(block), qsize.
+    """
+
+    def __init__(self, urgent_seconds: float = 5.0, weights: Optional[Dict[str, float]] = None):
+        self.urgent_seconds = urgent_seconds
+        self.weights = weights or {}
+        self.classes = {priority: _Class() for priority in Priority}
+        self.stop_signals = 0  # Pending None sentinels, one per replica thread to stop
+        self.idle = 0  # Threads blocked in get()
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+
+    def put(self, job: Any):
+        """Queue a job; None asks one replica thread to stop"""
+        with self.cond:
+            if job is None:
+                self.stop_signals += 1
+            else:
+                job.enqueued_at = time.monotonic()
+                cls = self.classes[job.priority]
+                client = cls.clients.get(job.client)
+                if client is None:
+                    # A client returning from idle gets no credit for the time it was away
+                    client = cls.clients[job.client] = _Client(self.weights.get(job.client, 1.0), cls.vclock)
+                deadline = job.deadline if job.deadline is not None else float("inf")
+                heapq.heappush(client.jobs, (deadline, next(self.seq), job))
+                cls.depth += 1
+            self.cond.notify()
+
+    def get(self, block: bool = True) -> Any:
+        """
+        Next job to run. A non-blocking get from a busy replica leaves jobs to
+        idle replicas, so work spreads across replicas before it is batched,
+        and never takes background work: that would share decode slots with
+        the interactive requests already running there.
+        """
+        with self.cond:
+            while True:
+                if self.stop_signals:
+                    self.stop_signals -= 1
+                    return None
+                lowest = Priority.BACKGROUND if block else Priority.BATCH
+                depth = self._depth(lowest)
+                if depth and (block or depth > self.idle):
+                    return self._pop(lowest)
+                if not block:
+                    raise queue.Empty
+                self.idle += 1
+                try:
+                    self.cond.wait()
+                finally:
+                    self.idle -= 1
+
+    def _depth(self, lowest: Priority = Priority.BACKGROUND) -> int:
+        """Jobs queued in the classes up to and including lowest"""
+        return sum(cls.depth for priority, cls in self.classes.items() if priority <= lowest)
+
+    def qsize(self) -> int:
+        with self.cond:
+            return self._depth()
+
+    def _pop(self, lowest: Priority = Priority.BACKGROUND) -> Any:
+        cls = next(c for priority, c in self.classes.items() if priority <= lowest and c.depth)
+        now = time.monotonic()
+        active = list(cls.clients.items())
+
+        # Earliest deadline overall if it is about to be missed, otherwise the client
+        # furthest behind its fair share (active clients are few, so a scan is fine)
+        name, client = min(active, key=lambda item: item[1].jobs[0][0])
+        if client.jobs[0][0] - now > self.urgent_seconds:
+            name, client = min(active, key=lambda item: (item[1].vtime, item[1].jobs[0][0]))
+
+        _, _, job = heapq.heappop(client.jobs)
+        cls.vclock = client.vtime
+        client.vtime += 1.0 / client.weight
+        if not client.jobs:
+            del cls.clients[name]  # Idle clients are forgotten, so the table stays small
+        cls.depth -= 1
+
+        wait = now - job.enqueued_at
+        job.queue_wait = wait
+        cls.started += 1
+        cls.wait_total += wait
+        cls.wait_max = max(cls.wait_max, wait)
+        return job
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and wait times per class for /health"""
+        with self.cond:
+            classes = {}
+            for priority, cls in self.classes.items():
+                classes[priority.name.lower()] = {
+                    'queued': cls.depth,
+                    'clients_waiting': len(cls.clients),
+                    'started': cls.started,
+                    'avg_wait_ms': round(cls.wait_total / cls.started * 1000, 2) if cls.started else 0.0,
+                    'max_wait_ms': round(cls.wait_max * 1000, 2)
+                }
+            return {'queued': self._depth(), 'idle_workers': self.idle, 'classes': classes}
@@ -0,0 +1,255 @@
+import os
+import re
+import time
+import zlib
+import queue
+import random
+import hashlib
+from typing import List, Dict, Optional, Any, Callable, Iterator
+
+import numpy as np
+
+from app.services.inference_backend import InferenceBackend, phase_timings
+
+STUB_VOCAB_SIZE = 32000
+STUB_BOS = 1
+STUB_EMBEDDING_DIM = 256
+
+# Roughly BPE-sized pieces: words cut every 4 characters, punctuation on its own
+_PIECE = re.compile(rb"\w{1,4}|[^\w\s]")
+
+# Generated text is drawn from these, seeded by the prompt
+_WORDS = (
+    "the", "policy", "covers", "insured", "sum", "premium", "benefit", "claim",
+    "exclusion", "period", "hospitalisation", "limit", "per", "annum", "waiting",
+    "applies", "subject", "to", "conditions", "and", "of", "is", "not", "covered"
+)
+
+def _common_prefix(a: List[int], b: List[int]) -> int:
+    return len(os.path.commonprefix([a, b]))
+
+class _StubSequence:
+    """Deterministic output for one prompt: same prompt, same tokens"""
+
+    def __init__(self, params: Any, n_prompt: int, n_reused: int, max_tokens: int):
+        self.params = params
+        self.n_prompt = n_prompt
+        self.n_reused = n_reused
+        self.pending = n_prompt - n_reused  # Prompt tokens still to "evaluate"
+        self.max_tokens = max_tokens
+        self.rng = random.Random(hashlib.sha256(params.prompt.encode("utf-8")).digest())
+        self.pieces: List[str] = []
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return len(self.pieces) >= self.max_tokens
+
+    def next_piece(self) -> str:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        piece = " " + self.rng.choice(_WORDS)
+        self.pieces.append(piece)
+        return piece
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            'prompt_tokens': self.n_prompt,
+            'completion_tokens': len(self.pieces),
+            'total_tokens': self.n_prompt + len(self.pieces),
+            'cached_prompt_tokens': self.n_reused,
+            **phase_timings(self.started, self.first_token_at)
+        }
+
+    def finish_reason(self) -> str:
+        return "length" if self.done else "stop"
+
+class StubModel:
+    """
+    Stand-in for one Llama replica. Tokenizes deterministically and sleeps
+    for the configured prompt-eval and per-token latencies. Like llama.cpp
+    it keeps the last prompt's tokens and only pays for the new suffix.
+    """
+
+    def __init__(self, config):
+        self.prompt_ms = config.STUB_PROMPT_MS_PER_TOKEN
+        self.token_ms = config.STUB_TOKEN_MS
+        self.completion_tokens = config.STUB_COMPLETION_TOKENS
+        self.n_ctx = config.N_CTX
+        self.cache_tokens: List[int] = []
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> List[int]:
+        tokens = [zlib.crc32(piece) % (STUB_VOCAB_SIZE - 2) + 2 for piece in _PIECE.findall(text)]
+        return [STUB_BOS] + tokens if add_bos else tokens
+
+    def start(self, params: Any, tokens: List[int], n_reused: int) -> _StubSequence:
+        if len(tokens) >= self.n_ctx:
+            raise ValueError(f"Requested tokens ({len(tokens)}) exceed context window of {self.n_ctx}")
+        max_tokens = min(params.max_tokens, self.completion_tokens, self.n_ctx - len(tokens))
+        return _StubSequence(params, len(tokens), n_reused, max_tokens)
+
+    def complete(self, params: Any) -> Iterator[Dict[str, Any]]:
+        """Stream llama.cpp-style chunks, the last one carrying finish_reason and usage"""
+        tokens = self.tokenize(params.prompt.encode("utf-8"))
+        seq = self.start(params, tokens, _common_prefix(self.cache_tokens, tokens))
+        self.cache_tokens = tokens
+        time.sleep(seq.pending * self.prompt_ms / 1000)
+
+        while not seq.done and not params.cancelled.is_set():
+            time.sleep(self.token_ms / 1000)
+            yield {'choices': [{'text': seq.next_piece(), 'index': 0, 'finish_reason': None}]}
+
+        yield {'choices': [{'text': '', 'index': 0, 'finish_reason': seq.finish_reason()}],
+               'usage': seq.usage()}
+
+class StubBatchEngine:
+    """
+    Continuous batching with the same admission and step structure as
+    BatchEngine: each step prefills up to n_batch prompt tokens and yields one
+    token per running sequence, costing prompt-eval time plus one token time.
+    """
+
+    def __init__(self, model: StubModel, on_done: Callable[[], None], n_seq: int, n_batch: int):
+        self.model = model
+        self.on_done = on_done
+        self.n_seq = n_seq
+        self.n_batch = n_batch
+        self.slots: List[Optional[tuple]] = [None] * n_seq  # (job, sequence) per slot
+        self.cache_tokens: List[List[int]] = [[] for _ in range(n_seq)]
+
+    @property
+    def n_active(self) -> int:
+        return sum(1 for slot in self.slots if slot is not None)
+
+    def serve(self, jobs: queue.Queue, run_other: Callable[[Any], None]):
+        """Run on the replica thread until a None job arrives"""
+        while True:
+            while self.n_active < self.n_seq:
+                try:
+                    job = jobs.get(block=self.n_active == 0)
+                except queue.Empty:
+                    break
+
+                if job is None:
+                    for index, slot in enumerate(self.slots):
+                        if slot is not None:
+                            self._retire(index, error=RuntimeError("Inference engine shut down"))
+                    return
+                if getattr(job, "params", None) is None:
+                    run_other(job)
+                else:
+                    self._admit(job)
+
+            if self.n_active:
+                self._step()
+
+    def _admit(self, job: Any):
+        if job.cancelled.is_set():
+            job.finish()
+            self.on_done()
+            return
+
+        try:
+            tokens = self.model.tokenize(job.params.prompt.encode("utf-8"))
+            n_reused = max(_common_prefix(cached, tokens) for cached in self.cache_tokens)
+            seq = self.model.start(job.params, tokens, n_reused)
+        except Exception as e:
+            job.fail(e)
+            self.on_done()
+            return
+
+        index = self.slots.index(None)
+        self.slots[index] = (job, seq)
+        self.cache_tokens[index] = tokens
+
+    def _step(self):
+        budget = self.n_batch
+        ready = []
+        for index, slot in enumerate(self.slots):
+            if slot is None:
+                continue
+            job, seq = slot
+            if job.cancelled.is_set():
+                self._retire(index, cancelled=True)
+                continue
+            if seq.pending:
+                n = min(budget, seq.pending)
+                seq.pending -= n
+                budget -= n
+            if not seq.pending:
+                ready.append(index)
+
+        prefilled = self.n_batch - budget
+        time.sleep((prefilled * self.model.prompt_ms + (self.model.token_ms if ready else 0)) / 1000)
+
+        for index in ready:
+            job, seq = self.slots[index]
+            piece = seq.next_piece()
+            if job.stream:
+                job.emit({'choices': [{'text': piece, 'index': 0, 'finish_reason': None}]})
+            if seq.done:
+                self._retire(index)
+
+    def _retire(self, index: int, cancelled: bool = False, error: Optional[Exception] = None):
+        job, seq = self.slots[index]
+        if error is not None:
+            job.fail(error)
+        elif cancelled:
+            job.finish()
+        elif job.stream:
+            job.emit({'choices': [{'text': '', 'index': 0, 'finish_reason': seq.finish_reason()}],
+                      'usage': seq.usage()})
+            job.finish()
+        else:
+            job.finish({'choices': [{'text': "".join(seq.pieces), 'index': 0,
+                                     'finish_reason': seq.finish_reason()}],
+                        'usage': seq.usage()})
+        self.slots[index] = None
+        self.on_done()
+
+class StubBackend(InferenceBackend):
+    """
+    Deterministic backend for benchmarks and CI: no model file, no llama.cpp.
+    Exercises the API, caches, replicas and batching with realistic timing.
+    """
+
+    name = "stub"
+
+    def __init__(self, config):
+        self.config = config
+
+    def load(self, n_threads: int) -> StubModel:
+        return StubModel(self.config)
+
+    def create_engine(self, model: StubModel, on_done: Callable[[], None], n_threads: int) -> Optional[StubBatchEngine]:
+        if self.config.BATCH_MAX_SEQUENCES <= 1:
+            return None
+        return StubBatchEngine(model, on_done, self.config.BATCH_MAX_SEQUENCES, self.config.N_BATCH)
+
+    def load_tokenizer(self) -> StubModel:
+        return StubModel(self.config)
+
+    def embed(self, model: StubModel, texts: List[str]) -> np.ndarray:
+        """Hashed bag of tokens: deterministic, and lexically similar texts score high"""
+        vectors = np.zeros((len(texts), STUB_EMBEDDING_DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = model.tokenize(text.lower().encode("utf-8"), False)
+            np.add.at(vectors[row], np.asarray(tokens, dtype=np.int64) % STUB_EMBEDDING_DIM, 1.0)
+            time.sleep(len(tokens) * model.prompt_ms / 1000)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def generation(self, params: Any, stream: bool) -> Callable[[StubModel], Any]:
+        def run(model: StubModel):
+            chunks = model.complete(params)
+            if stream:
+                return chunks
+
+            pieces = list(chunks)
+            final = pieces[-1]
+            text = "".join(chunk['choices'][0]['text'] for chunk in pieces)
+            return {'choices': [{'text': text, 'index': 0, 'finish_reason': final['choices'][0]['finish_reason']}],
+                    'usage': final['usage']}
+
+        return run
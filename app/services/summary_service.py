@@ -0,0 +1,232 @@
+import math
+import time
+import zlib
+import asyncio
+import hashlib
+from typing import List, Dict, Optional, Any, AsyncIterator
+
+from app.core.config import settings
+from app.services.cache_service import ResponseCacheService, summary_cache
+from app.services.model_service import model_manager
+from app.services.prompt_builder import split_sections
+from app.services.scheduler import Priority
+
+# Bump when the prompts change so stale summaries are not served
+SUMMARY_PROMPT_VERSION = 1
+
+# A chunk may end after a section whose hash hits this modulus (once it is
+# half full), so boundaries depend on content, not position: an edit early in
+# a document only changes the chunks around it and the rest stay cached
+_BOUNDARY_MODULUS = 4
+
+def _content_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class PolicySummarizer:
+    """
+    Map-reduce summarization for policies of any length. The document is
+    cut into token-bounded chunks that are summarized concurrently (the
+    replicas and batch engine run them side by side), then the partial
+    summaries are merged, in several rounds if they do not fit one prompt.
+    Chunk summaries are cached by content hash.
+    """
+
+    def __init__(self, manager, cache: ResponseCacheService, chunk_tokens: int, section_max_tokens: int):
+        self.manager = manager
+        self.cache = cache
+        self.chunk_tokens = chunk_tokens
+        self.section_max_tokens = section_max_tokens
+
+    @staticmethod
+    def map_prompt(chunk: str, final: bool = False) -> str:
+        instruction = (
+            "Summarize this policy in clear, plain language in about 200 words, covering key features, "
+            "coverage, exclusions, limits and financial terms."
+            if final else
+            "Summarize this part of the policy. Keep every coverage, exclusion, limit, waiting period "
+            "and financial term it states."
+        )
+        return f"""### Insurance Policy Excerpt:
+{chunk}
+
+### Instructions:
+{instruction}
+
+### Answer:"""
+
+    @staticmethod
+    def reduce_prompt(summaries: List[str], final: bool) -> str:
+        parts = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(summaries))
+        instruction = (
+            "Combine these partial summaries into one clear, plain-language summary of about 200 words "
+            "covering key features, coverage, exclusions, limits and financial terms."
+            if final else
+            "Merge these partial summaries into one, keeping every coverage, exclusion, limit and financial term."
+        )
+        return f"""### Partial Summaries of an Insurance Policy:
+{parts}
+
+### Instructions:
+{instruction}
+
+### Answer:"""
+
+    def _input_budget(self, template: str, max_tokens: int) -> int:
+        """Tokens left for the text a prompt template wraps, when max_tokens are kept for its output"""
+        return self.manager.config.N_CTX - max_tokens - self.manager.count_tokens(template) - 1
+
+    def chunk(self, policy_text: str) -> List[str]:
+        """
+        Sections packed into chunks of at most chunk_tokens (less if a map
+        prompt would not otherwise fit), cut at content-defined boundaries
+        """
+        chunk_tokens = min(self.chunk_tokens, self._input_budget(self.map_prompt(""), self.section_max_tokens))
+        chunks, current, size = [], [], 0
+        for section in split_sections(policy_text):
+            cost = self.manager.count_tokens(section) + 1
+            if current and size + cost > chunk_tokens:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(section)
+            size += cost
+            if size >= chunk_tokens // 2 and zlib.crc32(section.encode("utf-8")) % _BOUNDARY_MODULUS == 0:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+        if current:
+            chunks.append("\n\n".join(current))
+        return chunks
+
+    def _deadline(self, n_chunks: int, section_timeout: float) -> Optional[float]:
+        """
+        A deadline that grows with the document: section_timeout for every
+        round of chunks the replicas can run at once, plus one for the merge
+        """
+        if section_timeout <= 0:
+            return None
+        parallel = max(1, self.manager.n_replicas * max(1, self.manager.config.BATCH_MAX_SEQUENCES))
+        return time.monotonic() + section_timeout * (math.ceil(n_chunks / parallel) + 1)
+
+    def _pack(self, summaries: List[str], budget: int) -> List[List[str]]:
+        """Group partial summaries so each group's reduce prompt fits the budget"""
+        groups, current, size = [], [], 0
+        for summary in summaries:
+            cost = self.manager.count_tokens(summary) + 8  # "Part n:" header and spacing
+            if current and size + cost > budget:
+                groups.append(current)
+                current, size = [], 0
+            current.append(summary)
+            size += cost
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _generate(self, prompt: str, temperature: float, max_tokens: int,
+                        deadline: Optional[float], client: str) -> str:
+        result = await self.manager.generate(prompt, temperature, max_tokens, stream=False, deadline=deadline,
+                                             priority=Priority.BATCH, client=client)
+        return result['choices'][0]['text'].strip()
+
+    async def _summarize_chunk(self, index: int, chunk: str, temperature: float,
+                               use_cache: bool, deadline: Optional[float], client: str):
+        params = {'temperature': temperature, 'max_tokens': self.section_max_tokens,
+                  'kind': 'section', 'version': SUMMARY_PROMPT_VERSION}
+        key = _content_key(chunk)
+        if use_cache:
+            cached = await self.cache.get_async(key, "", params)
+            if cached is not None:
+                return index, cached, True
+
+        summary = await self._generate(self.map_prompt(chunk), temperature, self.section_max_tokens,
+                                       deadline, client)
+        if use_cache:
+            self.cache.set(key, "", params, summary)
+        return index, summary, False
+
+    async def summarize(self, policy_text: str, temperature: float, max_tokens: int,
+                        use_cache: bool = True, deadline: Optional[float] = None,
+                        client: str = "", section_timeout: float = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield progress events ('plan', 'section', 'reduce') and finally a
+        'summary' event. Closing the iterator cancels outstanding generations.
+        Generations are scheduled as batch work on behalf of client.
+        Without a deadline, a section_timeout > 0 sets one scaled to the
+        number of chunks once the document is planned.
+        """
+        params = {'temperature': temperature, 'max_tokens': max_tokens,
+                  'kind': 'document', 'version': SUMMARY_PROMPT_VERSION}
+        document_key = _content_key(policy_text)
+        if use_cache:
+            cached = await self.cache.get_async(document_key, "", params)
+            if cached is not None:
+                yield {'event': 'summary', 'summary': cached, 'cached': True,
+                       'sections_total': 0, 'sections_cached': 0, 'reduce_passes': 0}
+                return
+
+        # Tokenizing every section of a long policy takes a while; keep it off the event loop
+        chunks = await asyncio.to_thread(self.chunk, policy_text)
+        if deadline is None:
+            deadline = self._deadline(len(chunks), section_timeout)
+        yield {'event': 'plan', 'sections': len(chunks)}
+
+        final_budget = self._input_budget(self.reduce_prompt([], True), max_tokens)
+        merge_budget = self._input_budget(self.reduce_prompt([], False), self.section_max_tokens)
+
+        if len(chunks) == 1 and self.manager.count_tokens(chunks[0]) <= self._input_budget(
+                self.map_prompt("", final=True), max_tokens):
+            # Fits one prompt: a single pass, no partial summaries to merge
+            summary = await self._generate(self.map_prompt(chunks[0], final=True), temperature, max_tokens,
+                                           deadline, client)
+            if use_cache:
+                self.cache.set(document_key, "", params, summary)
+            yield {'event': 'summary', 'summary': summary, 'cached': False,
+                   'sections_total': 1, 'sections_cached': 0, 'reduce_passes': 0}
+            return
+
+        # --- Map: every chunk at once, reported as each one finishes ---
+        summaries: List[Optional[str]] = [None] * len(chunks)
+        n_cached = 0
+        tasks = [asyncio.ensure_future(self._summarize_chunk(i, chunk, temperature, use_cache, deadline, client))
+                 for i, chunk in enumerate(chunks)]
+        try:
+            for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+                index, summary, cached = await task
+                summaries[index] = summary
+                n_cached += cached
+                yield {'event': 'section', 'index': index, 'completed': done,
+                       'total': len(chunks), 'cached': cached}
+
+            # --- Reduce: merge groups until what is left fits the final prompt ---
+            # Each pass is budgeted for its own output: section_max_tokens for the
+            # intermediate merges, the caller's max_tokens for the final one
+            passes = 0
+            while len(self._pack(summaries, final_budget)) > 1:
+                groups = self._pack(summaries, merge_budget)
+                if len(groups) == len(summaries):
+                    raise ValueError("Context window too small to merge section summaries; lower max_tokens")
+                passes += 1
+                yield {'event': 'reduce', 'pass': passes, 'inputs': len(summaries), 'outputs': len(groups)}
+                tasks = [asyncio.ensure_future(self._generate(self.reduce_prompt(group, False), temperature,
+                                                              self.section_max_tokens, deadline, client))
+                         for group in groups]
+                summaries = await asyncio.gather(*tasks)
+
+            passes += 1
+            yield {'event': 'reduce', 'pass': passes, 'inputs': len(summaries), 'outputs': 1}
+            summary = await self._generate(self.reduce_prompt(summaries, True), temperature, max_tokens,
+                                           deadline, client)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if use_cache:
+            self.cache.set(document_key, "", params, summary)
+        yield {'event': 'summary', 'summary': summary, 'cached': False,
+               'sections_total': len(chunks), 'sections_cached': n_cached, 'reduce_passes': passes}
+
+# Single instance for the app
+policy_summarizer = PolicySummarizer(
+    model_manager,
+    summary_cache,
+    chunk_tokens=settings.SUMMARY_CHUNK_TOKENS,
+    section_max_tokens=settings.SUMMARY_SECTION_MAX_TOKENS
+)
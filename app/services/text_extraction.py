@@ -0,0 +1,19 @@
+import os
+
+# Kept free of app imports: extraction runs in spawned worker processes
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+def extract_text(path: str) -> str:
+    """Plain text of a PDF, DOCX or TXT file (runs in a worker process)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pdf":
+        import PyPDF2  # Only needed for PDFs, like the middleware's upload route
+        reader = PyPDF2.PdfReader(path)
+        pages = (page.extract_text() for page in reader.pages)
+        return "\n".join(text for text in pages if text).strip()
+    if extension == ".docx":
+        import docx  # python-docx
+        document = docx.Document(path)
+        return "\n\n".join(paragraph.text for paragraph in document.paragraphs if paragraph.text).strip()
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read().strip()
@@ -1,3 +1,4 @@
+import sys
 import uvicorn
 from app.core.config import settings
 
@@ -9,10 +10,20 @@ if __name__ == "__main__":
     ╚══════════════════════════════════════════════════════════════╝
     """)
     
+    if settings.API_WORKERS > 1:
+        # Otherwise every worker loads its own model, or keeps conversations and rate limits to itself
+        if settings.INFERENCE_MODE != "remote":
+            print("❌ API_WORKERS > 1 needs INFERENCE_MODE=remote and a running model server")
+            sys.exit(1)
+        if settings.CACHE_BACKEND == "memory":
+            print("❌ API_WORKERS > 1 needs a shared CACHE_BACKEND (sqlite or redis) for conversations and rate limits")
+            sys.exit(1)
+    
     uvicorn.run(
         "app.main:app",  # Points to the app object in app/main.py
         host="0.0.0.0",
         port=8000,
         reload=settings.DEBUG,
+        workers=settings.API_WORKERS,  # Use INFERENCE_MODE=remote to share one model across workers
         log_level="info"
     )
\ No newline at end of file
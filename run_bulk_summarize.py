@@ -0,0 +1,11 @@
+from app.bulk_summarize import main
+
+if __name__ == "__main__":
+    print("""
+    ╔══════════════════════════════════════════════════════════════╗
+    ║  Insurance Policy Bulk Summarizer                            ║
+    ║  Directory of PDF / DOCX / TXT policies -> JSONL             ║
+    ╚══════════════════════════════════════════════════════════════╝
+    """)
+
+    main()
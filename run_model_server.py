@@ -0,0 +1,11 @@
+from app.model_server import main
+
+if __name__ == "__main__":
+    print("""
+    ╔══════════════════════════════════════════════════════════════╗
+    ║  Insurance Policy Model Server                               ║
+    ║  Shared by all API workers (INFERENCE_MODE=remote)           ║
+    ╚══════════════════════════════════════════════════════════════╝
+    """)
+
+    main()
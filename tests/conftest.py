@@ -0,0 +1,25 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings are read once, when app.core.config is first imported: point them at the
+# stub backend and throwaway databases before any test imports the app
+_tmp = tempfile.mkdtemp(prefix="policy-api-tests-")
+os.environ["INFERENCE_BACKEND"] = "stub"
+os.environ["CACHE_DB_PATH"] = os.path.join(_tmp, "cache.db")
+os.environ["JOBS_DB_PATH"] = os.path.join(_tmp, "jobs.db")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["PRECOMPUTE_ENABLED"] = "false"
+os.environ["STUB_TOKEN_MS"] = "1"
+os.environ["STUB_PROMPT_MS_PER_TOKEN"] = "0"
+os.environ["JOB_POLL_SECONDS"] = "0.1"
+
+@pytest.fixture(scope="session")
+def client():
+    """The API on the stub backend, started once for the whole run"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
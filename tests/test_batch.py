@@ -0,0 +1,63 @@
+import json
+import uuid
+
+from app.services.model_service import model_manager
+
+def policy_text() -> str:
+    """A document no other test has cached answers for"""
+    return f"Policy {uuid.uuid4()}: hospitalisation is covered up to a sum insured of Rs 5,00,000. " * 10
+
+def test_results_keep_input_order_and_share_duplicates(client):
+    queries = ["What is covered?", "what  is COVERED?", "What is the premium?", "What is the premium?"]
+    response = client.post("/batch-query", json={"policy_text": policy_text(), "queries": queries})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["query"] for result in results] == queries
+    assert [result["duplicate_of"] for result in results] == [None, 0, None, 2]
+    assert results[1]["response"] == results[0]["response"]
+    assert results[3]["response"] == results[2]["response"]
+    assert all(result["error"] is None for result in results)
+
+def test_repeated_batch_is_answered_from_cache(client):
+    request = {"policy_text": policy_text(), "queries": ["Is dental covered?", "What is excluded?"]}
+    first = client.post("/batch-query", json=request).json()["results"]
+    second = client.post("/batch-query", json=request).json()["results"]
+
+    assert not any(result["cached"] for result in first)
+    assert all(result["cached"] for result in second)
+    assert [result["response"] for result in second] == [result["response"] for result in first]
+
+def test_failed_query_does_not_discard_the_others(client, monkeypatch):
+    generate = model_manager.generate
+
+    def failing_generate(prompt, *args, **kwargs):
+        if "Boom" in prompt:
+            raise RuntimeError("backend exploded")
+        return generate(prompt, *args, **kwargs)
+
+    monkeypatch.setattr(model_manager, "generate", failing_generate)
+    queries = ["What is covered?", "Boom question?", "boom  QUESTION?"]
+    response = client.post("/batch-query", json={"policy_text": policy_text(), "queries": queries, "use_cache": False})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["error"] is None and results[0]["response"]
+    assert "backend exploded" in results[1]["error"]
+    assert results[2]["error"] == results[1]["error"] and results[2]["duplicate_of"] == 1
+
+def test_stream_sends_every_index_once_then_done(client):
+    queries = [f"Question number {i // 2}?" for i in range(20)]
+    with client.stream("POST", "/batch-query/stream", json={"policy_text": policy_text(), "queries": queries}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+
+    answers, done = lines[:-1], lines[-1]
+    assert done["done"] is True and done["queries_processed"] == len(queries)
+    assert sorted(answer["index"] for answer in answers) == list(range(len(queries)))
+    by_index = {answer["index"]: answer for answer in answers}
+    for i in range(1, len(queries), 2):
+        # A repeat either waited on the first copy or found its answer cached
+        assert by_index[i]["response"] == by_index[i - 1]["response"]
+        assert by_index[i]["duplicate_of"] == i - 1 or by_index[i]["cached"]
@@ -0,0 +1,77 @@
+import time
+import hashlib
+
+from app.services.cache_store import MemoryCacheStore, ENTRY_OVERHEAD_BYTES
+from app.services.cache_service import ResponseCacheService, document_digest
+
+PARAMS = {'temperature': 0.7, 'max_tokens': 512, 'query_type': None}
+
+def cache(max_bytes: int = 10 ** 6, ttl_seconds: float = 3600, version: str = "model:prompt-v1"):
+    return ResponseCacheService(MemoryCacheStore(max_bytes, ttl_seconds), version=version)
+
+def test_documents_differing_only_at_the_end_do_not_share_answers():
+    responses = cache()
+    head = "Section 1. Hospitalisation is covered. " * 1000
+    responses.set(head + "The sum insured is 5 lakh.", "What is the sum insured?", PARAMS, "5 lakh")
+
+    assert responses.get(head + "The sum insured is 5 lakh.", "What is the sum insured?", PARAMS) == "5 lakh"
+    assert responses.get(head + "The sum insured is 10 lakh.", "What is the sum insured?", PARAMS) is None
+
+def test_params_and_version_are_part_of_the_key():
+    responses = cache()
+    responses.set("policy", "question", PARAMS, "answer")
+
+    assert responses.get("policy", "question", {**PARAMS, 'temperature': 0.2}) is None
+    assert responses.get("policy", "question", {**PARAMS, 'query_type': "financial"}) is None
+    assert responses.get("policy", "question", dict(reversed(list(PARAMS.items())))) == "answer"
+    other_model = ResponseCacheService(responses.store, version="other-model:prompt-v1")
+    assert other_model.get("policy", "question", PARAMS) is None
+
+def test_document_digest_covers_the_whole_text():
+    text = "x" * 200_000 + "tail"
+    assert document_digest(text) == hashlib.sha256(text.encode("utf-8")).hexdigest()
+    assert document_digest(text) != document_digest(text[:-1])
+
+def test_byte_cap_evicts_least_recently_used():
+    entry_bytes = 100 + ENTRY_OVERHEAD_BYTES
+    store = MemoryCacheStore(max_bytes=3 * entry_bytes, ttl_seconds=3600)
+    for key in "abc":
+        store.set(key, "v" * 100)
+    store.get("a")  # Now b is the least recently used
+    store.set("d", "v" * 100)
+
+    assert [key for key in "abcd" if store.get(key, count=False) is not None] == ["a", "c", "d"]
+    assert store.nbytes() == 3 * entry_bytes
+    assert store.get_stats()['evictions'] == 1
+
+def test_overwrite_and_oversized_values_keep_the_byte_count_right():
+    store = MemoryCacheStore(max_bytes=1000, ttl_seconds=3600)
+    store.set("a", "v" * 300)
+    store.set("a", "short")
+    store.set("huge", "v" * 1000)  # Larger than the whole cache: not stored
+
+    assert store.nbytes() == len("short") + ENTRY_OVERHEAD_BYTES
+    assert store.get("huge") is None and store.get_stats()['evictions'] == 0
+
+def test_entries_expire_after_the_ttl():
+    responses = cache(ttl_seconds=0.05)
+    responses.set("policy", "question", PARAMS, "answer")
+    assert responses.get("policy", "question", PARAMS) == "answer"
+
+    time.sleep(0.1)
+    assert responses.get("policy", "question", PARAMS) is None
+    assert responses.get_nbytes() == 0
+
+def test_stats_count_lookups_but_not_contains():
+    responses = cache()
+    responses.set("policy", "question", PARAMS, "answer")
+    responses.get("policy", "question", PARAMS)
+    responses.get("policy", "other question", PARAMS)
+    assert responses.contains("policy", "question", PARAMS)
+
+    stats = responses.get_stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 1)
+    assert stats['hit_rate_percent'] == 50.0
+
+    responses.clear()
+    assert responses.get_stats()['size'] == 0 and not responses.contains("policy", "question", PARAMS)
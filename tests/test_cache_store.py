@@ -0,0 +1,152 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from app.services.cache_store import MemoryCacheStore, SQLiteCacheStore, RedisCacheStore, ENTRY_OVERHEAD_BYTES
+from app.services.cache_service import ResponseCacheService
+
+ENTRY_BYTES = 100 + ENTRY_OVERHEAD_BYTES
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def make_store(request, tmp_path):
+    """Factory for stores of one backend; stores made by one factory share their data, like worker processes"""
+    if request.param == "memory":
+        shared = {}
+        return lambda max_bytes=10 ** 6, ttl=3600: shared.setdefault("store", MemoryCacheStore(max_bytes, ttl))
+    if request.param == "sqlite":
+        path = str(tmp_path / "cache.db")
+        return lambda max_bytes=10 ** 6, ttl=3600: SQLiteCacheStore(path, "test", max_bytes, ttl)
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    return lambda max_bytes=10 ** 6, ttl=3600: RedisCacheStore(
+        "", "test", max_bytes, ttl, client=fakeredis.FakeRedis(server=server, decode_responses=True))
+
+def test_set_get_and_stats(make_store):
+    store = make_store()
+    store.set("key", "value")
+    assert store.get("key") == "value"  # Visible at once, even while the write is queued
+    assert store.get("missing") is None
+    store.record(hit=True)
+    store.flush()
+
+    stats = store.get_stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 1, 1)
+    assert stats['bytes'] == store.nbytes() == len("value") + ENTRY_OVERHEAD_BYTES
+
+def test_byte_cap_evicts_least_recently_used(make_store):
+    store = make_store(max_bytes=3 * ENTRY_BYTES)
+    for key in "abc":
+        store.set(key, "v" * 100)
+        store.flush()
+        time.sleep(0.01)
+    store.get("a")
+    store.flush()  # Access times are written in batches
+    store.set("d", "v" * 100)
+    store.flush()
+
+    assert [key for key in "abcd" if store.get(key, count=False) is not None] == ["a", "c", "d"]
+    assert store.nbytes() == 3 * ENTRY_BYTES
+    assert store.get_stats()['evictions'] == 1
+
+def test_overwrite_keeps_the_byte_count_right(make_store):
+    store = make_store(max_bytes=1000)
+    store.set("a", "v" * 300)
+    store.set("a", "short")
+    store.set("huge", "v" * 1000)
+    store.flush()
+
+    assert store.get("a") == "short" and store.get("huge") is None
+    assert store.nbytes() == len("short") + ENTRY_OVERHEAD_BYTES
+
+def test_entries_expire(make_store):
+    store = make_store(ttl=0.05)
+    store.set("key", "value")
+    store.flush()
+    time.sleep(0.1)
+    assert store.get("key") is None
+
+def test_clear(make_store):
+    store = make_store()
+    store.set("key", "value")
+    store.get("key")
+    store.clear()
+
+    assert store.get("key", count=False) is None
+    assert store.get_stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'entries': 0, 'bytes': 0}
+
+def test_workers_share_entries_and_counters(make_store):
+    first, second = make_store(), make_store()
+    first.set("key", "from the first worker")
+    first.flush()
+
+    assert second.get("key") == "from the first worker"
+    second.flush()
+    assert first.get_stats()['hits'] == 1
+
+def test_lookups_do_not_wait_for_a_writer(make_store):
+    first, second = make_store(), make_store()
+    first.set("key", "value")
+    first.flush()
+    if isinstance(first, SQLiteCacheStore):
+        # Another process holding the write lock
+        second.conn.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        for _ in range(100):
+            assert first.get("key") == "value"
+        assert time.monotonic() - started < 1
+    finally:
+        if isinstance(first, SQLiteCacheStore):
+            second.conn.execute("ROLLBACK")
+
+def test_concurrent_updates_are_not_lost(make_store):
+    stores = [make_store() for _ in range(4)]
+
+    def add(store, n):
+        for i in range(n):
+            store.update("counter", lambda current: str(int(current or 0) + 1))
+
+    threads = [threading.Thread(target=add, args=(store, 25)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for store in stores:
+        store.flush()
+
+    assert stores[0].get("counter") == "100"
+    stores[0].update("counter", lambda current: None)  # None leaves it alone
+    stores[0].flush()
+    assert stores[0].get("counter") == "100"
+
+def test_slow_lookup_does_not_block_the_event_loop(tmp_path, monkeypatch):
+    store = SQLiteCacheStore(str(tmp_path / "cache.db"), "test", 10 ** 6, 3600)
+    read = store._read
+
+    def slow_read(key):
+        time.sleep(0.3)  # A busy disk or a slow Redis round trip
+        return read(key)
+
+    monkeypatch.setattr(store, "_read", slow_read)
+    responses = ResponseCacheService(store)
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.ensure_future(ticker())
+        answer = await responses.get_async("policy", "question", {})
+        contained = await responses.contains_async("policy", "question", {})
+        ticking.cancel()
+        return answer, contained, ticks
+
+    answer, contained, ticks = asyncio.run(main())
+    assert answer is None and not contained
+    assert ticks >= 20  # The loop kept running through both 0.3 s lookups
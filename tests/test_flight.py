@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from app.services.flight_service import SingleFlight, flight_key
+
+class FakeGeneration:
+    """Streaming generate() stand-in: the first token at once, the rest once released"""
+
+    def __init__(self):
+        self.started = 0
+        self.closed = 0
+        self.release = None
+
+    def start(self, tokens=("Sum ", "insured ", "is ", "5 lakh. ")):
+        self.started += 1
+        self.release = asyncio.Event()
+
+        async def chunks():
+            try:
+                for i, token in enumerate(tokens):
+                    if i:
+                        await self.release.wait()
+                    yield {'choices': [{'text': token}]}
+                yield {'choices': [{'text': ''}], 'usage': {'completion_tokens': len(tokens)}}
+            finally:
+                self.closed += 1
+
+        return chunks()
+
+async def collect(flight, deadline=None):
+    return [chunk async for chunk in flight.stream(deadline)]
+
+def test_flight_key_ignores_dict_order():
+    assert flight_key("policy", {'a': 1, 'b': 2}) == flight_key("policy", {'b': 2, 'a': 1})
+    assert flight_key("policy", {'a': 1}) != flight_key("other policy", {'a': 1})
+
+def test_identical_requests_share_one_generation():
+    async def main():
+        flights, generation, completed = SingleFlight(), FakeGeneration(), []
+        leader, joined = flights.join("key", generation.start, completed.append)
+        first = asyncio.ensure_future(collect(leader))
+        await asyncio.sleep(0.01)
+
+        # Joins late, after the first chunk went out: gets the replay and the rest
+        follower, coalesced = flights.join("key", generation.start)
+        assert len(follower.chunks) == 1
+        generation.release.set()
+        second = await collect(follower)
+        return flights, generation, completed, joined, coalesced, await first, second
+
+    flights, generation, completed, joined, coalesced, first, second = asyncio.run(main())
+    assert generation.started == 1 and (joined, coalesced) == (False, True)
+    assert first == second and "".join(c['choices'][0]['text'] for c in first) == "Sum insured is 5 lakh. "
+    assert completed == ["Sum insured is 5 lakh."]
+    assert flights.get_stats() == {'started': 1, 'coalesced': 1, 'in_flight': 0}
+
+def test_requests_without_a_key_never_share():
+    async def main():
+        flights, generation = SingleFlight(), FakeGeneration()
+        first, _ = flights.join(None, generation.start)
+        second, coalesced = flights.join(None, generation.start)
+        generation.release.set()
+        await asyncio.gather(first.result(), second.result())
+        return generation, coalesced
+
+    generation, coalesced = asyncio.run(main())
+    assert generation.started == 2 and not coalesced
+
+def test_generation_runs_while_any_subscriber_remains():
+    async def main():
+        flights, generation = SingleFlight(), FakeGeneration()
+        flight, _ = flights.join("key", generation.start)
+        leaving = asyncio.ensure_future(collect(flight))
+        staying = asyncio.ensure_future(flight.result())
+        await asyncio.sleep(0)
+        leaving.cancel()
+        await asyncio.gather(leaving, return_exceptions=True)
+        generation.release.set()
+        return flight, await staying
+
+    flight, result = asyncio.run(main())
+    assert not flight.abandoned
+    assert result['choices'][0]['text'] == "Sum insured is 5 lakh. "
+    assert result['usage'] == {'completion_tokens': 4}
+
+def test_last_subscriber_leaving_cancels_the_generation():
+    async def main():
+        flights, generation, completed = SingleFlight(), FakeGeneration(), []
+        flight, _ = flights.join("key", generation.start, completed.append)
+        subscriber = asyncio.ensure_future(collect(flight))
+        await asyncio.sleep(0)
+        subscriber.cancel()
+        await asyncio.gather(subscriber, flight.task, return_exceptions=True)
+
+        # Nobody is waiting on it any more: the next identical request starts afresh
+        _, coalesced = flights.join("key", generation.start)
+        return flight, generation, completed, coalesced
+
+    flight, generation, completed, coalesced = asyncio.run(main())
+    assert flight.abandoned and flight.task.cancelled()
+    assert generation.closed >= 1 and completed == []
+    assert not coalesced and generation.started == 2
+
+def test_errors_reach_every_subscriber():
+    async def failing():
+        yield {'choices': [{'text': "partial "}]}
+        raise RuntimeError("replica crashed")
+
+    async def main():
+        flights = SingleFlight()
+        flight, _ = flights.join("key", failing)
+        follower, _ = flights.join("key", failing)
+        return await asyncio.gather(flight.result(), follower.result(), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_subscriber_deadline():
+    async def main():
+        flights, generation = SingleFlight(), FakeGeneration()
+        flight, _ = flights.join("key", generation.start)
+        loop = asyncio.get_running_loop()
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.result(deadline=loop.time() + 0.05)
+
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+import json
+import time
+import uuid
+
+import pytest
+
+from app.core.config import settings
+from app.services.job_service import JobStore
+
+BATCH = {"policy_text": "Maternity is covered after a waiting period of 9 months. " * 10,
+         "queries": ["Is maternity covered?", "What is the waiting period?", "What is excluded?"]}
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"), lease_seconds=0.2)
+
+def wait_for_job(client, job_id: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} still {job['status']}")
+
+def test_claim_takes_the_oldest_queued_job_once(store):
+    first = store.create("batch", BATCH, "client", 3)
+    second = store.create("batch", BATCH, "client", 3)
+
+    assert store.claim("worker-a")['id'] == first
+    assert store.claim("worker-b")['id'] == second
+    assert store.claim("worker-c") is None
+    assert store.get(first)['status'] == 'running' and store.get(first)['owner'] == 'worker-a'
+
+def test_expired_lease_is_taken_over(store):
+    job_id = store.create("batch", BATCH, "client", 3)
+    started_at = store.claim("worker-a")['started_at']
+    assert store.claim("worker-b") is None
+
+    time.sleep(0.3)
+    job = store.claim("worker-b")
+    assert job['id'] == job_id and job['owner'] == 'worker-b'
+    assert job['started_at'] == started_at
+
+def test_only_the_owner_renews_a_lease(store):
+    job_id = store.create("batch", BATCH, "client", 3)
+    store.claim("worker-a")
+
+    time.sleep(0.15)
+    store.heartbeat(job_id, "worker-a")
+    store.heartbeat(job_id, "worker-b")  # Not its job: ignored
+    time.sleep(0.1)
+    assert store.claim("worker-b") is None
+
+    time.sleep(0.15)
+    assert store.claim("worker-b")['id'] == job_id
+
+def test_release_requeues_only_this_owners_jobs(store):
+    mine = store.create("batch", BATCH, "client", 3)
+    theirs = store.create("batch", BATCH, "client", 3)
+    store.claim("worker-a")
+    store.claim("worker-b")
+
+    store.release("worker-a")
+    assert store.get(mine)['status'] == 'queued' and store.get(mine)['owner'] is None
+    assert store.get(theirs)['status'] == 'running'
+    assert store.claim("worker-c")['id'] == mine
+
+def test_results_are_recorded_once_and_paged_by_index(store):
+    job_id = store.create("batch", BATCH, "client", 3)
+    for idx in (2, 0, 1):
+        store.add_result(job_id, idx, {'response': f"answer {idx}"})
+    store.add_result(job_id, 1, {'response': "a retry's answer"})
+
+    assert store.get(job_id)['completed'] == 3
+    assert store.done_indices(job_id) == {0, 1, 2}
+    assert [result['response'] for result in store.results(job_id, 1, 10)] == ["answer 1", "answer 2"]
+
+    store.finish(job_id, error="boom")
+    assert store.get(job_id)['status'] == 'failed'
+    assert store.get_stats() == {'failed': 1}
+
+def test_job_of_a_dead_worker_resumes_where_it_stopped(client):
+    # As left by a process that died after answering the first query
+    dead = JobStore(settings.JOBS_DB_PATH, lease_seconds=settings.JOB_LEASE_SECONDS)
+    job_id = str(uuid.uuid4())
+    with dead.lock:
+        dead.conn.execute(
+            "INSERT INTO jobs (id, kind, status, request, client, total, owner, heartbeat_at, created_at, started_at) "
+            "VALUES (?, 'batch', 'running', ?, 'test', 3, 'dead-worker', 0, ?, ?)",
+            (job_id, json.dumps(BATCH), time.time(), time.time())
+        )
+    dead.add_result(job_id, 0, {'query': BATCH["queries"][0], 'response': "answered before the crash"})
+
+    job = wait_for_job(client, job_id)
+    assert job["status"] == "completed" and job["completed"] == 3
+
+    results = client.get(f"/jobs/{job_id}/results").json()["results"]
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert results[0]["response"] == "answered before the crash"
+    assert all(result["response"] for result in results[1:])
+
+def test_summarize_job_returns_its_summary(client):
+    response = client.post("/jobs", json={"kind": "summarize", "summarize": {"policy_text": BATCH["policy_text"]}})
+    assert response.status_code == 202
+
+    job = wait_for_job(client, response.json()["job_id"])
+    assert job["status"] == "completed"
+    summary = client.get(f"/jobs/{job['job_id']}/results").json()["summary"]
+    assert summary["summary"]
+
+def test_unknown_job_is_404(client):
+    assert client.get("/jobs/no-such-job").status_code == 404
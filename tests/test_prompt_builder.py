@@ -0,0 +1,41 @@
+import pytest
+
+from app.services.prompt_builder import PromptBuilder
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+def builder(n_ctx: int) -> PromptBuilder:
+    return PromptBuilder(count_words, n_ctx)
+
+def policy_in(prefix: str) -> str:
+    return prefix.split("\n", 1)[1].strip()
+
+SECTION = " ".join(f"clause{i}" for i in range(60))
+POLICY = f"{SECTION}\n\nRoom rent is capped at one percent of the sum insured."
+
+def test_whole_policy_when_it_fits():
+    prompt = builder(4096).build(POLICY, "What is the room rent cap?", [], "Answer briefly.", 256)
+
+    assert prompt.prefix == PromptBuilder.format_policy(POLICY)
+    assert prompt.token_counts['policy_sections_used'] == 1
+
+def test_most_relevant_sections_when_the_policy_does_not_fit():
+    prompt = builder(60).build(POLICY, "What is the room rent cap?", [], "Answer briefly.", 10)
+
+    assert policy_in(prompt.prefix) == "Room rent is capped at one percent of the sum insured."
+    assert prompt.token_counts['policy_sections_used'] == 1
+    assert prompt.token_counts['policy_sections_total'] == 2
+
+def test_top_section_is_cut_to_the_budget_when_none_fits():
+    prompt = builder(60).build(SECTION, "Is clause7 covered?", [], "Answer briefly.", 10)
+
+    # 60 - 12 (question and instructions) - 1 (BOS) - 10 (answer) - 4 (policy header)
+    assert policy_in(prompt.prefix) == " ".join(f"clause{i}" for i in range(33))
+    assert prompt.token_counts['policy_sections_used'] == 1
+    assert prompt.token_counts['total'] + prompt.max_tokens <= 60
+
+def test_no_room_for_any_policy_is_an_error():
+    question = " ".join(["word"] * 40)
+    with pytest.raises(ValueError):
+        builder(60).build(POLICY, question, [], "Answer briefly.", 10)
@@ -0,0 +1,114 @@
+import time
+import queue
+
+import pytest
+
+from app.services.scheduler import InferenceScheduler, Priority, parse_weights
+
+class Job:
+    def __init__(self, name: str, priority: Priority = Priority.INTERACTIVE, client: str = "",
+                 deadline: float = None):
+        self.name = name
+        self.priority = priority
+        self.client = client
+        self.deadline = deadline
+
+def drain(scheduler: InferenceScheduler):
+    names = []
+    while scheduler.qsize():
+        names.append(scheduler.get().name)
+    return names
+
+def test_classes_are_strictly_ordered():
+    scheduler = InferenceScheduler()
+    scheduler.put(Job("background", Priority.BACKGROUND))
+    scheduler.put(Job("batch", Priority.BATCH))
+    scheduler.put(Job("chat", Priority.INTERACTIVE))
+
+    assert drain(scheduler) == ["chat", "batch", "background"]
+
+def test_earliest_deadline_first_within_a_client():
+    scheduler = InferenceScheduler(urgent_seconds=0)
+    now = time.monotonic()
+    scheduler.put(Job("none"))
+    scheduler.put(Job("late", deadline=now + 60))
+    scheduler.put(Job("soon", deadline=now + 30))
+
+    assert drain(scheduler) == ["soon", "late", "none"]
+
+def test_clients_take_turns():
+    scheduler = InferenceScheduler()
+    for i in range(6):
+        scheduler.put(Job(f"a{i}", Priority.BATCH, client="a"))
+    scheduler.put(Job("b0", Priority.BATCH, client="b"))
+    scheduler.put(Job("b1", Priority.BATCH, client="b"))
+
+    # b arrived last but is not stuck behind all of a's batch
+    assert drain(scheduler)[:4] == ["a0", "b0", "a1", "b1"]
+
+def test_weights_share_turns():
+    scheduler = InferenceScheduler(weights=parse_weights("heavy:2, light:1"))
+    for i in range(4):
+        scheduler.put(Job(f"h{i}", client="heavy"))
+        scheduler.put(Job(f"l{i}", client="light"))
+
+    order = drain(scheduler)[:6]
+    assert sum(name.startswith("h") for name in order) == 4
+
+def test_returning_client_gets_no_credit_for_idle_time():
+    scheduler = InferenceScheduler()
+    for i in range(3):
+        scheduler.put(Job(f"a{i}", client="a"))
+    drain(scheduler)
+    for i in range(3):
+        scheduler.put(Job(f"a{i + 3}", client="a"))
+    scheduler.put(Job("b0", client="b"))
+
+    assert drain(scheduler)[:2] in (["a3", "b0"], ["b0", "a3"])
+
+def test_urgent_deadline_jumps_the_turns():
+    scheduler = InferenceScheduler(urgent_seconds=5)
+    scheduler.put(Job("a0", client="a"))
+    scheduler.put(Job("a1", client="a"))
+    scheduler.get()  # a is now ahead of b on virtual time
+    scheduler.put(Job("b0", client="b"))
+    scheduler.put(Job("a-urgent", client="a", deadline=time.monotonic() + 1))
+
+    assert scheduler.get().name == "a-urgent"
+
+def test_parse_weights():
+    assert parse_weights("key-1:2,10.0.0.1:0.5, ,bad") == {"key-1": 2.0, "10.0.0.1": 0.5}
+
+def test_stop_signal_and_non_blocking_get():
+    scheduler = InferenceScheduler()
+    with pytest.raises(queue.Empty):
+        scheduler.get(block=False)
+
+    scheduler.put(Job("chat"))
+    scheduler.put(None)
+    assert scheduler.get() is None  # Stop signals come before queued work
+    job = scheduler.get(block=False)
+    assert job.name == "chat" and job.queue_wait >= 0
+
+def test_stats_count_waits_per_class():
+    scheduler = InferenceScheduler()
+    scheduler.put(Job("batch", Priority.BATCH, client="a"))
+    scheduler.put(Job("batch", Priority.BATCH, client="b"))
+    assert scheduler.get_stats()['classes']['batch']['clients_waiting'] == 2
+
+    drain(scheduler)
+    stats = scheduler.get_stats()
+    assert stats['queued'] == 0
+    assert stats['classes']['batch']['started'] == 2
+    assert stats['classes']['interactive']['started'] == 0
+
+def test_busy_replica_does_not_take_background_work():
+    scheduler = InferenceScheduler()
+    scheduler.put(Job("precompute", Priority.BACKGROUND))
+    with pytest.raises(queue.Empty):
+        scheduler.get(block=False)
+
+    scheduler.put(Job("batch", Priority.BATCH))
+    assert scheduler.get(block=False).name == "batch"
+    # An idle replica still picks it up
+    assert scheduler.get().name == "precompute"
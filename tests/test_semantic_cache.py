@@ -0,0 +1,81 @@
+import json
+import threading
+
+import pytest
+
+from app.services.cache_store import MemoryCacheStore, SQLiteCacheStore
+from app.services.cache_service import (
+    ResponseCacheService, SemanticCacheTier, normalize_question, question_similarity
+)
+
+PARAMS = {'temperature': 0.7, 'max_tokens': 512, 'query_type': None}
+POLICY = "The sum insured is 5 lakh. Maternity is covered after 9 months. Dental is excluded."
+
+@pytest.fixture
+def responses():
+    answers = MemoryCacheStore(10 ** 6, 3600)
+    tier = SemanticCacheTier(answers, MemoryCacheStore(10 ** 6, 3600), threshold=0.9)
+    cache = ResponseCacheService(answers, version="model:prompt-v1", semantic=tier)
+    cache.set(POLICY, "What is the sum insured?", PARAMS, "5 lakh")
+    cache.set(POLICY, "Is maternity covered?", PARAMS, "Yes, after 9 months")
+    return cache
+
+def test_normalize_drops_filler_and_expands_contractions():
+    assert normalize_question("What's the Sum Insured under my policy?") == "sum insured"
+    assert normalize_question("Isn't dental covered?") == "not dental covered"
+
+def test_paraphrase_gets_the_answer(responses):
+    assert responses.get(POLICY, "what is the sum insured", PARAMS) == "5 lakh"
+    assert responses.get(POLICY, "Tell me the sum insured of this policy", PARAMS) == "5 lakh"
+    assert responses.get(POLICY, "Is maternity covered??", PARAMS) == "Yes, after 9 months"
+    assert responses.semantic.get_stats()['hits'] == 3
+
+@pytest.mark.parametrize("question", [
+    "Is maternity not covered?",         # Negation
+    "Is maternity covered except twins?",
+    "What is the sum insured for 2 years?",  # Number
+    "What is the premium?",              # Different question
+])
+def test_guards_and_threshold_keep_different_questions_apart(responses, question):
+    assert responses.get(POLICY, question, PARAMS) is None
+
+def test_number_and_negation_guards():
+    assert question_similarity("sum insured 5 lakh", "sum insured 10 lakh") == 0.0
+    assert question_similarity("maternity covered", "not maternity covered") == 0.0
+    assert question_similarity("sum insured 5 lakh", "sum insured 5 lakh") == pytest.approx(1.0)
+
+def test_scope_includes_document_and_params(responses):
+    assert responses.get(POLICY + " Amended.", "what is the sum insured", PARAMS) is None
+    assert responses.get(POLICY, "what is the sum insured", {**PARAMS, 'query_type': "financial"}) is None
+
+def test_questions_per_scope_are_deduplicated_and_capped():
+    index = MemoryCacheStore(10 ** 6, 3600)
+    tier = SemanticCacheTier(MemoryCacheStore(10 ** 6, 3600), index, threshold=0.9)
+    tier.add("scope", "What is the sum insured?", "old-key")
+    tier.add("scope", "What's the sum insured", "new-key")
+    assert json.loads(index.get("scope")) == [["sum insured", "new-key"]]
+
+    for i in range(SemanticCacheTier.MAX_QUESTIONS + 5):
+        tier.add("scope", f"question {i}", f"key-{i}")
+    questions = json.loads(index.get("scope"))
+    assert len(questions) == SemanticCacheTier.MAX_QUESTIONS
+    assert questions[-1] == [f"question {SemanticCacheTier.MAX_QUESTIONS + 4}", f"key-{SemanticCacheTier.MAX_QUESTIONS + 4}"]
+
+def test_concurrent_adds_from_several_workers_are_all_kept(tmp_path):
+    path = str(tmp_path / "cache.db")
+    indexes = [SQLiteCacheStore(path, "semantic", 10 ** 6, 3600) for _ in range(4)]
+    tiers = [SemanticCacheTier(MemoryCacheStore(10 ** 6, 3600), index, threshold=0.9) for index in indexes]
+
+    def add(worker):
+        for i in range(10):
+            tiers[worker].add("scope", f"question {worker} {i} about cover", f"key-{worker}-{i}")
+
+    threads = [threading.Thread(target=add, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for index in indexes:
+        index.flush()
+
+    assert len(json.loads(indexes[0].get("scope"))) == 40